@@ -6,6 +6,7 @@ export TKP_TESTPATH=${THIS_SCRIPT_DIR}/data
 export TKP_DBNAME=testdb
 export TKP_MAXTESTDURATION=5
 #export TKP_TESTDBMANAGEMENT=1
+#export TKP_BENCHMARK=1
 
 #echo "****************************"
 #echo "MONETDB:"
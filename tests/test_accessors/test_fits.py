@@ -3,8 +3,13 @@ Tests for simulated LOFAR datasets.
 """
 
 import os
+import shutil
+import tempfile
 import unittest
 
+import numpy
+import astropy.io.fits as pyfits
+
 from tkp.testutil.data import DATAPATH
 from tkp import accessors
 from tkp.accessors.fitsimage import FitsImage
@@ -100,6 +105,57 @@ class TestFitsImage(unittest.TestCase):
 
 
 
+class TestMemmap(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "image.fits")
+        random = numpy.random.RandomState(0)
+        data = random.normal(size=(1, 1, 300, 200)).astype(numpy.float32)
+        y, x = numpy.mgrid[:300, :200]
+        data += 40 * numpy.exp(-((x - 80.3)**2 + (y - 150.6)**2) / 8.)
+        header = pyfits.Header()
+        for key, value in [
+            ('CRVAL1', 350.85), ('CRVAL2', 58.815), ('CRPIX1', 100.),
+            ('CRPIX2', 150.), ('CDELT1', -0.01), ('CDELT2', 0.01),
+            ('CTYPE1', 'RA---SIN'), ('CTYPE2', 'DEC--SIN'),
+            ('CUNIT1', 'deg'), ('CUNIT2', 'deg'), ('CTYPE3', 'FREQ'),
+            ('CRVAL3', 6e7), ('CDELT3', 2e5), ('TELESCOP', 'TEST'),
+            ('BMAJ', 0.03), ('BMIN', 0.03), ('BPA', 0.),
+            ('DATE-OBS', '2012-01-01T00:00:00'),
+        ]:
+            header[key] = value
+        pyfits.writeto(self.filename, data, header)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testMemmap(self):
+        image = FitsImage(self.filename)
+        mapped = FitsImage(self.filename, memmap=True)
+        self.assertEqual(image.data.dtype, numpy.float64)
+        self.assertEqual(mapped.data.dtype.kind, 'f')
+        self.assertEqual(mapped.data.dtype.itemsize, 4)
+        self.assertEqual(mapped.data.shape, (200, 300))
+        self.assertTrue((mapped.data == image.data).all())
+        self.assertEqual(mapped.beam, image.beam)
+
+        # The source finder gives the same result on the single precision
+        # data, which is only promoted to double precision for fitting.
+        sfimage = accessors.sourcefinder_image_from_accessor(image)
+        mapped_sfimage = accessors.sourcefinder_image_from_accessor(mapped)
+        self.assertEqual(mapped_sfimage.rmsmap.dtype, numpy.float32)
+        self.assertTrue(numpy.allclose(sfimage.rmsmap, mapped_sfimage.rmsmap,
+                                       rtol=1e-5))
+        self.assertTrue(numpy.allclose(sfimage.backmap, mapped_sfimage.backmap,
+                                       atol=1e-5))
+        result = sfimage.fit_to_point(80, 150, 10, None, None)
+        mapped_result = mapped_sfimage.fit_to_point(80, 150, 10, None, None)
+        for attr in ('x', 'y', 'peak', 'flux'):
+            self.assertAlmostEqual(getattr(result, attr).value,
+                                   getattr(mapped_result, attr).value,
+                                   places=4)
+
+
 class FrequencyInformation(unittest.TestCase):
     @requires_data(os.path.join(DATAPATH, 'accessors/missing_metadata.fits'))
     def testFreqinfo(self):
@@ -21,10 +21,12 @@ class AttributeDict(dict):
 
 options = AttributeDict({
     'grid': 100,
+    'grid_cache': None,
     'margin': 0,
     'radius': 0,
     'deblend': False,
     'deblend_thresholds': 32,
+    'fit_workers': 1,
     'residuals': True,
     'islands': True,
     'fdr': False,
@@ -124,6 +126,7 @@ class TestPyse(unittest.TestCase):
         self.assertEqual(config['back_size_y'], options.grid)
         self.assertEqual(config['margin'], options.margin)
         self.assertEqual(config['radius'], options.radius)
+        self.assertEqual(config['grid_cache'], options.grid_cache)
 
     def test_sourcefinder_gets_beam(self):
         old_get_beam = tkp.bin.pyse.get_beam
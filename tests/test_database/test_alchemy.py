@@ -65,9 +65,25 @@ class TestApi(unittest.TestCase):
         shouldbe = [1.0, 1.0, 1.0, 1.0, 1, 0.0, 0.0, None, None, 0.01, 0.01]
         self.assertEqual(r, shouldbe)
 
+    def test_summarised(self):
+        q = tkp.db.alchemy._summarised(self.session, self.dataset1)
+        rows = sorted(self.session.query(q).all())
+        q = tkp.db.alchemy._combined(self.session, self.dataset1)
+        expected_rows = sorted(self.session.query(q).all())
+        self.assertEqual(len(rows), len(expected_rows))
+        for row, expected_row in zip(rows, expected_rows):
+            for item, expected in zip(row, expected_row):
+                if isinstance(expected, float):
+                    self.assertAlmostEqual(item, expected)
+                else:
+                    self.assertEqual(item, expected)
+
     def test_transient(self):
         r = tkp.db.alchemy.transients(self.session, self.dataset1).all()
         self.assertEqual(len(r), 2)
+        r = tkp.db.alchemy.transients(self.session, self.dataset1,
+                                      exact=True).all()
+        self.assertEqual(len(r), 2)
 
     def test_transient_region(self):
         """
@@ -0,0 +1,126 @@
+import math
+import unittest
+
+import numpy
+
+from tkp.db import association_index
+
+
+def unit_vectors(ra, decl):
+    ra, decl = numpy.radians(ra), numpy.radians(decl)
+    return (numpy.cos(decl) * numpy.cos(ra), numpy.cos(decl) * numpy.sin(ra),
+            numpy.sin(decl))
+
+
+def extracted(ra, decl, uncertainty=1. / 3600):
+    ra, decl = numpy.array(ra, dtype=float), numpy.array(decl, dtype=float)
+    x, y, z = unit_vectors(ra, decl)
+    n = len(ra)
+    return {
+        'id': numpy.arange(n) + 100., 'ra': ra, 'decl': decl,
+        'ra_err': numpy.ones(n), 'decl_err': numpy.ones(n),
+        'uncertainty_ew': numpy.ones(n) * uncertainty,
+        'uncertainty_ns': numpy.ones(n) * uncertainty,
+        'x': x, 'y': y, 'z': z,
+        'f_peak': numpy.ones(n) * 2, 'f_peak_err': numpy.ones(n) * 0.5,
+        'f_int': numpy.ones(n) * 3, 'f_int_err': numpy.ones(n) * 0.5,
+    }
+
+
+def running(ra, decl, uncertainty=1. / 3600):
+    """A running catalogue of sources seen once, with the given positions."""
+    ra, decl = numpy.array(ra, dtype=float), numpy.array(decl, dtype=float)
+    x, y, z = unit_vectors(ra, decl)
+    n = len(ra)
+    weight = numpy.ones(n) / uncertainty ** 2
+    return {
+        'id': numpy.arange(n) + 1., 'datapoints': numpy.ones(n),
+        'wm_ra': ra, 'wm_decl': decl,
+        'wm_uncertainty_ew': numpy.ones(n) * uncertainty,
+        'wm_uncertainty_ns': numpy.ones(n) * uncertainty,
+        'avg_ra_err': numpy.ones(n), 'avg_decl_err': numpy.ones(n),
+        'avg_wra': ra * weight, 'avg_wdecl': decl * weight,
+        'avg_weight_ra': weight, 'avg_weight_decl': weight,
+        'x': x, 'y': y, 'z': z,
+    }
+
+
+class TestCandidatePairs(unittest.TestCase):
+    def test_de_ruiter(self):
+        arcsec = 1. / 3600
+        runcat = running([10., 10., 20.], [30., 30. + 12 * arcsec, 30.])
+        xtrsrc = extracted([10., 15.], [30. + 2 * arcsec, 30.])
+        xi, ri, r = association_index.candidate_pairs(
+            xtrsrc, runcat, radius=0.1, deRuiter_r=5.68, meridian_wrap=False)
+        # Only the first runcat source lies within 5.68 De Ruiter radii.
+        self.assertEqual(list(xi), [0])
+        self.assertEqual(list(ri), [0])
+        self.assertAlmostEqual(r[0], 2 / math.sqrt(2), places=6)
+
+        xi, ri, r = association_index.candidate_pairs(
+            xtrsrc, runcat, radius=0.1, deRuiter_r=100, meridian_wrap=False)
+        self.assertEqual(sorted(zip(xi, ri)), [(0, 0), (0, 1)])
+
+    def test_meridian(self):
+        arcsec = 1. / 3600
+        runcat = running([359.9999], [0.])
+        xtrsrc = extracted([0.0001 - arcsec], [0.])
+        xi, ri, r = association_index.candidate_pairs(
+            xtrsrc, runcat, radius=0.1, deRuiter_r=5.68, meridian_wrap=True)
+        self.assertEqual(list(ri), [0])
+        expected = abs(0.0002 - arcsec) / (math.sqrt(2) * arcsec)
+        self.assertAlmostEqual(r[0], expected, places=4)
+
+    def test_empty(self):
+        xi, ri, r = association_index.candidate_pairs(
+            extracted([], []), running([10.], [30.]), 0.1, 5.68, False)
+        self.assertEqual((len(xi), len(ri), len(r)), (0, 0, 0))
+
+
+class TestZones(unittest.TestCase):
+    def test_zones(self):
+        decl = numpy.array([30.5, -0.05, 10.])
+        self.assertEqual(association_index.zones(decl, 0.1), (-1, 30))
+        self.assertEqual(association_index.zones(decl[1:], 0.01), (-1, 10))
+
+
+class TestManyToMany(unittest.TestCase):
+    def test_flags(self):
+        # Extracted sources 1 and 2 both match running catalogue sources 10
+        # and 11; extracted source 3 only matches 12, which is also matched
+        # by extracted source 2.
+        xtrsrc = [1, 1, 2, 2, 2, 3]
+        runcat = [10, 11, 10, 11, 12, 12]
+        r = numpy.array([0.5, 1.0, 2.0, 0.7, 3.0, 0.1])
+        inactive = association_index.many_to_many_inactive(xtrsrc, runcat, r)
+        self.assertEqual(list(inactive),
+                         [False, True, True, False, True, False])
+
+    def test_one_to_many(self):
+        inactive = association_index.many_to_many_inactive(
+            [1, 1, 2], [10, 11, 12], numpy.array([1., 0.5, 2.]))
+        self.assertFalse(inactive.any())
+
+
+class TestRows(unittest.TestCase):
+    def test_weighted_means(self):
+        arcsec = 1. / 3600
+        runcat = running([10.], [30.])
+        xtrsrc = extracted([10.], [30. + 2 * arcsec])
+        fluxes = dict((name, numpy.zeros(1))
+                      for name in association_index.FLUX_COLUMNS)
+        fluxes['f_datapoints'][0] = 1
+        fluxes['avg_f_peak'][0] = 4.
+        rows = association_index.temprunningcatalog_rows(
+            xtrsrc, runcat, fluxes, numpy.array([0]), numpy.array([0]),
+            numpy.array([1.]), meridian_wrap=False)
+        self.assertEqual(rows['datapoints'][0], 2)
+        self.assertAlmostEqual(rows['wm_ra'][0], 10.)
+        self.assertAlmostEqual(rows['wm_decl'][0], 30. + arcsec)
+        self.assertAlmostEqual(rows['wm_uncertainty_ns'][0],
+                               arcsec / math.sqrt(2))
+        self.assertAlmostEqual(rows['distance_arcsec'][0], 2., places=6)
+        self.assertEqual(rows['zone'][0], 30)
+        self.assertEqual(rows['f_datapoints'][0], 2)
+        self.assertAlmostEqual(rows['avg_f_peak'][0], 3.)
+        self.assertAlmostEqual(rows['avg_f_int'][0], 1.5)
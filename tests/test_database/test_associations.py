@@ -1467,3 +1467,106 @@ class TestMany2Many(unittest.TestCase):
 
         # We want to be sure that the error has been appropriately logged.
         self.assertIn(IntegrityError.__name__, iostream.getvalue())
+
+
+@requires_database()
+class TestTimestep(unittest.TestCase):
+    """
+    Associating all the images of a timestep at once gives the same running
+    catalog as associating them one at a time.
+    """
+    def tearDown(self):
+        tkp.db.rollback()
+
+    def associate(self, description, associate_images):
+        dataset = DataSet(data={'description': description})
+        srcs = [db_subs.example_extractedsource_tuple(ra=123.123 + 0.5 * i)
+                for i in range(2)]
+        for im in db_subs.generate_timespaced_dbimages_data(2):
+            images = []
+            for freq_eff in (140e6, 150e6, 160e6):
+                im = dict(im, freq_eff=freq_eff)
+                image = tkp.db.Image(dataset=dataset, data=im)
+                dbgen.insert_extracted_sources(image.id, srcs, 'blind')
+                images.append(image.id)
+            associate_images(images)
+
+        query = """\
+        SELECT r.datapoints
+              ,r.wm_ra
+              ,r.wm_decl
+              ,COUNT(*)
+          FROM runningcatalog r
+              ,runningcatalog_flux rf
+         WHERE r.dataset = %s
+           AND rf.runcat = r.id
+        GROUP BY r.id, r.datapoints, r.wm_ra, r.wm_decl
+        ORDER BY r.wm_ra
+        """
+        cursor = tkp.db.execute(query, (dataset.id,))
+        return cursor.fetchall()
+
+    def test_timestep(self):
+        def one_by_one(image_ids):
+            for image_id in image_ids:
+                associate_extracted_sources(image_id, deRuiter_r=3.717)
+
+        def timestep(image_ids):
+            assoc_subs.associate_timestep(image_ids, deRuiter_r=3.717)
+
+        expected = self.associate('assoc test set: one by one', one_by_one)
+        result = self.associate('assoc test set: timestep', timestep)
+        self.assertEqual(len(expected), 2)
+        self.assertEqual(len(result), len(expected))
+        for row, expected_row in zip(result, expected):
+            # Six detections of each source, in three bands.
+            self.assertEqual(row[0], 6)
+            self.assertEqual(row[3], 3)
+            self.assertEqual(row[0], expected_row[0])
+            self.assertAlmostEqual(row[1], expected_row[1])
+            self.assertAlmostEqual(row[2], expected_row[2])
+
+    def test_transaction(self):
+        def one_by_one(image_ids):
+            for image_id in image_ids:
+                associate_extracted_sources(image_id, deRuiter_r=3.717,
+                                            transaction=True)
+
+        def timestep(image_ids):
+            assoc_subs.associate_timestep(image_ids, deRuiter_r=3.717,
+                                          transaction=True)
+
+        expected = self.associate('assoc test set: no transaction',
+                                  lambda image_ids: assoc_subs.associate_timestep(
+                                      image_ids, deRuiter_r=3.717))
+        for associate_images in (one_by_one, timestep):
+            result = self.associate('assoc test set: transaction',
+                                    associate_images)
+            self.assertEqual(len(result), len(expected))
+            for row, expected_row in zip(result, expected):
+                self.assertEqual(row[0], expected_row[0])
+                self.assertEqual(row[3], expected_row[3])
+                self.assertAlmostEqual(row[1], expected_row[1])
+                self.assertAlmostEqual(row[2], expected_row[2])
+
+    def test_rollback(self):
+        # A failure while associating the last image of a timestep leaves
+        # none of its images associated.
+        def timestep(image_ids):
+            update = assoc_subs._update_lightcurve_summary
+
+            def failing_update(image_id):
+                if image_id == image_ids[-1]:
+                    raise RuntimeError("failing on purpose")
+                update(image_id)
+
+            assoc_subs._update_lightcurve_summary = failing_update
+            try:
+                with self.assertRaises(RuntimeError):
+                    assoc_subs.associate_timestep(image_ids, deRuiter_r=3.717,
+                                                  transaction=True)
+            finally:
+                assoc_subs._update_lightcurve_summary = update
+
+        self.assertEqual(self.associate('assoc test set: rollback', timestep),
+                         [])
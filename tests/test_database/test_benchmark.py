@@ -0,0 +1,219 @@
+"""
+Benchmarks of database queries whose cost should not grow with the size of
+the dataset.
+
+The timings (and, on PostgreSQL, the query plans) are logged at INFO level.
+"""
+import logging
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import numpy
+
+import tkp.db
+import tkp.db.associations as assoc_subs
+import tkp.db.general as dbgen
+from tkp.db.database import Database
+from tkp.db.nulldetections import NULLDETECTIONS_QUERY, get_nulldetections
+from tkp.testutil.alchemy import gen_band, gen_dataset, gen_skyregion, \
+    gen_image, gen_extractedsource, gen_runningcatalog, gen_assocskyrgn, \
+    gen_assocxtrsource
+from tkp.testutil.db_subs import delete_dataset
+from tkp.testutil.decorators import requires_database, duration, \
+    requires_benchmarks
+
+
+logger = logging.getLogger(__name__)
+
+# Number of sources in each image of the synthetic datasets.
+SOURCES = 10
+
+# Number of times each query is timed; the fastest run is reported.
+REPEATS = 5
+
+
+def best_time(func, *args):
+    times = []
+    for _ in range(REPEATS):
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def log_plan(query, params):
+    if Database().engine != 'postgresql':
+        return
+    cursor = tkp.db.execute("EXPLAIN ANALYZE " + query, params)
+    logger.info("query plan:\n" + "\n".join(row[0] for row in cursor))
+
+
+def last_query(func, *args):
+    """
+    Call func, and return the last query it ran with tkp.db.execute and its
+    parameters.
+    """
+    queries = []
+    execute = tkp.db.execute
+
+    def recording_execute(query, parameters={}, commit=False):
+        queries.append((query, parameters))
+        return execute(query, parameters, commit)
+
+    tkp.db.execute = recording_execute
+    try:
+        func(*args)
+    finally:
+        tkp.db.execute = execute
+    return queries[-1]
+
+
+def gen_timeseries(description, n_images):
+    """
+    A dataset of n_images images of a single sky region and band, with
+    SOURCES steady sources. The last image misses one of them.
+
+    returns: the database objects and the last image
+    """
+    dataset = gen_dataset(description)
+    band = gen_band()
+    skyregion = gen_skyregion(dataset)
+    start = datetime.fromtimestamp(0)
+    images = [gen_image(band, dataset, skyregion,
+                        start + timedelta(seconds=10 * i))
+              for i in range(n_images)]
+    objects = [dataset, band, skyregion] + images
+    for n in range(SOURCES):
+        detected = images if n else images[:-1]
+        xtrsrcs = [gen_extractedsource(image) for image in detected]
+        runcat = gen_runningcatalog(xtrsrcs[0], dataset)
+        objects += xtrsrcs + [runcat, gen_assocskyrgn(runcat, skyregion)]
+        objects += [gen_assocxtrsource(runcat, xtrsrc) for xtrsrc in xtrsrcs]
+    return objects, images[-1]
+
+
+@requires_database()
+@duration(60)
+class TestNulldetectionsScaling(unittest.TestCase):
+    def setUp(self):
+        Database().connection
+        self.session = Database().Session()
+        self.datasets = []
+
+    def tearDown(self):
+        self.session.close()
+        for ids in self.datasets:
+            delete_dataset(*ids)
+
+    def test_nulldetections(self):
+        # The query only looks at the sources of the sky region and the
+        # extracted sources of the image itself, so the timings shouldn't
+        # grow much with the length of the dataset. They depend on the
+        # machine, so they are logged rather than checked.
+        for n_images in (10, 100, 1000):
+            objects, image = gen_timeseries(
+                "null detection benchmark, %s images" % n_images, n_images)
+            self.session.add_all(objects)
+            self.session.commit()
+            self.datasets.append((objects[0].id, objects[1].id))
+
+            self.assertEqual(len(get_nulldetections(image.id)), 1)
+            timing = best_time(get_nulldetections, image.id)
+            logger.info("get_nulldetections, %s images: %.2f ms" %
+                        (n_images, timing * 1000))
+            log_plan(NULLDETECTIONS_QUERY,
+                     {'image_id': image.id, 'expiration': 10})
+
+
+def gen_sources(n, seed=1):
+    """
+    n sources, spread uniformly over the part of the sky with
+    90 < RA < 270 and -45 < Dec < 45, as sourcefinder results (see
+    tkp.db.general.insert_extracted_sources).
+    """
+    random = numpy.random.RandomState(seed)
+    ra = random.uniform(90, 270, n)
+    decl = numpy.degrees(numpy.arcsin(random.uniform(-0.7, 0.7, n)))
+    arcsec = 1. / 3600
+    # Small positional errors, so that every source of the image only
+    # matches its own counterpart in the catalog.
+    return [(r, d, .1 * arcsec, .1 * arcsec, 1., .1, 1., .1, 10., 1., 1., 0.,
+             .1, .1, .1, 1, 1., 1.)
+            for r, d in zip(ra.tolist(), decl.tolist())]
+
+
+@requires_database()
+class TestAssociationScaling(unittest.TestCase):
+    """
+    Times the query which matches the extracted sources of an image with the
+    running catalog (tkp.db.associations._insert_temprunningcatalog) for
+    catalogs of increasing size. The image holds IMAGE_SOURCES sources at
+    the positions of catalog sources. The larger catalogs take minutes to
+    load, so they are only benchmarked with TKP_BENCHMARK set.
+    """
+    IMAGE_SOURCES = 100
+    DERUITER_R = 5.68
+
+    def setUp(self):
+        Database().connection
+        self.session = Database().Session()
+        self.dataset = gen_dataset("association benchmark")
+        band = gen_band()
+        skyregion = gen_skyregion(self.dataset)
+        skyregion.centre_ra, skyregion.centre_decl = 180., 0.
+        self.images = [gen_image(band, self.dataset, skyregion,
+                                 datetime.fromtimestamp(10 * i))
+                       for i in range(2)]
+        for image in self.images:
+            image.rb_smaj = 0.05
+        self.session.add_all([self.dataset, band, skyregion] + self.images)
+        self.session.commit()
+        self.ids = self.dataset.id, band.id
+
+    def tearDown(self):
+        assoc_subs._empty_temprunningcatalog()
+        self.session.close()
+        delete_dataset(*self.ids)
+
+    def benchmark(self, catalog_sources):
+        catalog_image, image = self.images
+        sources = gen_sources(catalog_sources)
+        dbgen.insert_extracted_sources(catalog_image.id, sources, 'blind')
+        assoc_subs._empty_temprunningcatalog()
+        assoc_subs._insert_new_runcat(catalog_image.id)
+        dbgen.insert_extracted_sources(image.id,
+                                       sources[:self.IMAGE_SOURCES], 'blind')
+        if Database().engine == 'postgresql':
+            Database().vacuum('runningcatalog')
+            Database().vacuum('extractedsource')
+
+        mw = assoc_subs._check_meridian_wrap(image.id)
+        args = (image.id, self.DERUITER_R, 1, mw)
+
+        def associate():
+            assoc_subs._empty_temprunningcatalog()
+            assoc_subs._insert_temprunningcatalog(*args)
+
+        query, params = last_query(associate)
+        matched = tkp.db.execute("SELECT COUNT(*) FROM temprunningcatalog"
+                                 ).fetchone()[0]
+        self.assertEqual(matched, self.IMAGE_SOURCES)
+
+        timing = best_time(associate)
+        logger.info("_insert_temprunningcatalog, %s catalog sources: %.2f ms"
+                    % (catalog_sources, timing * 1000))
+        assoc_subs._empty_temprunningcatalog()
+        log_plan(query, params)
+
+    @duration(30)
+    def test_1e4(self):
+        self.benchmark(10**4)
+
+    @requires_benchmarks()
+    def test_1e5(self):
+        self.benchmark(10**5)
+
+    @requires_benchmarks()
+    def test_1e6(self):
+        self.benchmark(10**6)
@@ -0,0 +1,52 @@
+import unittest
+
+import tkp.db
+from tkp.db import candidates
+import tkp.db.alchemy
+import tkp.db.model
+from tkp.testutil import db_subs
+from tkp.testutil.decorators import requires_database
+
+
+@requires_database()
+class TestCandidates(unittest.TestCase):
+    def setUp(self):
+        self.database = tkp.db.Database()
+        self.dataset = tkp.db.DataSet(data={'description': "Candidates test"},
+                                      database=self.database)
+        image_rms = 1e-3
+        detection_thresh = 10
+        im_params = db_subs.generate_timespaced_dbimages_data(
+            4, rms_qc=image_rms, rms_min=image_rms, rms_max=image_rms,
+            detection_thresh=detection_thresh)
+        src_tuple = db_subs.example_extractedsource_tuple(
+            ra=im_params[0]['centre_ra'], dec=im_params[0]['centre_decl'])
+        transient_src = db_subs.MockSource(
+            template_extractedsource=src_tuple,
+            lightcurve={im_params[2]['taustart_ts']: 1.01 * image_rms * 13})
+
+        # Refresh the candidates after each image, as the pipeline does for
+        # each timestep.
+        for img_pars in im_params:
+            image, _, _ = db_subs.insert_image_and_simulated_sources(
+                self.dataset, img_pars, [transient_src], 3)
+            candidates.refresh([image.id])
+
+    def tearDown(self):
+        tkp.db.rollback()
+
+    def test_refresh(self):
+        self.assertTrue(candidates.check(self.dataset.id))
+        session = self.database.Session()
+        dataset = session.query(tkp.db.model.Dataset).get(self.dataset.id)
+        found = tkp.db.alchemy.transient_candidates(
+            session, dataset, new_src_only=True).all()
+        self.assertEqual(len(found), 1)
+        self.assertAlmostEqual(found[0].lightcurve_max, 0.01313)
+
+    def test_check(self):
+        tkp.db.execute("UPDATE transient_candidate SET v_int = v_int + 1 "
+                       "WHERE dataset = %s", (self.dataset.id,))
+        self.assertFalse(candidates.check(self.dataset.id))
+        candidates.rebuild(self.dataset.id)
+        self.assertTrue(candidates.check(self.dataset.id))
@@ -2,6 +2,8 @@ import unittest
 from exceptions import StandardError
 from tkp.testutil.decorators import requires_database
 import tkp.db
+import tkp.db.database
+from tkp.db.general import insert_dataset
 
 class TestDatabaseConnection(unittest.TestCase):
 
@@ -52,3 +54,39 @@ class TestDatabaseConnection(unittest.TestCase):
         for exception in bad_exceptions:
             with self.assertRaises(AttributeError):
                 getattr(self.database.exceptions, exception)
+
+
+@requires_database()
+class TestUnitOfWork(unittest.TestCase):
+    def setUp(self):
+        self.database = tkp.db.database.Database()
+
+    def count(self, description):
+        return tkp.db.execute(
+            "SELECT COUNT(*) FROM dataset WHERE description = %(d)s",
+            {'d': description}).fetchone()[0]
+
+    def test_rollback(self):
+        description = "test unit of work rollback"
+        with self.assertRaises(ZeroDivisionError):
+            with tkp.db.unit_of_work():
+                insert_dataset(description)
+                self.assertEqual(self.count(description), 1)
+                1 / 0
+        self.assertEqual(self.count(description), 0)
+
+    def test_commit(self):
+        description = "test unit of work commit"
+        with tkp.db.unit_of_work():
+            with tkp.db.unit_of_work():
+                insert_dataset(description)
+            insert_dataset(description)
+        self.assertEqual(self.count(description), 2)
+
+    def test_inherited_connection(self):
+        # A connection made by another process is set aside, not closed.
+        inherited = self.database.connection
+        self.database._pid = -1
+        self.assertIsNot(self.database.connection, inherited)
+        self.assertFalse(inherited.closed)
+        self.assertIs(tkp.db.database._inherited[-1][0], inherited)
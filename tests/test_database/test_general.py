@@ -4,6 +4,7 @@ import time
 from tkp.db.orm import DataSet
 from tkp.db.general import update_dataset_process_end_ts
 from tkp.db import execute as db_query
+from tkp.db.database import _CopyStream
 from tkp.testutil.decorators import requires_database
 
 @requires_database()
@@ -18,3 +19,17 @@ class TestProcessTime(unittest.TestCase):
             WHERE id = %(id)s
         """, {"id": dataset.id}).fetchone()
         self.assertLess(start_time, end_time)
+
+
+class TestCopyStream(unittest.TestCase):
+    rows = [(1, 2.5, None, 'a\tb'), (2, float('inf'), float('nan'), '')]
+    expected = "1\t2.5\t\\N\ta\\tb\n2\tInfinity\tNaN\t\n"
+
+    def test_read(self):
+        self.assertEqual(_CopyStream(self.rows).read(), self.expected)
+        stream = _CopyStream(self.rows)
+        chunks = iter(lambda: stream.read(3), "")
+        self.assertEqual("".join(chunks), self.expected)
+
+    def test_lines(self):
+        self.assertEqual("".join(_CopyStream(self.rows)), self.expected)
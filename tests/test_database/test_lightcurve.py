@@ -12,6 +12,10 @@ from tkp.db.orm import DataSet
 from tkp.db.orm import Image
 import tkp.db
 from tkp.db.generic import  get_db_rows_as_dicts, columns_from_table
+from tkp.db.associations import _update_lightcurve_summary
+from tkp.db.model import LightcurveSummary
+from tkp.testutil.alchemy import gen_band, gen_dataset, gen_skyregion, \
+    gen_image, gen_extractedsource, gen_runningcatalog, gen_assocxtrsource
 
 
 class TestLightCurve(unittest.TestCase):
@@ -125,3 +129,106 @@ class TestLightCurve(unittest.TestCase):
                                            py_indices[nstep][key],
                                            places=5)
 
+
+        # The lightcurve summaries follow the lightcurves.
+        query = """\
+        SELECT ls.datapoints
+              ,ls.last_f_int
+              ,ls.last_v_int
+              ,ls.max_f_int
+              ,ls.avg_f_int
+              ,ls.m2_f_int
+              ,ls.median_f_int
+          FROM runningcatalog r
+              ,lightcurve_summary ls
+         WHERE r.dataset = %(dataset)s
+           AND r.id = ls.runcat
+        ORDER BY r.wm_ra
+        """
+        self.database.cursor.execute(query, {'dataset': self.dataset.id})
+        summaries = get_db_rows_as_dicts(self.database.cursor)
+        self.assertEqual(len(summaries), len(lightcurves_sorted_by_ra))
+        for idx, summary in enumerate(summaries):
+            fluxes = [src.flux for src in lightcurves_sorted_by_ra[idx]]
+            mean = sum(fluxes) / len(fluxes)
+            py_indices = db_subs.lightcurve_metrics(lightcurves_sorted_by_ra[idx])
+            self.assertEqual(summary['datapoints'], len(fluxes))
+            self.assertAlmostEqual(summary['last_f_int'], fluxes[-1])
+            self.assertAlmostEqual(summary['last_v_int'],
+                                   py_indices[-1]['v_int'], places=5)
+            self.assertAlmostEqual(summary['max_f_int'], max(fluxes))
+            self.assertAlmostEqual(summary['avg_f_int'], mean)
+            self.assertAlmostEqual(summary['m2_f_int'],
+                                   sum((f - mean) ** 2 for f in fluxes))
+            self.assertTrue(min(fluxes) < summary['median_f_int'] < max(fluxes))
+
+
+@requires_database()
+class TestLightcurveSummary(unittest.TestCase):
+    def setUp(self):
+        self.database = tkp.db.Database()
+        self.database.connect()
+        self.session = self.database.Session()
+        self.bands = [gen_band(central=150**6), gen_band(central=160**6)]
+        self.dataset = gen_dataset('lightcurve summary test')
+        self.skyregion = gen_skyregion(self.dataset)
+        self.runcat = None
+        self.session.add_all(self.bands + [self.dataset, self.skyregion])
+        self.session.commit()
+        self.ids = [self.dataset.id] + [band.id for band in self.bands]
+
+    def tearDown(self):
+        self.session.close()
+        db_subs.delete_dataset(*self.ids)
+
+    def add_datapoint(self, band, seconds, f_int):
+        image = gen_image(band, self.dataset, self.skyregion,
+                          datetime.datetime(2010, 3, 3) +
+                          datetime.timedelta(seconds=seconds))
+        xtrsrc = gen_extractedsource(image)
+        xtrsrc.f_int = f_int
+        if self.runcat is None:
+            self.runcat = gen_runningcatalog(xtrsrc, self.dataset)
+        self.session.add_all([image, xtrsrc, self.runcat,
+                              gen_assocxtrsource(self.runcat, xtrsrc)])
+        self.session.commit()
+        return image, xtrsrc
+
+    def summaries(self):
+        query = self.session.query(LightcurveSummary).filter_by(
+            runcat_id=self.runcat.id)
+        return dict((summary.band_id, summary) for summary in query)
+
+    def test_history(self):
+        # A lightcurve without a summary, such as that of a source which
+        # replaces another in a one-to-many association, is summarised in
+        # every band of its history.
+        band1, band2 = self.bands
+        self.add_datapoint(band1, 0, 1.)
+        self.add_datapoint(band2, 10, 2.)
+        image, last = self.add_datapoint(band1, 20, 3.)
+        _update_lightcurve_summary(image.id)
+        summaries = self.summaries()
+        self.assertEqual(sorted(summaries), sorted([band1.id, band2.id]))
+        self.assertEqual(summaries[band1.id].datapoints, 2)
+        self.assertEqual(summaries[band1.id].last_xtrsrc_id, last.id)
+        self.assertAlmostEqual(summaries[band1.id].avg_f_int, 2.)
+        self.assertEqual(summaries[band2.id].datapoints, 1)
+        self.assertAlmostEqual(summaries[band2.id].last_f_int, 2.)
+
+    def test_once(self):
+        # A datapoint which is older than the last one is added only once,
+        # however often the summaries are updated.
+        band1 = self.bands[0]
+        self.add_datapoint(band1, 0, 1.)
+        image, last = self.add_datapoint(band1, 20, 3.)
+        _update_lightcurve_summary(image.id)
+        image, _ = self.add_datapoint(band1, 10, 5.)
+        for _ in range(2):
+            _update_lightcurve_summary(image.id)
+            self.session.expire_all()
+            summary = self.summaries()[band1.id]
+            self.assertEqual(summary.datapoints, 3)
+            self.assertEqual(summary.last_xtrsrc_id, last.id)
+            self.assertAlmostEqual(summary.max_f_int, 5.)
+            self.assertAlmostEqual(summary.avg_f_int, 3.)
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from multiprocessing import Process
+
+from tkp.distribute.cluster import Scheduler, tasks
+from tkp.distribute.cluster.worker import work
+
+AUTHKEY = "test"
+
+
+def pid(zipped):
+    return os.getpid()
+
+
+def add(zipped):
+    number, args = zipped
+    return number + args[0]
+
+
+def fail(zipped):
+    raise ValueError(zipped[0])
+
+
+def crash_once(zipped):
+    """Kill the worker, unless the file at the given path exists."""
+    path, args = zipped
+    if not os.path.exists(path):
+        open(path, 'w').close()
+        os._exit(1)
+    return "done"
+
+
+# The workers look the tasks up by name.
+for func in pid, add, fail, crash_once:
+    setattr(tasks, func.__name__, func)
+
+
+class TestCluster(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler(('localhost', 0), AUTHKEY)
+        self.nodes = []
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.scheduler.close()
+        for node in self.nodes:
+            node.join(5)
+            if node.is_alive():
+                node.terminate()
+        shutil.rmtree(self.directory)
+
+    def start_workers(self, *locals):
+        """Start a worker for each list of local paths given."""
+        for local in locals:
+            node = Process(target=work,
+                           args=(self.scheduler.address, AUTHKEY, local))
+            node.start()
+            self.nodes.append(node)
+        deadline = time.time() + 10
+        while len(self.scheduler.workers) < len(self.nodes):
+            self.assertTrue(time.time() < deadline)
+            time.sleep(0.01)
+
+    def test_map(self):
+        self.start_workers([], [])
+        self.assertEqual(self.scheduler.map(add, range(20), [1]),
+                         range(1, 21))
+        self.assertEqual(self.scheduler.map(add, [], [1]), [])
+        result = self.scheduler.map_async(add, range(3), [2])
+        self.assertEqual(result.get(), [2, 3, 4])
+        self.assertRaises(ValueError, self.scheduler.map, fail, [1], [])
+
+    def test_worker_lost(self):
+        self.start_workers([], [])
+        path = os.path.join(self.directory, "crashed")
+        self.assertEqual(self.scheduler.map(crash_once, [path], []),
+                         ["done"])
+        self.assertEqual(len(self.scheduler.workers), 1)
+
+    def test_locality(self):
+        self.start_workers(["/node/a/"], ["/node/b/"])
+        urls = ["/node/a/1.fits", "/node/b/1.fits",
+                "/node/a/2.fits", "/node/b/2.fits"]
+        pids = self.scheduler.map(pid, urls, [])
+        self.assertEqual(pids[0], pids[2])
+        self.assertEqual(pids[1], pids[3])
+        self.assertNotEqual(pids[0], pids[1])
+        # An image goes back to the worker which had it before.
+        self.assertEqual(self.scheduler.map(pid, [["/node/b/1.fits"]], []),
+                         [pids[1]])
@@ -0,0 +1,114 @@
+import errno
+import multiprocessing
+import os
+import time
+import unittest
+
+from tkp.distribute.multiproc import WorkerPool
+
+# Pool started by a task and kept, like the pool which fits islands.
+task_pool = None
+
+
+def pid(zipped):
+    return os.getpid()
+
+
+def add(zipped):
+    number, args = zipped
+    return number + args[0]
+
+
+def fail(zipped):
+    raise ValueError(zipped[0])
+
+
+def start_pool(zipped):
+    global task_pool
+    task_pool = multiprocessing.Pool(2)
+    task_pool.map(abs, range(4))
+    return [child.pid for child in task_pool._pool]
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        if e.errno == errno.ESRCH:
+            return False
+        raise
+    return True
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_map(self):
+        self.assertEqual(self.pool.map(add, range(20), [1]), range(1, 21))
+        self.assertEqual(self.pool.map(add, [], [1]), [])
+        self.assertEqual(self.pool.map(add, range(3), [2]), [2, 3, 4])
+
+    def test_map_async(self):
+        first = self.pool.map_async(add, range(5), [1])
+        second = self.pool.map_async(add, range(5), [2])
+        self.assertEqual(second.get(), range(2, 7))
+        self.assertEqual(first.get(), range(1, 6))
+
+    def test_imap(self):
+        numbers = iter(range(50))
+        self.assertEqual(list(self.pool.imap(add, numbers, [1], chunksize=3)),
+                         range(1, 51))
+        results = self.pool.imap(add, range(50), [1], chunksize=3,
+                                 ordered=False)
+        self.assertEqual(sorted(results), range(1, 51))
+
+    def test_imap_window(self):
+        # The items are only taken as there is room for them.
+        taken = []
+        def items():
+            for n in range(100):
+                taken.append(n)
+                yield n
+        results = self.pool.imap(add, items(), [0])
+        self.assertEqual(next(results), 0)
+        self.assertTrue(len(taken) < 10)
+        self.assertEqual(list(results), range(1, 100))
+        # Giving up on a generator doesn't upset the next call.
+        results = self.pool.imap(add, range(100), [0])
+        next(results)
+        del results
+        self.assertEqual(self.pool.map(add, range(3), [1]), [1, 2, 3])
+
+    def test_affinity(self):
+        pids = self.pool.map(pid, ["a.fits", "b.fits"], [])
+        self.assertEqual(len(set(pids)), 2)
+        # The images go back to the worker which had them before.
+        self.assertEqual(self.pool.map(pid, [["b.fits"], ["a.fits"]], []),
+                         pids[::-1])
+        # Also when the image comes with more, as for forced fitting.
+        self.assertEqual(self.pool.map(pid, [("a.fits", [], [])], []),
+                         pids[:1])
+
+    def test_exception(self):
+        self.assertRaises(ValueError, self.pool.map, fail, [1, 2], [])
+        self.assertRaises(ValueError, list, self.pool.imap(fail, [1], []))
+        self.assertEqual(self.pool.map(add, [1], [1]), [2])
+
+    def test_task_processes(self):
+        # The tasks can start processes of their own, which are stopped
+        # along with the workers.
+        children = sum(self.pool.map(start_pool, range(2), []), [])
+        self.assertEqual(len(children), 4)
+        self.assertTrue(all(alive(pid) for pid in children))
+        self.pool.terminate()
+        for worker in self.pool._workers:
+            worker.join(10)
+            self.assertFalse(worker.is_alive())
+        deadline = time.time() + 10
+        while any(alive(pid) for pid in children) and time.time() < deadline:
+            time.sleep(0.1)
+        self.assertFalse(any(alive(pid) for pid in children))
@@ -11,6 +11,20 @@ class TestRunner(unittest.TestCase):
             runner = tkp.distribute.Runner(method)
             runner.map("persistence_node_step", [])
 
+    def test_map_async(self):
+        for method in 'serial', 'multiproc':
+            runner = tkp.distribute.Runner(method)
+            result = runner.map_async("persistence_node_step", [])
+            self.assertEqual(result.get(), [])
+
+    def test_imap(self):
+        for method in 'serial', 'multiproc':
+            runner = tkp.distribute.Runner(method)
+            results = runner.imap("persistence_node_step", [], chunksize=2)
+            self.assertEqual(list(results), [])
+            results = runner.imap_unordered("persistence_node_step", [])
+            self.assertEqual(list(results), [])
+
     def test_set_cores(self):
         cores = 10
         tkp.distribute.Runner('serial', cores=cores)
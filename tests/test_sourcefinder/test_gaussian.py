@@ -7,6 +7,7 @@ import unittest
 
 from tkp.sourcefinder.gaussian import gaussian
 from tkp.sourcefinder.fitting import moments, fitgaussian, FIT_PARAMS
+from tkp.sourcefinder.fitting import _GaussianModel, fit_peaks
 from tkp.sourcefinder.extract import source_profile_and_errors
 
 
@@ -282,3 +283,75 @@ class NoisyGaussTest(unittest.TestCase):
         self.assertTrue( 0.9 < self.fit_w_errs.chisq / npix < 1.1)
 
 
+
+
+class JacobianTest(unittest.TestCase):
+    """The analytic derivatives used by fitgaussian()"""
+    def testDerivatives(self):
+        x, y = numpy.indices((15, 17))
+        x, y = x.ravel(), y.ravel()
+        params = numpy.array([3., 7.2, 8.1, 3.5, 2.1, 0.7])
+        derivatives = _GaussianModel(x, y, {}).derivatives(params)
+        for i, param in enumerate(FIT_PARAMS):
+            step = numpy.zeros(len(params))
+            step[i] = 1e-6
+            numerical = (
+                _GaussianModel(x, y, {}).evaluate(params + step) -
+                _GaussianModel(x, y, {}).evaluate(params - step)
+            ) / 2e-6
+            self.assertTrue(numpy.allclose(derivatives[i], numerical,
+                                           atol=1e-8), msg=param)
+
+    def testFixed(self):
+        Xin, Yin = numpy.indices((50, 50))
+        mygauss = numpy.ma.array(gaussian(10, 25.3, 24.6, 4, 3, 0.4)(Xin, Yin))
+        mygauss[mygauss < 0.5] = numpy.ma.masked
+        initial = {"peak": 8, "xbar": 25, "ybar": 25, "semimajor": 4.5,
+                   "semiminor": 2.5, "theta": 0.3}
+        fixed = {"xbar": 25.3, "ybar": 24.6, "theta": 0.4}
+        fit = fitgaussian(mygauss, initial, fixed=fixed)
+        for param, value in fixed.items():
+            self.assertEqual(fit[param], value)
+        self.assertAlmostEqual(fit["peak"], 10)
+        self.assertAlmostEqual(fit["semimajor"], 4)
+        self.assertAlmostEqual(fit["semiminor"], 3)
+
+
+class FitPeaksTest(unittest.TestCase):
+    """Fitting only the peak, with position and shape fixed"""
+    def setUp(self):
+        self.shape = (21, 21)
+        self.params = {"xbar": 10.5, "ybar": 9.8, "semimajor": 3.,
+                       "semiminor": 2., "theta": 0.6}
+        self.template = gaussian(1., self.params["xbar"], self.params["ybar"],
+                                 self.params["semimajor"],
+                                 self.params["semiminor"],
+                                 self.params["theta"])(*numpy.indices(self.shape))
+        random = numpy.random.RandomState(4)
+        self.stack = numpy.ma.array(
+            [peak * self.template + random.normal(size=self.shape)
+             for peak in (5., -2., 12.)])
+        self.stack[1, :, :8] = numpy.ma.masked
+
+    def testLeastSquares(self):
+        for pixels in self.stack:
+            unmasked = ~numpy.ma.getmaskarray(pixels)
+            expected = numpy.linalg.lstsq(
+                self.template[unmasked][:, numpy.newaxis],
+                pixels.data[unmasked], rcond=None)[0][0]
+            self.assertAlmostEqual(fit_peaks(pixels, self.params), expected)
+            fit = fitgaussian(pixels, {}, fixed=self.params)
+            self.assertAlmostEqual(fit["peak"], expected)
+            self.assertEqual(fit["xbar"], self.params["xbar"])
+
+    def testStack(self):
+        peaks = fit_peaks(self.stack, self.params)
+        self.assertEqual(peaks.shape, (3,))
+        for pixels, peak in zip(self.stack, peaks):
+            self.assertAlmostEqual(fit_peaks(pixels, self.params), peak)
+
+    def testAllMasked(self):
+        pixels = numpy.ma.array(self.stack[0], mask=True)
+        self.assertTrue(numpy.isnan(fit_peaks(pixels, self.params)))
+        self.assertRaises(ValueError, fitgaussian, pixels, {},
+                          fixed=self.params)
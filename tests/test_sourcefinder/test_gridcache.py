@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import unittest
+
+from tkp.sourcefinder import image as sfimage
+from tkp.sourcefinder.gridcache import GridCache
+
+BEAM = (1.5, 1.2, 0.3)
+
+
+class TestGridCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = GridCache(os.path.join(self.directory, "grids"))
+        random = np.random.RandomState(3)
+        self.data = random.normal(size=(128, 96))
+        self.mask = np.zeros(self.data.shape, dtype=bool)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def key(self, data=None, beam=BEAM, back_size=32):
+        if data is None:
+            data = self.data
+        return self.cache.key(data, self.mask, beam, 0, 0,
+                              back_size, back_size, max_iter=100)
+
+    def test_round_trip(self):
+        grids = {
+            'rms': np.ma.array([[1., 2.], [3., 4.]],
+                               mask=[[False, True], [False, False]]),
+            'bg': np.ma.array([[5., 6.], [7., 8.]],
+                              mask=[[False, False], [True, False]]),
+        }
+        key = self.key()
+        self.assertEqual(self.cache.load(key), None)
+        self.cache.store(key, grids)
+        loaded = self.cache.load(key)
+        for name in ('rms', 'bg'):
+            self.assertTrue(np.all(loaded[name].data == grids[name].data))
+            self.assertTrue(np.all(loaded[name].mask == grids[name].mask))
+
+    def test_key(self):
+        key = self.key()
+        self.assertEqual(key, self.key(data=self.data.copy()))
+        changed = self.data.copy()
+        changed[5, 5] += 1
+        self.assertNotEqual(key, self.key(data=changed))
+        self.assertNotEqual(key, self.key(beam=(1.5, 1.2, 0.4)))
+        self.assertNotEqual(key, self.key(back_size=16))
+
+    def test_unreadable(self):
+        key = self.key()
+        os.makedirs(self.cache.directory)
+        with open(self.cache.path(key), 'w') as f:
+            f.write("not a numpy file")
+        self.assertEqual(self.cache.load(key), None)
+
+    def test_image_data(self):
+        first = sfimage.ImageData(self.data, BEAM, None,
+                                  back_size_x=32, back_size_y=32,
+                                  grid_cache=self.cache.directory)
+        grids = first.grids
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+        uncached = sfimage.ImageData(self.data, BEAM, None,
+                                     back_size_x=32, back_size_y=32)
+        for name in ('rms', 'bg'):
+            self.assertTrue(np.all(grids[name] == uncached.grids[name]))
+
+        # A second image with the same data picks up the stored grids rather
+        # than calculating them again.
+        path = os.path.join(self.cache.directory,
+                            os.listdir(self.cache.directory)[0])
+        stored = dict(np.load(path))
+        stored['rms'] = stored['rms'] * 2
+        np.savez(path, **stored)
+        second = sfimage.ImageData(self.data, BEAM, None,
+                                   back_size_x=32, back_size_y=32,
+                                   grid_cache=self.cache.directory)
+        self.assertTrue(np.all(second.grids['rms'] == 2 * grids['rms']))
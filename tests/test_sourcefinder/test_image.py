@@ -1,15 +1,22 @@
 import numpy as np
 import os
+import pickle
 
 import unittest
+from scipy import ndimage
 
 from tkp.testutil.decorators import requires_data
 import tkp.sourcefinder
 from tkp.sourcefinder import image as sfimage
+from tkp.sourcefinder import stats
+from tkp.sourcefinder import extract
+from tkp.sourcefinder.fitting import fitgaussian
 from tkp import accessors
 from tkp.utility.uncertain import Uncertain
+from tkp.utility.coordinates import WCS
 from tkp.testutil.data import DATAPATH
 from tkp.testutil.data import fits_file
+from tkp.testutil.mock import Mock
 
 BOX_IN_BEAMPIX = 10 #HARDCODING - FIXME! (see also monitoringlist recipe)
 
@@ -350,3 +357,243 @@ class TestMaskedBackground(unittest.TestCase):
             accessors.open(fits_file), radius=1.0)
         result = self.image.extract(det=10.0, anl=3.0)
         self.assertFalse(result)
+
+
+class TestBackgroundGrids(unittest.TestCase):
+    """
+    The background and RMS grids are calculated for all cells at once; check
+    that this matches clipping each cell individually.
+    """
+    def setUp(self):
+        random = np.random.RandomState(42)
+        data = random.normal(0.5, 1.0, size=(250, 180))
+        # A couple of bright sources and a crowded, skewed region.
+        data[100:105, 60:65] += 200
+        data[20:23, 150:153] += 50
+        data[:40, :40] += random.exponential(3, size=(40, 40))
+        # Some "bad" data, which is masked.
+        data[150:160, 100:110] = 0
+        self.beam = (1.5, 1.2, 0.3)
+        self.image = sfimage.ImageData(data, self.beam, None, margin=5,
+                                       back_size_x=32, back_size_y=50)
+
+    def per_cell_grids(self):
+        useful_chunk = ndimage.find_objects(
+            np.where(self.image.data.mask, 0, 1))[0]
+        useful_data = self.image.data[useful_chunk]
+        rmsgrid, bggrid = [], []
+        for startx in range(0, useful_data.shape[0], self.image.back_size_x):
+            rmsrow, bgrow = [], []
+            for starty in range(0, useful_data.shape[1],
+                                self.image.back_size_y):
+                chunk = useful_data[
+                    startx:startx + self.image.back_size_x,
+                    starty:starty + self.image.back_size_y].ravel()
+                rms, bg = 0, 0
+                if chunk.any():
+                    chunk, sigma, median, num_clip_its = stats.sigma_clip(
+                        chunk, self.beam)
+                    if len(chunk) and chunk.any():
+                        mean = np.mean(chunk)
+                        rms = sigma
+                        if np.fabs(mean - median) / sigma >= 0.3:
+                            bg = median
+                        else:
+                            bg = 2.5 * median - 1.5 * mean
+                rmsrow.append(rms)
+                bgrow.append(bg)
+            rmsgrid.append(rmsrow)
+            bggrid.append(bgrow)
+        return np.array(rmsgrid), np.array(bggrid)
+
+    def testGridsMatchPerCellClipping(self):
+        rmsgrid, bggrid = self.per_cell_grids()
+        grids = self.image.grids
+        self.assertEqual(grids['rms'].shape, rmsgrid.shape)
+        self.assertEqual(grids['bg'].shape, bggrid.shape)
+        self.assertTrue((grids['rms'].mask == (rmsgrid == 0)).all())
+        self.assertTrue((grids['bg'].mask == (bggrid == 0)).all())
+        self.assertTrue(np.allclose(grids['rms'].filled(0), rmsgrid))
+        self.assertTrue(np.allclose(grids['bg'].filled(0), bggrid))
+
+    def testEmptyCellsMasked(self):
+        # With a margin of 5, the second row of grid cells covers pixels
+        # 37 to 68 along the x axis.
+        self.image.rawdata[37:69, :] = 0
+        self.image.clearcache()
+        grids = self.image.grids
+        self.assertTrue(grids['rms'].mask[1].all())
+        self.assertTrue(grids['bg'].mask[1].all())
+        self.assertFalse(grids['rms'].mask[0].any())
+
+
+def synthetic_sources():
+    """An image with 30 point sources, its WCS and its beam."""
+    random = np.random.RandomState(8)
+    data = random.normal(size=(200, 200))
+    x, y = np.mgrid[:200, :200]
+    for n in range(30):
+        xpos, ypos = random.uniform(10, 190, size=2)
+        data += random.uniform(10, 50) * np.exp(
+            -((x - xpos)**2 + (y - ypos)**2) / 6.)
+    wcs = WCS()
+    wcs.cdelt = (-0.01, 0.01)
+    wcs.crota = (0.0, 0.0)
+    wcs.crpix = (100, 100)
+    wcs.crval = (15.0, 50.0)
+    wcs.ctype = ('RA---SIN', 'DEC--SIN')
+    wcs.cunit = ('deg', 'deg')
+    return data, wcs, (1.7, 1.7, 0.)
+
+
+class TestParallelFitting(unittest.TestCase):
+    """
+    Fitting islands in parallel should give the same results, in the same
+    order, as fitting them in sequence.
+    """
+    def setUp(self):
+        self.data, self.wcs, self.beam = synthetic_sources()
+
+    def extract(self, fit_workers):
+        image = sfimage.ImageData(self.data, self.beam, self.wcs,
+                                  back_size_x=50, back_size_y=50,
+                                  residuals=True)
+        image.extract(det=5, anl=3, fit_workers=fit_workers)
+        return image
+
+    def testFitIslands(self):
+        image = sfimage.ImageData(self.data, self.beam, self.wcs)
+        labels, labelled_data = image.label_islands(5 * image.rmsmap,
+                                                    3 * image.rmsmap)
+        slices = ndimage.find_objects(labelled_data)
+        islands = [
+            extract.Island(
+                np.where(labelled_data[slices[label - 1]] == label,
+                         image.data_bgsubbed[slices[label - 1]].data,
+                         -extract.BIGNUM),
+                image.rmsmap[slices[label - 1]], slices[label - 1], 3,
+                5 * image.rmsmap[slices[label - 1]], self.beam, 0,
+                sfimage.DEBLEND_MINCONT, sfimage.STRUCTURING_ELEMENT)
+            for label in labels
+        ]
+        self.assertTrue(len(islands) > 20)
+        serial = sfimage.fit_islands(islands)
+        parallel = sfimage.fit_islands(islands, workers=3)
+        self.assertSameFits(serial, parallel)
+
+        # The pool is kept for the next call.
+        pool = sfimage._fit_pool
+        sfimage.fit_islands(islands[:5], workers=3)
+        self.assertTrue(sfimage._fit_pool is pool)
+
+        # Inside a daemonic process, the islands are fitted in turn.
+        orig_current_process = sfimage.multiprocessing.current_process
+        daemon = Mock()
+        daemon.daemon = True
+        sfimage.multiprocessing.current_process = lambda: daemon
+        try:
+            self.assertSameFits(serial,
+                                sfimage.fit_islands(islands, workers=3))
+        finally:
+            sfimage.multiprocessing.current_process = orig_current_process
+
+    def assertSameFits(self, serial, parallel):
+        self.assertEqual(len(serial), len(parallel))
+        for (a, a_residual), (b, b_residual) in zip(serial, parallel):
+            for key in ('xbar', 'ybar', 'peak', 'semimajor'):
+                self.assertEqual(a[key].value, b[key].value)
+            self.assertTrue((a_residual == b_residual).all())
+
+    def testResiduals(self):
+        serial = self.extract(1)
+        parallel = self.extract(3)
+        self.assertTrue((serial.residuals_from_gauss_fitting ==
+                         parallel.residuals_from_gauss_fitting).all())
+        self.assertTrue((serial.residuals_from_deblending ==
+                         parallel.residuals_from_deblending).all())
+
+
+class TestFitPeaks(unittest.TestCase):
+    """
+    Peaks fitted together for many positions should match those fitted at
+    each position in turn.
+    """
+    def testMatchesFitToPoint(self):
+        random = np.random.RandomState(11)
+        data = random.normal(size=(100, 100))
+        x, y = np.mgrid[:100, :100]
+        positions = [(20, 30), (50, 50), (75, 22), (96, 60)]
+        for xpos, ypos in positions:
+            data += random.uniform(5, 20) * np.exp(
+                -((x - xpos)**2 + (y - ypos)**2) / 4.)
+        image = sfimage.ImageData(data, (1.5, 1.5, 0.), None)
+        boxsize = 10
+        regions = [image._fit_region(xpos, ypos, boxsize, None,
+                                     'position+shape')
+                   for xpos, ypos in positions]
+        sfimage.ImageData._fit_peaks(regions)
+        # The box at the edge is smaller, and so fitted on its own.
+        self.assertEqual(regions[3][1].shape, (9, 11))
+        for (xpos, ypos), (chunk, fitme, fixed) in zip(positions, regions):
+            single = fitgaussian(fitme, {}, fixed=dict(
+                (k, v) for k, v in fixed.items() if k != 'peak'))
+            self.assertAlmostEqual(fixed['peak'], single['peak'])
+            self.assertTrue(fixed['peak'] > 3)
+
+
+class TestDetectionBatch(unittest.TestCase):
+    """
+    A batch of detections should hold the same measurements as the
+    equivalent individual detections.
+    """
+    def setUp(self):
+        self.data, self.wcs, self.beam = synthetic_sources()
+        self.image = sfimage.ImageData(self.data, self.beam, self.wcs)
+        labels, labelled_data = self.image.label_islands(
+            5 * self.image.rmsmap, 3 * self.image.rmsmap)
+        slices = ndimage.find_objects(labelled_data)
+        islands = [
+            extract.Island(
+                np.where(labelled_data[slices[label - 1]] == label,
+                         self.image.data_bgsubbed[slices[label - 1]].data,
+                         -extract.BIGNUM),
+                self.image.rmsmap[slices[label - 1]], slices[label - 1], 3,
+                5 * self.image.rmsmap[slices[label - 1]], self.beam, 0,
+                sfimage.DEBLEND_MINCONT, sfimage.STRUCTURING_ELEMENT)
+            for label in labels
+        ]
+        self.measurements = [fit_results[0] for fit_results
+                             in sfimage.fit_islands(islands) if fit_results]
+
+    def testMatchesDetections(self):
+        batch = extract.DetectionBatch.from_measurements(self.measurements,
+                                                         self.image)
+        self.assertEqual(len(batch), len(self.measurements))
+        serialized = batch.serialize(1.5, 2.5)
+        self.assertEqual(serialized.dtype, extract.SERIALIZED_DTYPE)
+        for measurement, row in zip(self.measurements, serialized.tolist()):
+            detection = extract.Detection(measurement, self.image)
+            for value, expected in zip(row, detection.serialize(1.5, 2.5)):
+                self.assertAlmostEqual(value, expected, places=8)
+
+    def testIndexing(self):
+        batch = extract.DetectionBatch.from_measurements(self.measurements,
+                                                         self.image)
+        bright = batch[batch['peak'] > 20]
+        self.assertTrue(0 < len(bright) < len(batch))
+        self.assertTrue((bright['peak'] > 20).all())
+        self.assertEqual(len(batch[3]), 1)
+        self.assertEqual(batch[3]['ra'][0], batch['ra'][3])
+
+        # The image isn't pickled along with the measurements.
+        unpickled = pickle.loads(pickle.dumps(batch))
+        self.assertTrue((unpickled.records == batch.records).all())
+        self.assertEqual(unpickled.imagedata, None)
+
+    def testExtract(self):
+        image = sfimage.ImageData(self.data, self.beam, self.wcs)
+        batch = image.extract(det=5, anl=3, batch=True)
+        self.assertTrue(isinstance(batch, extract.DetectionBatch))
+        self.assertTrue(len(batch) > 20)
+        self.assertFalse(np.isinf(batch['ra_err']).any())
+        self.assertEqual(len(image.extract(det=5, anl=3, batch=True)[:0]), 0)
@@ -0,0 +1,89 @@
+import numpy
+import unittest
+
+from tkp.sourcefinder.stats import sigma_clip, sigma_clip_stack
+
+BEAM = (2.0, 1.5, 0.3)
+
+
+class TestSigmaClip(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(17)
+        self.data = random.normal(3.0, 2.0, size=2000)
+        # Outliers at both ends, which should be clipped.
+        self.data[::50] += 1e4
+        self.data[25::50] -= 1e4
+
+    def test_outliers_clipped(self):
+        clipped, sigma, median, iterations = sigma_clip(self.data, BEAM)
+        self.assertTrue(1800 < len(clipped) <= 1960)
+        self.assertTrue(abs(clipped - median).max() < 1e3)
+        self.assertAlmostEqual(median, 3.0, delta=0.2)
+        self.assertAlmostEqual(sigma, 2.0, delta=0.2)
+        self.assertTrue(iterations >= 1)
+
+    def test_custom_centre_function(self):
+        # A custom centref takes the generic path, which should agree with
+        # the default median.
+        default = sigma_clip(self.data, BEAM)
+        custom = sigma_clip(self.data, BEAM, centref=lambda x: numpy.median(x))
+        self.assertEqual(len(default[0]), len(custom[0]))
+        self.assertAlmostEqual(default[1], custom[1])
+        self.assertAlmostEqual(default[2], custom[2])
+        self.assertEqual(default[3], custom[3])
+
+    def test_masked_input(self):
+        masked = numpy.ma.array(self.data, mask=(abs(self.data) > 1e3))
+        clipped, sigma, median, iterations = sigma_clip(masked, BEAM)
+        expected = sigma_clip(masked.compressed(), BEAM)
+        self.assertEqual(len(clipped), len(expected[0]))
+        self.assertEqual(sigma, expected[1])
+        self.assertEqual(median, expected[2])
+
+    def test_many_iterations(self):
+        # A heavy tailed distribution clips slowly. The loop must not be
+        # limited by the recursion depth.
+        data = numpy.random.RandomState(1).standard_cauchy(size=20000)
+        clipped, sigma, median, iterations = sigma_clip(data, BEAM,
+                                                        max_iter=5000)
+        self.assertTrue(iterations > 10)
+        clipped, sigma, median, iterations = sigma_clip(data, BEAM,
+                                                        max_iter=3)
+        self.assertEqual(iterations, 3)
+
+    def test_too_small(self):
+        clipped, sigma, median, iterations = sigma_clip(self.data[:2], BEAM)
+        self.assertEqual(len(clipped), 0)
+        self.assertEqual((sigma, median, iterations), (0, 0, 0))
+
+
+class TestSigmaClipStack(unittest.TestCase):
+    def test_matches_individual_cells(self):
+        random = numpy.random.RandomState(5)
+        data = random.normal(size=(20, 400)) * random.uniform(1, 5, size=(20, 1))
+        data[:, ::37] += 500
+        mask = numpy.zeros(data.shape, dtype=bool)
+        # Cells with different numbers of usable pixels, one of them empty,
+        # one of them too small to process.
+        mask[3, 100:] = True
+        mask[7, :] = True
+        mask[9, 2:] = True
+        stack = numpy.ma.array(data, mask=mask)
+
+        clipped, sigma, median, iterations = sigma_clip(stack, BEAM)
+        for cell in range(data.shape[0]):
+            expected = sigma_clip(stack[cell], BEAM)
+            self.assertEqual(clipped[cell].count(), len(expected[0]))
+            self.assertAlmostEqual(sigma[cell], expected[1])
+            self.assertAlmostEqual(median[cell], expected[2])
+            self.assertEqual(iterations[cell], expected[3])
+        self.assertTrue(clipped[7].mask.all())
+        self.assertTrue(clipped[9].mask.all())
+        self.assertEqual((sigma[9], median[9]), (0, 0))
+
+    def test_stack_function(self):
+        data = numpy.random.RandomState(2).normal(size=(4, 100))
+        by_clip = sigma_clip(data, BEAM)
+        by_stack = sigma_clip_stack(data, BEAM)
+        for a, b in zip(by_clip, by_stack):
+            self.assertTrue(numpy.all(a == b))
@@ -1,6 +1,14 @@
 import os
+import threading
+import time
 import unittest
+import warnings
+
+import numpy
+
 import tkp.steps.persistence
+from tkp.steps.persistence import COPY_THREADS
+import tkp.steps.session
 from tkp.testutil.decorators import requires_mongodb
 import tkp.testutil.data as testdata
 from tkp.testutil.decorators import requires_database, requires_data
@@ -63,6 +71,133 @@ class TestPersistence(unittest.TestCase):
                                          rms_est_sigma=4, rms_est_fraction=8)
 
 
+class DummyFitsFile(object):
+    def __init__(self, filename):
+        self.name = filename
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestNodeSteps(unittest.TestCase):
+    def setUp(self):
+        self.orig_copy = tkp.steps.persistence.image_to_mongodb
+        self.orig_convert = tkp.steps.persistence.image_to_fits
+        self.orig_extract = tkp.steps.persistence.extract_metadatas
+        self.config = {'mongo_host': None, 'mongo_port': None,
+                       'mongo_db': None, 'copy_images': True}
+        self.converted = []
+        self.extracted = []
+        def image_to_fits(filename):
+            self.converted.append(threading.current_thread())
+            return DummyFitsFile(filename)
+        def extract_metadatas(images, rms_est_sigma, rms_est_fraction,
+                              job_config):
+            self.extracted.append(threading.current_thread())
+            return [{'url': image} for image in images]
+        tkp.steps.persistence.image_to_fits = image_to_fits
+        tkp.steps.persistence.extract_metadatas = extract_metadatas
+
+    def tearDown(self):
+        tkp.steps.persistence.image_to_mongodb = self.orig_copy
+        tkp.steps.persistence.image_to_fits = self.orig_convert
+        tkp.steps.persistence.extract_metadatas = self.orig_extract
+
+    def test_concurrent_copies(self):
+        copied = []
+        fits_files = []
+        running = [0, 0]  # currently running, most running at once
+        condition = threading.Condition()
+        def image_to_mongodb(filename, hostname, port, db, fits_file):
+            # Waits until every thread of the pool is uploading.
+            with condition:
+                running[0] += 1
+                running[1] = max(running)
+                condition.notify_all()
+                deadline = time.time() + 5
+                while running[0] < COPY_THREADS and time.time() < deadline:
+                    condition.wait(deadline - time.time())
+                self.assertFalse(fits_file.closed)
+                copied.append(filename)
+                fits_files.append(fits_file)
+            return True
+        tkp.steps.persistence.image_to_mongodb = image_to_mongodb
+
+        images = ["%d.fits" % n for n in range(COPY_THREADS)]
+        metadatas = tkp.steps.persistence.node_steps(images, self.config,
+                                                     4, 8)
+        self.assertEqual([m['url'] for m in metadatas], images)
+        self.assertEqual(sorted(copied), images)
+        self.assertEqual(running[1], COPY_THREADS)
+        self.assertTrue(all(f.closed for f in fits_files))
+        # casacore is only used from the calling thread.
+        main = threading.current_thread()
+        self.assertEqual(self.converted, [main] * len(images))
+        self.assertEqual(self.extracted, [main] * len(images))
+
+    def test_failed_conversion(self):
+        copied = []
+        def image_to_fits(filename):
+            raise IOError("unreadable")
+        def image_to_mongodb(filename, hostname, port, db, fits_file):
+            copied.append(filename)
+            return True
+        tkp.steps.persistence.image_to_fits = image_to_fits
+        tkp.steps.persistence.image_to_mongodb = image_to_mongodb
+
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter("always")
+            metadatas = tkp.steps.persistence.node_steps(["a.fits"],
+                                                         self.config, 4, 8)
+        self.assertEqual(metadatas, [{'url': "a.fits"}])
+        self.assertEqual(copied, [])
+
+
+class DummyAccessor(object):
+    def __init__(self, url):
+        self.url = url
+        self.data = numpy.random.RandomState(0).normal(size=(64, 64))
+
+    def extract_metadata(self):
+        return {'url': self.url}
+
+
+class TestQualityCheck(unittest.TestCase):
+    def setUp(self):
+        self.orig_open = tkp.steps.session.tkp.accessors.open
+        self.orig_reject_check = tkp.steps.persistence.reject_check
+        self.opened = []
+        def open_image(url):
+            self.opened.append(url)
+            return DummyAccessor(url)
+        tkp.steps.session.tkp.accessors.open = open_image
+        tkp.steps.session.clear_sessions()
+
+    def tearDown(self):
+        tkp.steps.session.tkp.accessors.open = self.orig_open
+        tkp.steps.persistence.reject_check = self.orig_reject_check
+        tkp.steps.session.clear_sessions()
+
+    def test_shared_session(self):
+        def reject_check(url, job_config):
+            session = tkp.steps.session.get_session(url)
+            return job_config, session.rms_qc(4, 8)
+        tkp.steps.persistence.reject_check = reject_check
+
+        images = ["a.fits", "b.fits", "c.fits"]
+        metadatas = tkp.steps.persistence.extract_metadatas(images, 4, 8,
+                                                            "config")
+        # The quality check reuses the image and the RMS of the persistence
+        # step, also when there are more images than fit in the cache.
+        self.assertEqual(self.opened, images)
+        for metadata in metadatas:
+            self.assertEqual(metadata['rejected'],
+                             ("config", metadata['rms_qc']))
+        metadatas = tkp.steps.persistence.extract_metadatas(images[:1], 4, 8)
+        self.assertFalse('rejected' in metadatas[0])
+
+
 @requires_mongodb()
 class TestMongoDb(unittest.TestCase):
     @classmethod
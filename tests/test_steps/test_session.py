@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+
+import tkp.steps.session
+from tkp.steps.session import ImageSession
+from tkp.testutil.mock import Mock
+
+
+class DummyAccessor(object):
+    def __init__(self, url):
+        self.url = url
+        self.data = np.random.RandomState(0).normal(size=(64, 64))
+        self.beam = (1.5, 1.5, 0.)
+        self.wcs = None
+
+
+class TestImageSession(unittest.TestCase):
+    def setUp(self):
+        self.orig_open = tkp.steps.session.tkp.accessors.open
+        self.opener = Mock()
+        def open_image(url):
+            self.opener(url)
+            return DummyAccessor(url)
+        tkp.steps.session.tkp.accessors.open = open_image
+        tkp.steps.session.clear_sessions()
+        self.orig_cache_size = tkp.steps.session.CACHE_SIZE
+
+    def tearDown(self):
+        tkp.steps.session.tkp.accessors.open = self.orig_open
+        tkp.steps.session.set_cache_size(self.orig_cache_size)
+        tkp.steps.session.clear_sessions()
+
+    def test_opened_once(self):
+        first = tkp.steps.session.get_session("a.fits")
+        second = tkp.steps.session.get_session("a.fits")
+        self.assertTrue(first is second)
+        self.assertEqual(self.opener.callcount, 1)
+        tkp.steps.session.close_session("a.fits")
+        tkp.steps.session.get_session("a.fits")
+        self.assertEqual(self.opener.callcount, 2)
+
+    def test_cache_size(self):
+        size = tkp.steps.session.CACHE_SIZE
+        for n in range(size + 1):
+            tkp.steps.session.get_session("%d.fits" % n)
+        self.assertEqual(self.opener.callcount, size + 1)
+        # The most recently used image is still open, the first one isn't.
+        tkp.steps.session.get_session("%d.fits" % size)
+        self.assertEqual(self.opener.callcount, size + 1)
+        tkp.steps.session.get_session("0.fits")
+        self.assertEqual(self.opener.callcount, size + 2)
+
+    def test_set_cache_size(self):
+        tkp.steps.session.set_cache_size(3)
+        for n in range(3):
+            tkp.steps.session.get_session("%d.fits" % n)
+        tkp.steps.session.set_cache_size(1)
+        tkp.steps.session.get_session("2.fits")
+        self.assertEqual(self.opener.callcount, 3)
+        tkp.steps.session.get_session("1.fits")
+        self.assertEqual(self.opener.callcount, 4)
+
+    def test_derived_values(self):
+        session = ImageSession("a.fits", accessor=DummyAccessor("a.fits"))
+        self.assertEqual(self.opener.callcount, 0)
+        rms = session.rms_qc(3, 4)
+        self.assertEqual(rms, session.rms_qc(3, 4))
+        params = {'margin': 0, 'extraction_radius_pix': 0,
+                  'back_size_x': 32, 'back_size_y': 32}
+        image = session.sourcefinder_image(params)
+        self.assertTrue(image is session.sourcefinder_image(params))
+        params['back_size_x'] = 16
+        self.assertFalse(image is session.sourcefinder_image(params))
+
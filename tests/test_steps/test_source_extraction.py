@@ -6,7 +6,9 @@ from tkp.testutil.data import default_job_config
 from tkp.testutil.decorators import requires_data, requires_database
 from tkp.testutil.mock import Mock
 import tkp.steps.source_extraction
+import tkp.steps.session
 from tkp.db import DataSet
+from tkp.sourcefinder.extract import DetectionBatch
 from tkp.testutil.data import fits_file
 
 
@@ -42,11 +44,13 @@ class TestSourceExtraction(unittest.TestCase):
         # The object it returns has an extract() method, which should have
         # been called with det, anl, force_beam and deblend_nthresh kwargs.
         image_path = fits_file
-        mock_method = Mock(MockImage([]))
-        orig_method = tkp.steps.source_extraction.sourcefinder_image_from_accessor
-        tkp.steps.source_extraction.sourcefinder_image_from_accessor = mock_method
+        mock_method = Mock(MockImage(DetectionBatch()))
+        orig_method = tkp.steps.session.sourcefinder_image_from_accessor
+        tkp.steps.session.sourcefinder_image_from_accessor = mock_method
+        tkp.steps.session.clear_sessions()
         tkp.steps.source_extraction.extract_sources(image_path, self.parset)
-        tkp.steps.source_extraction.sourcefinder_image_from_accessor = orig_method
+        tkp.steps.session.sourcefinder_image_from_accessor = orig_method
+        tkp.steps.session.clear_sessions()
 
         # Arguments to sourcefinder_image_from_accessor()
         self.assertIn('radius', mock_method.callvalues[0][1])
@@ -59,3 +63,4 @@ class TestSourceExtraction(unittest.TestCase):
         self.assertIn('anl', mock_method.returnvalue.callvalues[0][1])
         self.assertIn('force_beam', mock_method.returnvalue.callvalues[0][1])
         self.assertIn('deblend_nthresh', mock_method.returnvalue.callvalues[0][1])
+        self.assertTrue(mock_method.returnvalue.callvalues[0][1]['batch'])
@@ -311,3 +311,20 @@ class UnixToMJDTestCase(unittest.TestCase):
 
 if __name__ == '__main__':
     unittest.main()
+
+
+class ArrayVersionsTest(unittest.TestCase):
+    def testAlphaInflate(self):
+        decls = [0., 30., -60., 89.95]
+        alphas = coordinates.alpha_inflate_array(0.01, decls)
+        for decl, alpha in zip(decls, alphas):
+            self.assertAlmostEqual(alpha,
+                                   coordinates.alpha_inflate(0.01, decl))
+
+    def testEqToCart(self):
+        ras, decls = [0., 123.4, 359.9], [-45., 12.3, 89.]
+        xs, ys, zs = coordinates.eq_to_cart_array(ras, decls)
+        for i, (ra, decl) in enumerate(zip(ras, decls)):
+            for value, expected in zip((xs[i], ys[i], zs[i]),
+                                       coordinates.eq_to_cart(ra, decl)):
+                self.assertAlmostEqual(value, expected)
@@ -1,5 +1,7 @@
 import unittest
 
+import numpy
+
 from tkp.utility import coordinates
 from tkp.sourcefinder import extract
 from tkp.utility.uncertain import Uncertain
@@ -115,6 +117,31 @@ class wcsSin(unittest.TestCase):
         result = map(round, self.wcs.s2p(self.wcs.p2s(pixel)))
         self.assertEqual(result, pixel)
 
+    def testArrays(self):
+        pixels = numpy.array([pixel for pixel, spatial in self.known_values])
+        spatial, invalid = self.wcs.p2s_array(pixels)
+        self.assertEqual(spatial.shape, (len(pixels), 2))
+        self.assertFalse(invalid.any())
+        for position, pixel in zip(spatial, pixels):
+            self.assertEqual(list(position), list(self.wcs.p2s(pixel)))
+        result, invalid = self.wcs.s2p_array(spatial)
+        self.assertFalse(invalid.any())
+        self.assertTrue(numpy.allclose(result, pixels))
+
+    def testInvalidArrays(self):
+        # The second position is beyond the edge of the projection.
+        spatial, invalid = self.wcs.p2s_array([[1442.0, 1442.0],
+                                               [1e5, 1e5],
+                                               [1441.0, 1501.0]])
+        self.assertEqual(list(invalid), [False, True, False])
+        self.assertTrue(numpy.isnan(spatial[1]).all())
+        self.assertRaises(RuntimeError, self.wcs.p2s, [1e5, 1e5])
+        self.assertAlmostEqual(spatial[2][1], 60.815406379421418)
+
+        spatial, invalid = self.wcs.p2s_array([])
+        self.assertEqual(spatial.shape, (0, 2))
+        self.assertEqual(len(invalid), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -20,13 +20,20 @@ class FitsImage(DataAccessor):
     Provide standard attributes, as per :class:`DataAccessor`. In addition, we
     provide a ``telescope`` attribute if the FITS file has a ``TELESCOP``
     header.
+
+    If ``memmap`` is set, the pixel data is memory-mapped rather than read
+    into memory, and kept in its on-disk floating point precision; see
+    :meth:`read_data`.
     """
-    def __init__(self, url, plane=None, beam=None, hdu_index=0):
+    def __init__(self, url, plane=None, beam=None, hdu_index=0, memmap=False):
         super(FitsImage, self).__init__()
         self.url = url
-        self.header = self._get_header(hdu_index)
-        self.wcs = self.parse_coordinates()
-        self.data = self.read_data(hdu_index, plane)
+        self.memmap = memmap
+        with self._open() as hdulist:
+            hdu = hdulist[hdu_index]
+            self.header = hdu.header.copy()
+            self.wcs = self.parse_coordinates()
+            self.data = self._hdu_data(hdu, plane)
         self.taustart_ts, self.tau_time = self.parse_times()
         self.freq_eff, self.freq_bw = self.parse_frequency()
         self.pixelsize = self.parse_pixelsize()
@@ -43,6 +50,13 @@ class FitsImage(DataAccessor):
         if 'TELESCOP' in self.header:
             self.telescope = self.header['TELESCOP']
 
+    def _open(self):
+        # PyFITS memory-maps by default where it can; only insist on it if
+        # we have been asked to.
+        if self.memmap:
+            return pyfits.open(self.url, memmap=True)
+        return pyfits.open(self.url)
+
     def _get_header(self, hdu_index):
         with pyfits.open(self.url) as hdulist:
             hdu = hdulist[hdu_index]
@@ -59,10 +73,22 @@ class FitsImage(DataAccessor):
         consistent with (eg) ds9 display of the FitsFile. Transpose back
         before viewing the array with RO.DS9, saving to a FITS file,
         etc.
+
+        If this image was opened with ``memmap``, the data is returned as a
+        transposed view on the memory-mapped file rather than as a copy.
+        Floating point data keeps its precision on disk (typically single
+        precision); the source finder only promotes it to double precision
+        where it is fitted. Integer or scaled data, which PyFITS can't
+        memory-map anyway, is converted to double precision as usual.
         """
-        with pyfits.open(self.url) as hdulist:
-            hdu = hdulist[hdu_index]
-            data = numpy.float64(hdu.data.squeeze())
+        with self._open() as hdulist:
+            return self._hdu_data(hdulist[hdu_index], plane)
+
+    def _hdu_data(self, hdu, plane):
+        """Pixel data of hdu, as returned by :meth:`read_data`."""
+        data = hdu.data.squeeze()
+        if not (self.memmap and data.dtype.kind == 'f'):
+            data = numpy.float64(data)
         if plane is not None and len(data.shape) > 2:
             data = data[plane].squeeze()
         n_dim = len(data.shape)
@@ -3,9 +3,9 @@ from tkp.accessors.lofaraccessor import LofarAccessor
 
 
 class LofarFitsImage(FitsImage, LofarAccessor):
-    def __init__(self, url, plane=False, beam=False, hdu=0):
-        super(LofarFitsImage, self).__init__(url, plane, beam, hdu)
-        header = self._get_header(hdu)
+    def __init__(self, url, plane=False, beam=False, hdu=0, memmap=False):
+        super(LofarFitsImage, self).__init__(url, plane, beam, hdu, memmap)
+        header = self.header
         self.antenna_set = header['ANTENNA']
         self.ncore = header['NCORE']
         self.nintl = header['NINTL']
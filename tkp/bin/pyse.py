@@ -134,6 +134,8 @@ def get_argparser():
                         help="Number of deblending subthresholds; 0 to disable")
     extraction.add_argument("--grid", default=64, type=int,
                         help="Background grid segment size")
+    extraction.add_argument("--grid-cache", type=str,
+                        help="Directory in which to cache background grids")
     extraction.add_argument("--margin", default=0, type=int,
                         help="Margin applied to each edge of image (in pixels)")
     extraction.add_argument("--radius", default=0, type=float,
@@ -143,6 +145,8 @@ def get_argparser():
     extraction.add_argument("--bpa", type=float, help="Set beam: Beam position angle (deg)")
     extraction.add_argument("--force-beam", action="store_true",
                         help="Force fit axis lengths to beam size")
+    extraction.add_argument("--fit-workers", default=1, type=int,
+                        help="Number of processes fitting islands in parallel")
     extraction.add_argument("--detection-image", type=str,
                         help="Find islands on different image")
     extraction.add_argument('--fixed-posns', help="List of position coordinates to "
@@ -248,6 +252,7 @@ def get_sourcefinder_configuration(options):
         "back_size_y": options.grid,
         "margin": options.margin,
         "radius": options.radius,
+        "grid_cache": options.grid_cache,
     }
     if options.residuals or options.islands:
         configuration['residuals'] = True
@@ -306,7 +311,8 @@ def run_sourcefinder(files, options):
                 sr = imagedata.fd_extract(
                     alpha=options.alpha,
                     deblend_nthresh=options.deblend_thresholds,
-                    force_beam=options.force_beam
+                    force_beam=options.force_beam,
+                    fit_workers=options.fit_workers
                 )
             else:
                 if labelled_data is None:
@@ -316,7 +322,8 @@ def run_sourcefinder(files, options):
                     det=options.detection, anl=options.analysis,
                     labelled_data=labelled_data, labels=labels,
                     deblend_nthresh=options.deblend_thresholds,
-                    force_beam=options.force_beam
+                    force_beam=options.force_beam,
+                    fit_workers=options.fit_workers
                 )
 
         if options.regions:
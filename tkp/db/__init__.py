@@ -23,3 +23,11 @@ def execute(query, parameters={}, commit=False):
 def rollback():
     database = Database()
     return database.rollback()
+
+
+def unit_of_work():
+    """
+    Run the queries in a with block in a single transaction, see
+    :meth:`tkp.db.database.Database.unit_of_work`.
+    """
+    return Database().unit_of_work()
@@ -11,8 +11,9 @@ https://github.com/transientskp/notebooks/blob/master/transients.ipynb
 from sqlalchemy.orm import aliased
 from sqlalchemy.sql import func
 
-from tkp.db.model import (Assocxtrsource, Extractedsource, Image, Newsource,
-                          Runningcatalog)
+from tkp.db.model import (Assocxtrsource, Extractedsource, Image,
+                          LightcurveSummary, Newsource, Runningcatalog,
+                          TransientCandidate)
 
 
 def _last_assoc_timestamps(session, dataset):
@@ -192,9 +193,79 @@ def _combined(session, dataset):
         subquery()
 
 
+def _brightest_summary(session, dataset):
+    """
+    Select peak flux per runcat at last datapoint (over all bands), from the
+    lightcurve summaries.
+
+    args:
+        session: SQLalchemy session objects
+        dataset: tkp.db.model.dataset object
+
+    returns: SQLAlchemy subquery
+    """
+    s = aliased(LightcurveSummary, name='s_bs')
+    r = aliased(Runningcatalog, name='r_bs')
+    return session.query(s.runcat_id.label('runcat_id'),
+                         func.max(s.last_f_int).label('max_flux')
+                         ). \
+        select_from(s). \
+        join(r, r.id == s.runcat_id). \
+        filter(r.dataset == dataset). \
+        group_by(s.runcat_id). \
+        subquery(name='brightest_summary')
+
+
+def _summarised(session, dataset):
+    """
+    As _combined, but reading a single lightcurve summary per runcat rather
+    than the whole lightcurve. The median is approximate, see
+    tkp.db.associations._update_lightcurve_summary.
+
+    args:
+        session (Session): SQLAlchemy session
+        dataset (Dataset): Dataset model object
+
+    return: a SQLALchemy subquery
+    """
+    runcat = aliased(Runningcatalog, name='r')
+    summary = aliased(LightcurveSummary, name='summary')
+
+    newsrc_trigger_query = _newsrc_trigger(session, dataset)
+    brightest_query = _brightest_summary(session, dataset)
+
+    return session.query(
+        runcat.id,
+        runcat.wm_ra.label('ra'),
+        runcat.wm_decl.label('decl'),
+        runcat.wm_uncertainty_ew,
+        runcat.wm_uncertainty_ns,
+        runcat.xtrsrc_id,
+        runcat.dataset_id.label('dataset_id'),
+        runcat.datapoints,
+        summary.last_v_int.label('v_int'),
+        summary.last_eta_int.label('eta_int'),
+        summary.band_id,
+        newsrc_trigger_query.c.id.label('newsource'),
+        newsrc_trigger_query.c.sigma_rms_max.label('sigma_rms_max'),
+        newsrc_trigger_query.c.sigma_rms_min.label('sigma_rms_min'),
+        summary.max_f_int.label('lightcurve_max'),
+        summary.avg_f_int.label('lightcurve_avg'),
+        summary.median_f_int.label('lightcurve_median')
+    ). \
+        select_from(brightest_query). \
+        join(summary,
+             (summary.runcat_id == brightest_query.c.runcat_id) &
+             (summary.last_f_int == brightest_query.c.max_flux)). \
+        join(runcat, runcat.id == brightest_query.c.runcat_id). \
+        outerjoin(newsrc_trigger_query, newsrc_trigger_query.c.rc_id == runcat.id). \
+        filter(runcat.dataset == dataset). \
+        subquery()
+
+
 def transients(session, dataset, ra_range=None, decl_range=None,
                v_int_min=None, eta_int_min=None, sigma_rms_min_range=None,
-               sigma_rms_max_range=None, new_src_only=False):
+               sigma_rms_max_range=None, new_src_only=False, exact=False):
     """
     Calculate sigma_min, sigma_max, v_int, eta_int and the max and avg
     values for lightcurves, for all runningcatalogs
@@ -206,6 +277,10 @@ def transients(session, dataset, ra_range=None, decl_range=None,
     (stored in newsource.previous_limits_image) to obtain sigma_max and
     sigma_min.
 
+    The lightcurve values are read from the lightcurve summaries, unless
+    exact is set, in which case they are calculated from the whole
+    lightcurves. Only the median differs.
+
     args:
         dataset (Dataset): SQLAlchemy dataset object
         ra_range (tuple): 2 element tuple of ra range
@@ -215,30 +290,69 @@ def transients(session, dataset, ra_range=None, decl_range=None,
         sigma_rms_min_range (tuple): 2 element tuple
         sigma_rms_max_range (tuple): 2 element tuple
         new_src_only (bool):  New sources only
+        exact (bool): Calculate from the lightcurves
 
     returns: a SQLAlchemy query
     """
 
-    subquery = _combined(session, dataset=dataset)
+    if exact:
+        subquery = _combined(session, dataset=dataset)
+    else:
+        subquery = _summarised(session, dataset=dataset)
     query = session.query(subquery)
+    return _filter(query, subquery.c.ra, subquery.c.decl, subquery.c,
+                   ra_range, decl_range, v_int_min, eta_int_min,
+                   sigma_rms_min_range, sigma_rms_max_range, new_src_only)
+
+
+def transient_candidates(session, dataset, ra_range=None, decl_range=None,
+                         v_int_min=None, eta_int_min=None,
+                         sigma_rms_min_range=None, sigma_rms_max_range=None,
+                         new_src_only=False):
+    """
+    As transients, but reading the transient_candidate table, which the
+    pipeline keeps up to date (see tkp.db.candidates). All the filters are
+    backed by indexes.
+
+    returns: a SQLAlchemy query for TransientCandidate objects
+    """
+    query = session.query(TransientCandidate). \
+        filter(TransientCandidate.dataset == dataset)
+    return _filter(query, TransientCandidate.wm_ra, TransientCandidate.wm_decl,
+                   TransientCandidate, ra_range, decl_range, v_int_min,
+                   eta_int_min, sigma_rms_min_range, sigma_rms_max_range,
+                   new_src_only)
+
 
+def _filter(query, ra, decl, columns, ra_range, decl_range, v_int_min,
+            eta_int_min, sigma_rms_min_range, sigma_rms_max_range,
+            new_src_only):
+    """
+    Apply the filters of transients to a query.
+
+    args:
+        ra, decl: ra and decl columns
+        columns: object with v_int, eta_int, sigma_rms_min, sigma_rms_max and
+            newsource columns as attributes
+
+    returns: a SQLAlchemy query
+    """
     if ra_range and decl_range:
-        query = query.filter(subquery.c.ra.between(*ra_range) &
-                             subquery.c.decl.between(*decl_range))
+        query = query.filter(ra.between(*ra_range) & decl.between(*decl_range))
 
     if v_int_min != None:
-        query = query.filter(subquery.c.v_int >= v_int_min)
+        query = query.filter(columns.v_int >= v_int_min)
 
     if eta_int_min != None:
-        query = query.filter(subquery.c.eta_int >= eta_int_min)
+        query = query.filter(columns.eta_int >= eta_int_min)
 
     if sigma_rms_min_range:
-        query = query.filter(subquery.c.sigma_rms_min.between(*sigma_rms_min_range))
+        query = query.filter(columns.sigma_rms_min.between(*sigma_rms_min_range))
 
     if sigma_rms_max_range:
-        query = query.filter(subquery.c.sigma_rms_max.between(*sigma_rms_max_range))
+        query = query.filter(columns.sigma_rms_max.between(*sigma_rms_max_range))
 
     if new_src_only:
-        query = query.filter(subquery.c.newsource != None)
+        query = query.filter(columns.newsource != None)
 
     return query
@@ -0,0 +1,418 @@
+"""
+In-memory source association.
+
+This is an alternative to the SQL which fills the temprunningcatalog table
+(see :func:`tkp.db.associations._insert_temprunningcatalog` and
+:func:`tkp.db.associations._flag_many_to_many_tempruncat`). Rather than
+join the extracted sources of an image against the whole running catalogue
+in the database, the running catalogue sources of the dataset in the
+declination zones of the image are loaded into a KD-tree of unit vectors, the candidate pairs are looked up in it and the De
+Ruiter radii, the updated weighted means and the many-to-many flags are
+calculated with NumPy. The resulting rows are bulk loaded into
+temprunningcatalog, after which association carries on as usual.
+
+The calculations follow the SQL exactly, including the treatment of images
+which cross the RA = 0/360 meridian.
+"""
+
+import itertools
+import logging
+
+import numpy
+from scipy.spatial import cKDTree
+
+import tkp.db
+from tkp.utility.coordinates import alpha_inflate_array
+
+
+logger = logging.getLogger(__name__)
+
+# Columns loaded from the database, in the order they are selected.
+EXTRACTEDSOURCE_COLUMNS = (
+    'id', 'ra', 'decl', 'ra_err', 'decl_err', 'uncertainty_ew',
+    'uncertainty_ns', 'x', 'y', 'z', 'f_peak', 'f_peak_err', 'f_int',
+    'f_int_err')
+
+RUNNINGCATALOG_COLUMNS = (
+    'id', 'datapoints', 'wm_ra', 'wm_decl', 'wm_uncertainty_ew',
+    'wm_uncertainty_ns', 'avg_ra_err', 'avg_decl_err', 'avg_wra',
+    'avg_wdecl', 'avg_weight_ra', 'avg_weight_decl', 'x', 'y', 'z')
+
+FLUX_COLUMNS = (
+    'f_datapoints', 'avg_f_peak', 'avg_f_peak_sq', 'avg_f_peak_weight',
+    'avg_weighted_f_peak', 'avg_weighted_f_peak_sq', 'avg_f_int',
+    'avg_f_int_sq', 'avg_f_int_weight', 'avg_weighted_f_int',
+    'avg_weighted_f_int_sq')
+
+# Columns of temprunningcatalog which are filled in, in insertion order.
+TEMPRUNNINGCATALOG_COLUMNS = (
+    'runcat', 'xtrsrc', 'distance_arcsec', 'r', 'dataset', 'band', 'stokes',
+    'datapoints', 'zone', 'wm_ra', 'wm_decl', 'wm_uncertainty_ew',
+    'wm_uncertainty_ns', 'avg_ra_err', 'avg_decl_err', 'avg_wra',
+    'avg_wdecl', 'avg_weight_ra', 'avg_weight_decl', 'x', 'y', 'z',
+    'inactive') + FLUX_COLUMNS
+
+INTEGER_COLUMNS = ('runcat', 'xtrsrc', 'dataset', 'band', 'stokes',
+                   'datapoints', 'zone', 'f_datapoints')
+
+
+def _columns(rows, names):
+    """Turn database rows into a dict of column arrays."""
+    if rows:
+        values = zip(*rows)
+    else:
+        values = [()] * len(names)
+    return dict((name, numpy.array(column, dtype=float))
+                for name, column in zip(names, values))
+
+
+def _alpha(theta, decl):
+    """Array version of the alpha() SQL function."""
+    return alpha_inflate_array(theta, decl)
+
+
+def _shift_ra(ra):
+    """
+    RA moved half way round the sky, as MOD(CAST(ra + 180 AS
+    NUMERIC(11,8)), 360) does in the cross-meridian SQL.
+    """
+    return numpy.mod(numpy.round(ra + 180, 8), 360)
+
+
+def candidate_pairs(xtrsrc, runcat, radius, deRuiter_r, meridian_wrap):
+    """
+    Find the pairs of extracted and running catalogue sources which may be
+    associated.
+
+    Args:
+        xtrsrc (dict): extracted source columns, see EXTRACTEDSOURCE_COLUMNS
+        runcat (dict): running catalogue columns, see RUNNINGCATALOG_COLUMNS
+        radius (float): search radius, in degrees; the beamwidths limit
+            times the restoring beam semimajor axis
+        deRuiter_r (float): maximum De Ruiter radius of a pair
+        meridian_wrap (bool): whether the image crosses the RA = 0/360
+            meridian
+
+    Returns:
+        tuple: indices into xtrsrc and runcat of the pairs, and the De
+            Ruiter radius of each
+    """
+    empty = (numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int),
+             numpy.zeros(0))
+    if not len(xtrsrc['id']) or not len(runcat['id']):
+        return empty
+
+    # Everything within the search cone, by chord length.
+    tree = cKDTree(numpy.column_stack((runcat['x'], runcat['y'], runcat['z'])))
+    matches = tree.query_ball_point(
+        numpy.column_stack((xtrsrc['x'], xtrsrc['y'], xtrsrc['z'])),
+        2 * numpy.sin(numpy.radians(radius) / 2))
+    xi = numpy.repeat(numpy.arange(len(matches)),
+                      [len(match) for match in matches])
+    ri = numpy.fromiter(itertools.chain.from_iterable(matches), dtype=int,
+                        count=len(xi))
+    if not len(xi):
+        return empty
+
+    x_ra, x_decl = xtrsrc['ra'][xi], xtrsrc['decl'][xi]
+    rc_ra, rc_decl = runcat['wm_ra'][ri], runcat['wm_decl'][ri]
+    dot = (runcat['x'][ri] * xtrsrc['x'][xi] +
+           runcat['y'][ri] * xtrsrc['y'][xi] +
+           runcat['z'][ri] * xtrsrc['z'][xi])
+    keep = ((rc_decl >= x_decl - radius) & (rc_decl <= x_decl + radius) &
+            (dot > numpy.cos(numpy.radians(radius))))
+    if not meridian_wrap:
+        alpha = _alpha(radius, x_decl)
+        keep &= (rc_ra >= x_ra - alpha) & (rc_ra <= x_ra + alpha)
+
+    r = _de_ruiter(xtrsrc, runcat, xi, ri, meridian_wrap)
+    keep &= r < deRuiter_r
+    return xi[keep], ri[keep], r[keep]
+
+
+def _wrapped(runcat, ri, meridian_wrap):
+    """Pairs for which the cross-meridian SQL shifts the RAs."""
+    rc_ra = runcat['wm_ra'][ri]
+    if not meridian_wrap:
+        return numpy.zeros(len(ri), dtype=bool)
+    return (rc_ra < 90) | (rc_ra > 270)
+
+
+def _de_ruiter(xtrsrc, runcat, xi, ri, meridian_wrap):
+    wrapped = _wrapped(runcat, ri, meridian_wrap)
+    x_ra, rc_ra = xtrsrc['ra'][xi], runcat['wm_ra'][ri]
+    delta_ra = numpy.where(wrapped, _shift_ra(rc_ra) - _shift_ra(x_ra),
+                           rc_ra - x_ra)
+    x_decl, rc_decl = xtrsrc['decl'][xi], runcat['wm_decl'][ri]
+    delta_ra = delta_ra * numpy.cos(numpy.radians((rc_decl + x_decl) / 2))
+    return numpy.sqrt(
+        delta_ra * delta_ra /
+        (runcat['wm_uncertainty_ew'][ri] ** 2 +
+         xtrsrc['uncertainty_ew'][xi] ** 2) +
+        (rc_decl - x_decl) * (rc_decl - x_decl) /
+        (runcat['wm_uncertainty_ns'][ri] ** 2 +
+         xtrsrc['uncertainty_ns'][xi] ** 2))
+
+
+def many_to_many_inactive(xtrsrc_ids, runcat_ids, r):
+    """
+    Flag the many-to-many associations to drop.
+
+    Among the pairs of which both the extracted source and the running
+    catalogue source have several candidates, only the closest (in De Ruiter
+    radius) running catalogue source of each extracted source is kept; this
+    reduces the many-to-many associations to one-to-many and many-to-one.
+
+    Returns:
+        numpy.ndarray: boolean array, True for the pairs to drop
+    """
+    xtrsrc_ids, runcat_ids = numpy.asarray(xtrsrc_ids), numpy.asarray(runcat_ids)
+    if not len(r):
+        return numpy.zeros(0, dtype=bool)
+
+    def multiple(ids):
+        unique, counts = numpy.unique(ids, return_counts=True)
+        return numpy.in1d(ids, unique[counts > 1])
+
+    many_xtrsrc = multiple(xtrsrc_ids)
+    # Running catalogue sources with several candidates, which are also a
+    # candidate for an extracted source with several candidates.
+    linked = numpy.in1d(runcat_ids, runcat_ids[many_xtrsrc])
+    many_to_many = many_xtrsrc & linked & multiple(runcat_ids)
+
+    # Sort the many-to-many pairs by extracted source, then by De Ruiter
+    # radius: the first pair of each extracted source is the one to keep.
+    inactive = numpy.zeros(len(r), dtype=bool)
+    pairs = numpy.flatnonzero(many_to_many)
+    if not len(pairs):
+        return inactive
+    pairs = pairs[numpy.lexsort((r[pairs], xtrsrc_ids[pairs]))]
+    ids = xtrsrc_ids[pairs]
+    starts = numpy.flatnonzero(numpy.r_[True, ids[1:] != ids[:-1]])
+    min_r = numpy.repeat(r[pairs][starts],
+                         numpy.diff(numpy.r_[starts, len(pairs)]))
+    inactive[pairs] = r[pairs] > min_r
+    return inactive
+
+
+def temprunningcatalog_rows(xtrsrc, runcat, fluxes, xi, ri, r,
+                            meridian_wrap):
+    """
+    Calculate the temprunningcatalog columns of each pair, as
+    :func:`tkp.db.associations._insert_temprunningcatalog` does.
+
+    Args:
+        fluxes (dict): columns of the runningcatalog_flux of each running
+            catalogue source in the band of the image, see FLUX_COLUMNS.
+            f_datapoints is 0 where there is none.
+
+    Returns:
+        dict: column name to array, for the columns in
+            TEMPRUNNINGCATALOG_COLUMNS which can be calculated here
+    """
+    rows = {'r': r}
+    x = dict((name, column[xi]) for name, column in xtrsrc.items())
+    rc = dict((name, column[ri]) for name, column in runcat.items())
+    rows['runcat'] = rc['id']
+    rows['xtrsrc'] = x['id']
+    rows['distance_arcsec'] = 3600 * numpy.degrees(2 * numpy.arcsin(
+        numpy.sqrt((rc['x'] - x['x']) ** 2 + (rc['y'] - x['y']) ** 2 +
+                   (rc['z'] - x['z']) ** 2) / 2))
+
+    dp = rc['datapoints']
+    rows['datapoints'] = dp + 1
+    weight_ew = 1 / (x['uncertainty_ew'] * x['uncertainty_ew'])
+    weight_ns = 1 / (x['uncertainty_ns'] * x['uncertainty_ns'])
+    sum_weight_ra = dp * rc['avg_weight_ra'] + weight_ew
+    sum_weight_decl = dp * rc['avg_weight_decl'] + weight_ns
+
+    wrapped = _wrapped(runcat, ri, meridian_wrap)
+    if meridian_wrap:
+        rc_ra, x_ra = _shift_ra(rc['wm_ra']), _shift_ra(x['ra'])
+        wrapped_wm_ra = (dp * rc['avg_weight_ra'] * rc_ra +
+                         x_ra * weight_ew) / sum_weight_ra - 180
+        wm_ra = numpy.where(wrapped, wrapped_wm_ra,
+                            (dp * rc['avg_wra'] + x['ra'] * weight_ew) /
+                            sum_weight_ra)
+        # A weighted mean RA just below zero is snapped to zero, see
+        # _insert_temprunningcatalog().
+        wm_ra = numpy.where(wm_ra < 0,
+                            numpy.where(numpy.abs(wm_ra) > 8e-14,
+                                        wm_ra + 360, 0.0),
+                            wm_ra)
+        shifted = ((dp * rc['avg_weight_ra'] * rc_ra + x_ra * weight_ew -
+                    dp * rc['avg_weight_ra'] * 180 - 180 * weight_ew) /
+                   (dp + 1))
+        period = 360 * sum_weight_ra / (dp + 1)
+        wrapped_avg_wra = shifted - period * numpy.floor(shifted / period)
+        avg_wra = numpy.where(wrapped, wrapped_avg_wra,
+                              (dp * rc['avg_wra'] + x['ra'] * weight_ew) /
+                              (dp + 1))
+        wm_decl = ((dp * rc['avg_weight_decl'] * rc['wm_decl'] +
+                    x['decl'] * weight_ns) / sum_weight_decl)
+    else:
+        wm_ra = (dp * rc['avg_wra'] + x['ra'] * weight_ew) / sum_weight_ra
+        avg_wra = (dp * rc['avg_wra'] + x['ra'] * weight_ew) / (dp + 1)
+        wm_decl = (dp * rc['avg_wdecl'] + x['decl'] * weight_ns) / sum_weight_decl
+    rows['wm_ra'] = wm_ra
+    rows['wm_decl'] = wm_decl
+    rows['avg_wra'] = avg_wra
+    rows['zone'] = numpy.floor(wm_decl).astype(int)
+    rows['wm_uncertainty_ew'] = numpy.sqrt(
+        1 / ((dp + 1) * (sum_weight_ra / (dp + 1))))
+    rows['wm_uncertainty_ns'] = numpy.sqrt(
+        1 / ((dp + 1) * (sum_weight_decl / (dp + 1))))
+    rows['avg_ra_err'] = (dp * rc['avg_ra_err'] + x['ra_err']) / (dp + 1)
+    rows['avg_decl_err'] = (dp * rc['avg_decl_err'] + x['decl_err']) / (dp + 1)
+    rows['avg_wdecl'] = (dp * rc['avg_wdecl'] + x['decl'] * weight_ns) / (dp + 1)
+    rows['avg_weight_ra'] = sum_weight_ra / (dp + 1)
+    rows['avg_weight_decl'] = sum_weight_decl / (dp + 1)
+    rows['x'] = numpy.cos(numpy.radians(wm_decl)) * numpy.cos(numpy.radians(wm_ra))
+    rows['y'] = numpy.cos(numpy.radians(wm_decl)) * numpy.sin(numpy.radians(wm_ra))
+    rows['z'] = numpy.sin(numpy.radians(wm_decl))
+
+    # Without an earlier flux in this band, f_datapoints is 0 and all the
+    # averages reduce to the values of the extracted source.
+    fdp = fluxes['f_datapoints'][ri]
+    rows['f_datapoints'] = fdp + 1
+    for kind in ('peak', 'int'):
+        value = x['f_' + kind]
+        error = x['f_%s_err' % kind]
+        new = {
+            'avg_f_%s': value,
+            'avg_f_%s_sq': value * value,
+            'avg_f_%s_weight': 1 / (error * error),
+            'avg_weighted_f_%s': value / (error * error),
+            'avg_weighted_f_%s_sq': (value * value) / (error * error),
+        }
+        for column, new_value in new.items():
+            column = column % kind
+            rows[column] = ((fdp * numpy.nan_to_num(fluxes[column][ri]) +
+                             new_value) / (fdp + 1))
+    return rows
+
+
+def zones(decl, radius):
+    """
+    The range of declination zones within radius of the extracted sources,
+    as the zone BETWEEN condition of the SQL association.
+
+    Args:
+        decl (numpy.ndarray): declinations of the extracted sources
+        radius (float): search radius, in degrees
+
+    Returns:
+        tuple: lowest and highest zone
+    """
+    return (int(numpy.floor(decl.min() - radius)),
+            int(numpy.floor(decl.max() + radius)))
+
+
+def _load(image_id, beamwidths_limit):
+    """
+    Load the image, its extracted sources and the running catalogue sources
+    in the zones they may be associated with.
+    """
+    query = """\
+SELECT dataset
+      ,band
+      ,stokes
+      ,rb_smaj
+  FROM image
+ WHERE id = %(image_id)s
+"""
+    cursor = tkp.db.execute(query, {'image_id': image_id})
+    dataset, band, stokes, rb_smaj = cursor.fetchone()
+
+    query = """\
+SELECT %s
+  FROM extractedsource
+ WHERE image = %%(image_id)s
+""" % ','.join(EXTRACTEDSOURCE_COLUMNS)
+    cursor = tkp.db.execute(query, {'image_id': image_id})
+    xtrsrc = _columns(cursor.fetchall(), EXTRACTEDSOURCE_COLUMNS)
+    if not len(xtrsrc['id']):
+        runcat = _columns([], RUNNINGCATALOG_COLUMNS)
+        fluxes = _columns([], FLUX_COLUMNS)
+        return (dataset, band, stokes, rb_smaj), xtrsrc, runcat, fluxes
+
+    zone_min, zone_max = zones(xtrsrc['decl'], beamwidths_limit * rb_smaj)
+    params = {'dataset': dataset, 'band': band, 'stokes': stokes,
+              'zone_min': zone_min, 'zone_max': zone_max}
+    query = """\
+SELECT %s
+  FROM runningcatalog
+ WHERE dataset = %%(dataset)s
+   AND inactive = FALSE
+   AND mon_src = FALSE
+   AND zone BETWEEN %%(zone_min)s AND %%(zone_max)s
+""" % ','.join(RUNNINGCATALOG_COLUMNS)
+    cursor = tkp.db.execute(query, params)
+    runcat = _columns(cursor.fetchall(), RUNNINGCATALOG_COLUMNS)
+
+    query = """\
+SELECT rf.runcat
+      ,%s
+  FROM runningcatalog_flux rf
+      ,runningcatalog rc
+ WHERE rf.runcat = rc.id
+   AND rc.dataset = %%(dataset)s
+   AND rc.inactive = FALSE
+   AND rc.mon_src = FALSE
+   AND rc.zone BETWEEN %%(zone_min)s AND %%(zone_max)s
+   AND rf.band = %%(band)s
+   AND rf.stokes = %%(stokes)s
+""" % ','.join('rf.' + column for column in FLUX_COLUMNS)
+    cursor = tkp.db.execute(query, params)
+    rows = cursor.fetchall()
+    fluxes = dict((column, numpy.zeros(len(runcat['id'])))
+                  for column in FLUX_COLUMNS)
+    if rows:
+        flux_columns = _columns(rows, ('runcat',) + FLUX_COLUMNS)
+        sorter = numpy.argsort(runcat['id'])
+        index = sorter[numpy.searchsorted(runcat['id'], flux_columns['runcat'],
+                                          sorter=sorter)]
+        for column in FLUX_COLUMNS:
+            fluxes[column][index] = flux_columns[column]
+    return (dataset, band, stokes, rb_smaj), xtrsrc, runcat, fluxes
+
+
+def insert_temprunningcatalog(image_id, deRuiter_r, beamwidths_limit,
+                              meridian_wrap):
+    """
+    Fill temprunningcatalog with the candidate associations of the
+    extracted sources of an image, with the many-to-many associations
+    already flagged inactive.
+
+    This replaces :func:`tkp.db.associations._insert_temprunningcatalog`
+    followed by :func:`tkp.db.associations._flag_many_to_many_tempruncat`.
+
+    Returns:
+        int: number of candidate associations
+    """
+    (dataset, band, stokes, rb_smaj), xtrsrc, runcat, fluxes = _load(
+        image_id, beamwidths_limit)
+    across = meridian_wrap['q_across'] == True
+    if across:
+        logger.debug("Search across 0/360 meridian: %s" % meridian_wrap)
+    xi, ri, r = candidate_pairs(xtrsrc, runcat, beamwidths_limit * rb_smaj,
+                                deRuiter_r, across)
+    if not len(r):
+        return 0
+
+    rows = temprunningcatalog_rows(xtrsrc, runcat, fluxes, xi, ri, r, across)
+    rows['inactive'] = many_to_many_inactive(rows['xtrsrc'], rows['runcat'],
+                                             r)
+    rows['dataset'] = numpy.repeat(dataset, len(r))
+    rows['band'] = numpy.repeat(band, len(r))
+    rows['stokes'] = numpy.repeat(stokes, len(r))
+
+    for column in INTEGER_COLUMNS:
+        rows[column] = rows[column].astype(int)
+    values = zip(*[rows[column].tolist()
+                   for column in TEMPRUNNINGCATALOG_COLUMNS])
+    tkp.db.Database().copy('temprunningcatalog', TEMPRUNNINGCATALOG_COLUMNS,
+                           values)
+    logger.debug("Inserted %d candidate associations (%d many-to-many) for "
+                 "image %s" % (len(r), rows['inactive'].sum(), image_id))
+    return len(r)
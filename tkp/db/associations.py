@@ -3,7 +3,10 @@ A collection of back end subroutines (mostly SQL queries), In this module we
 deal with source association.
 """
 import logging
+from contextlib import contextmanager
+
 import tkp.db
+from tkp.db import association_index
 from sqlalchemy.exc import IntegrityError
 
 
@@ -11,7 +14,8 @@ logger = logging.getLogger(__name__)
 
 
 def associate_extracted_sources(image_id, deRuiter_r, beamwidths_limit=1,
-                                new_source_sigma_margin=3):
+                                new_source_sigma_margin=3, engine='sql',
+                                transaction=False):
     """
     Associate extracted sources with sources detected in the running
     catalog.
@@ -21,13 +25,109 @@ def associate_extracted_sources(image_id, deRuiter_r, beamwidths_limit=1,
 
     The dimensionless distance between two sources is given by the
     "De Ruiter radius", see Chapters 2 & 3 of Scheers' thesis.
+
+    The candidate associations are found and the many-to-many associations
+    flagged either in SQL (engine='sql') or in memory (engine='memory', see
+    :mod:`tkp.db.association_index`). The results are the same.
+
+    With transaction=True the whole association runs in a single
+    transaction, which is rolled back if any step fails, rather than
+    committing after every statement. temprunningcatalog is then truncated
+    instead of vacuumed, since vacuuming is not possible in a transaction.
     """
+    if engine not in ('sql', 'memory'):
+        raise ValueError("Unknown association engine '%s'" % engine)
 
     logger.debug("Using a De Ruiter radius of %s" % (deRuiter_r,))
     ##This is used as a check that everything from the sourcefinder is sensible.
     ##Currently switched off as it's incompatible with sources about the meridian.
 #    _delete_bad_blind_extractions(conn, image_id)
-    _empty_temprunningcatalog()
+    with _transaction(transaction):
+        if transaction:
+            _truncate_temprunningcatalog()
+        else:
+            _empty_temprunningcatalog()
+        mw = _check_meridian_wrap(image_id)
+        _associate_image(image_id, mw, deRuiter_r, beamwidths_limit,
+                         new_source_sigma_margin, engine,
+                         vacuum=not transaction, truncate=transaction)
+
+
+def associate_timestep(image_ids, deRuiter_r, beamwidths_limit=1,
+                       new_source_sigma_margin=3, engine='sql',
+                       transaction=False):
+    """
+    Associate the extracted sources of all images of a timestep.
+
+    The result is the same as calling :func:`associate_extracted_sources`
+    for each image in turn, but the work which does not depend on the
+    individual images is done once for the whole timestep: the meridian wrap
+    of all images is looked up in a single query, and temprunningcatalog is
+    truncated between images rather than deleted from, so that it holds no
+    dead rows and only needs vacuuming once.
+
+    The images are still associated one after another. Images of a timestep
+    are usually different bands of the same field, and the association of
+    each depends on the running catalog left by the one before (for example,
+    a source first detected in one band is associated in the next rather
+    than inserted again).
+
+    Args:
+        image_ids (list): ids of the images, in the order to associate them
+        deRuiter_r, beamwidths_limit, new_source_sigma_margin, engine: see
+            :func:`associate_extracted_sources`
+        transaction (bool): associate all images in a single transaction,
+            so that either all or none of them are associated
+    """
+    if engine not in ('sql', 'memory'):
+        raise ValueError("Unknown association engine '%s'" % engine)
+    if not image_ids:
+        return
+
+    logger.debug("Using a De Ruiter radius of %s" % (deRuiter_r,))
+    with _transaction(transaction):
+        wraps = _check_meridian_wraps(image_ids)
+        _truncate_temprunningcatalog()
+        for n, image_id in enumerate(image_ids):
+            logger.debug("Associating image %s (%s/%s)" %
+                         (image_id, n + 1, len(image_ids)))
+            _associate_image(image_id, wraps[image_id], deRuiter_r,
+                             beamwidths_limit, new_source_sigma_margin, engine,
+                             vacuum=(n == 0 and not transaction),
+                             truncate=True)
+
+
+@contextmanager
+def _transaction(enabled):
+    """
+    Run the block in a single transaction if enabled, see
+    :func:`tkp.db.unit_of_work`. Otherwise every statement commits by itself.
+    """
+    if not enabled:
+        yield
+        return
+    try:
+        with tkp.db.unit_of_work():
+            yield
+    except:
+        logger.error("Association failed, rolled back the transaction")
+        raise
+
+
+def _associate_image(image_id, mw, deRuiter_r, beamwidths_limit,
+                     new_source_sigma_margin, engine, vacuum, truncate):
+    """
+    Associate the extracted sources of a single image, starting from an
+    empty temprunningcatalog.
+
+    Args:
+        mw (dict): meridian wrap of the image, see _check_meridian_wrap()
+        vacuum (bool): whether to vacuum temprunningcatalog before flagging
+            the many-to-many associations (SQL engine only)
+        truncate (bool): whether to empty temprunningcatalog afterwards with
+            _truncate_temprunningcatalog() rather than
+            _empty_temprunningcatalog()
+    """
     #+------------------------------------------------------+
     #| Here we select all extracted sources that have one or|
     #| more counterparts in the runningcatalog              |
@@ -35,25 +135,30 @@ def associate_extracted_sources(image_id, deRuiter_r, beamwidths_limit=1,
     #| which may be matching one of the following cases:    |
     #| many-to-many, many-to-one, one-to-many, one-to-many  |
     #+------------------------------------------------------+
-    mw = _check_meridian_wrap(image_id)
-    _insert_temprunningcatalog(image_id, deRuiter_r, beamwidths_limit, mw)
-    #+------------------------------------------------------+
-    #| Here we process (flag) the many-to-many associations.|
-    #+------------------------------------------------------+
-    database = tkp.db.Database()
-
-    # Since the _flag_many_to_many_tempruncat uses the temprunningcatalog table
-    # as a temporary use space the table will receive many writes and updates.
-    # On postgresql for speed up reasons rows are not directly deleted, but
-    # marked for deletion and eventually deleted by an auto vacuum process.
-    # Because of the nested complexity of this query it may happen the
-    # computational complexity of the query explodes, resulting in massive
-    # slowdowns. To make sure the temprunningcatalog table doesn't contain dead
-    # rows we force a manual vacuum here.
-    database.vacuum('temprunningcatalog')
-
-    # _process_many_to_many()
-    _flag_many_to_many_tempruncat()
+    if engine == 'memory':
+        # Matching and flagging of the many-to-many associations in one go.
+        association_index.insert_temprunningcatalog(
+            image_id, deRuiter_r, beamwidths_limit, mw)
+    else:
+        _insert_temprunningcatalog(image_id, deRuiter_r, beamwidths_limit, mw)
+        #+------------------------------------------------------+
+        #| Here we process (flag) the many-to-many associations.|
+        #+------------------------------------------------------+
+
+        # Since the _flag_many_to_many_tempruncat uses the temprunningcatalog
+        # table as a temporary use space the table will receive many writes
+        # and updates. On postgresql for speed up reasons rows are not
+        # directly deleted, but marked for deletion and eventually deleted by
+        # an auto vacuum process. Because of the nested complexity of this
+        # query it may happen the computational complexity of the query
+        # explodes, resulting in massive slowdowns. To make sure the
+        # temprunningcatalog table doesn't contain dead rows we force a manual
+        # vacuum here.
+        if vacuum:
+            tkp.db.Database().vacuum('temprunningcatalog')
+
+        # _process_many_to_many()
+        _flag_many_to_many_tempruncat()
     #+------------------------------------------------------+
     #| After this, the assocs have been reduced to many-to-1|
     #| which are treated identical as 1-to-1, and 1-to-many.|
@@ -108,8 +213,12 @@ def associate_extracted_sources(image_id, deRuiter_r, beamwidths_limit=1,
     _insert_new_assocxtrsource(image_id)
     _determine_newsource_previous_limits(image_id, new_source_sigma_margin)
 
-    _empty_temprunningcatalog()
+    if truncate:
+        _truncate_temprunningcatalog()
+    else:
+        _empty_temprunningcatalog()
     _update_ff_runcat_extractedsource()
+    _update_lightcurve_summary(image_id)
     _delete_inactive_runcat()
 
 ##############################################################################
@@ -184,52 +293,23 @@ def _empty_temprunningcatalog():
     tkp.db.execute(query, commit=True)
 
 
+# On postgresql TRUNCATE frees the table at once, rather than marking the rows
+# for deletion by the vacuum process.
+TRUNCATE_TEMPRUNNINGCATALOG_QUERY = {
+    'postgresql': "TRUNCATE temprunningcatalog",
+    None: "DELETE FROM temprunningcatalog",
+}
 
-def _check_meridian_wrap(image_id):
-    """
-    Checks whether an image is close to the meridian ra = 0 or ra = 360
-
-    When so, the association query needs to be rewritten to take into account
-    sources across the 0/360 meridian.
-
-    The query returns:
-
-    q_across: true, if the extraction region of the image crosses
-              the ra=0/360 border
-
-    ra_min:   the min value of the ra-between for the normal case,
-              when the image is outside the ra=0/360 meridian,
-              otherwise NULL
-
-    ra_max:   the max value of the ra-between for the normal case,
-              when the image is outside the ra=0/360 meridian,
-              otherwise NULL
-
-    ra_min1/max1 and ra_min2/max2 are the values which may be used
-    for the case of a cross-meridian image.
-    F.ex. using a search radius of 5 degrees, and when a source is at
-    359.99 the ra-betweens 1 and 2 are :
-    ... AND (ra BETWEEN ra_min1 AND ra_max1 OR ra BETWEEN ra_min2 AND ra_max2) ...
-    ... AND (ra BETWEEN 354.99 AND 360 OR ra BETWEEN 0 AND 4.99) ...
-
-    ra_min1:  the min value of the high-end ra-between, if the
-              extraction region of the image crosses the ra=0/360 border,
-              otherwise NULL
 
-    ra_max1:  the min value of the high-end ra-between, if the
-              extraction region of the image crosses the ra=0/360 border,
-              otherwise NULL
+def _truncate_temprunningcatalog():
+    """Empty the temporary storage table without leaving dead rows."""
+    tkp.db.execute(_dialect(TRUNCATE_TEMPRUNNINGCATALOG_QUERY), commit=True)
 
-    ra_min2, ra_max2: As ra_min1/max1, but for the low-end ra values.
 
-    These values are not being used in the cross-meridian association query,
-    but are merely reported to notice the search area.
-    The cross-meridian association query uses the cartesian dot product,
-    to get the search area.
-    """
 
-    meridian_wrap_query = """\
-SELECT CASE WHEN s.centre_ra - alpha(s.xtr_radius, s.centre_decl) < 0 OR
+_MERIDIAN_WRAP_QUERY = """\
+SELECT i.id
+      ,CASE WHEN s.centre_ra - alpha(s.xtr_radius, s.centre_decl) < 0 OR
                  s.centre_ra + alpha(s.xtr_radius, s.centre_decl) > 360
             THEN TRUE
             ELSE FALSE
@@ -271,34 +351,79 @@ SELECT CASE WHEN s.centre_ra - alpha(s.xtr_radius, s.centre_decl) < 0 OR
   FROM image i
       ,skyregion s
  WHERE i.skyrgn = s.id
-   AND i.id = %(image_id)s
+   AND i.id IN (%s)
 """
-    args = {'image_id': image_id}
-    cursor = tkp.db.execute(meridian_wrap_query, args, commit=True)
-    results = zip(*cursor.fetchall())
-
-    if len(results) != 0:
-        q_across = results[0]
-        ra_min = results[1]
-        ra_max = results[2]
-        ra_min1 = results[3]
-        ra_max1 = results[4]
-        ra_min2 = results[5]
-        ra_max2 = results[6]
-        if len(q_across) != 1:
-            raise ValueError("More than one FoVs for image '%s'" % image_id)
-    else:
-        raise ValueError("No FoV information present for image '%s'" % image_id)
 
-    return {
-        'q_across': q_across[0],
-        'ra_min': ra_min[0],
-        'ra_max': ra_max[0],
-        'ra_min1': ra_min1[0],
-        'ra_max1': ra_max1[0],
-        'ra_min2': ra_min2[0],
-        'ra_max2': ra_max2[0]
-    }
+
+def _check_meridian_wrap(image_id):
+    """
+    Checks whether an image is close to the meridian ra = 0 or ra = 360
+
+    When so, the association query needs to be rewritten to take into account
+    sources across the 0/360 meridian.
+
+    The query returns:
+
+    q_across: true, if the extraction region of the image crosses
+              the ra=0/360 border
+
+    ra_min:   the min value of the ra-between for the normal case,
+              when the image is outside the ra=0/360 meridian,
+              otherwise NULL
+
+    ra_max:   the max value of the ra-between for the normal case,
+              when the image is outside the ra=0/360 meridian,
+              otherwise NULL
+
+    ra_min1/max1 and ra_min2/max2 are the values which may be used
+    for the case of a cross-meridian image.
+    F.ex. using a search radius of 5 degrees, and when a source is at
+    359.99 the ra-betweens 1 and 2 are :
+    ... AND (ra BETWEEN ra_min1 AND ra_max1 OR ra BETWEEN ra_min2 AND ra_max2) ...
+    ... AND (ra BETWEEN 354.99 AND 360 OR ra BETWEEN 0 AND 4.99) ...
+
+    ra_min1:  the min value of the high-end ra-between, if the
+              extraction region of the image crosses the ra=0/360 border,
+              otherwise NULL
+
+    ra_max1:  the min value of the high-end ra-between, if the
+              extraction region of the image crosses the ra=0/360 border,
+              otherwise NULL
+
+    ra_min2, ra_max2: As ra_min1/max1, but for the low-end ra values.
+
+    These values are not being used in the cross-meridian association query,
+    but are merely reported to notice the search area.
+    The cross-meridian association query uses the cartesian dot product,
+    to get the search area.
+    """
+
+    return _check_meridian_wraps([image_id])[image_id]
+
+
+def _check_meridian_wraps(image_ids):
+    """
+    As _check_meridian_wrap(), for several images in a single query.
+
+    Returns:
+        dict: image id to the meridian wrap of that image
+    """
+    ids_placeholder = ", ".join(["%s"] * len(image_ids))
+    query = _MERIDIAN_WRAP_QUERY % ids_placeholder
+    cursor = tkp.db.execute(query, tuple(image_ids), commit=True)
+    wraps = {}
+    for row in cursor.fetchall():
+        image_id = row[0]
+        if image_id in wraps:
+            raise ValueError("More than one FoVs for image '%s'" % image_id)
+        wraps[image_id] = dict(zip(('q_across', 'ra_min', 'ra_max', 'ra_min1',
+                                    'ra_max1', 'ra_min2', 'ra_max2'),
+                                   row[1:]))
+    for image_id in image_ids:
+        if image_id not in wraps:
+            raise ValueError("No FoV information present for image '%s'"
+                             % image_id)
+    return wraps
 
 
 def _insert_temprunningcatalog(image_id, deRuiter_r, beamwidths_limit,
@@ -560,6 +685,7 @@ INSERT INTO temprunningcatalog
              AND x0.image = i0.id
              AND x0.image = %(image_id)s
              AND i0.dataset = rc0.dataset
+             AND rc0.inactive = FALSE
              AND rc0.mon_src = FALSE
              AND rc0.zone BETWEEN CAST(FLOOR(x0.decl - %(beamwidths_limit)s * i0.rb_smaj) as INTEGER)
                               AND CAST(FLOOR(x0.decl + %(beamwidths_limit)s * i0.rb_smaj) as INTEGER)
@@ -766,6 +892,7 @@ INSERT INTO temprunningcatalog
              AND x0.image = i0.id
              AND x0.image = %(image_id)s
              AND i0.dataset = rc0.dataset
+             AND rc0.inactive = FALSE
              AND rc0.mon_src = FALSE
              AND rc0.zone BETWEEN CAST(FLOOR(x0.decl - %(beamwidths_limit)s * i0.rb_smaj) AS INTEGER)
                               AND CAST(FLOOR(x0.decl + %(beamwidths_limit)s * i0.rb_smaj) AS INTEGER)
@@ -905,24 +1032,26 @@ INSERT INTO runningcatalog
   ,x
   ,y
   ,z
+  ,first_taustart_ts
   )
-  SELECT xtrsrc
-        ,dataset
-        ,datapoints
-        ,zone
-        ,wm_ra
-        ,wm_decl
-        ,wm_uncertainty_ew
-        ,wm_uncertainty_ns
-        ,avg_ra_err
-        ,avg_decl_err
-        ,avg_wra
-        ,avg_wdecl
-        ,avg_weight_ra
-        ,avg_weight_decl
-        ,x
-        ,y
-        ,z
+  SELECT tmprc.xtrsrc
+        ,tmprc.dataset
+        ,tmprc.datapoints
+        ,tmprc.zone
+        ,tmprc.wm_ra
+        ,tmprc.wm_decl
+        ,tmprc.wm_uncertainty_ew
+        ,tmprc.wm_uncertainty_ns
+        ,tmprc.avg_ra_err
+        ,tmprc.avg_decl_err
+        ,tmprc.avg_wra
+        ,tmprc.avg_wdecl
+        ,tmprc.avg_weight_ra
+        ,tmprc.avg_weight_decl
+        ,tmprc.x
+        ,tmprc.y
+        ,tmprc.z
+        ,i.taustart_ts
     FROM (SELECT runcat
             FROM temprunningcatalog
            WHERE inactive = FALSE
@@ -930,8 +1059,12 @@ INSERT INTO runningcatalog
           HAVING COUNT(*) > 1
          ) one_to_many
         ,temprunningcatalog tmprc
+        ,extractedsource x
+        ,image i
    WHERE tmprc.runcat = one_to_many.runcat
      AND tmprc.inactive = FALSE
+     AND x.id = tmprc.xtrsrc
+     AND i.id = x.image
 """
     tkp.db.execute(query, commit=True)
 
@@ -1400,9 +1533,67 @@ def _insert_1_to_1_assoc():
     tkp.db.execute(ONE_TO_ONE_ASSOC_QUERY, {'type': 3}, commit=True)
 
 
-def _update_1_to_1_runcat():
-    """Update the running catalog with the values in temprunningcatalog"""
-    query = """\
+def _dialect(queries):
+    """
+    Pick the query for the database engine in use from a dict of engine name
+    to query, falling back to the one stored under None.
+    """
+    engine = tkp.db.Database().engine
+    return queries.get(engine, queries[None])
+
+
+# The running catalog update of _update_1_to_1_runcat() comes in dialects,
+# applying all the columns in a single join where the database supports it.
+# The correlated subqueries of the fallback look up each column separately.
+UPDATE_1_TO_1_RUNCAT_QUERY = {
+    'postgresql': """\
+UPDATE runningcatalog
+   SET datapoints = t.datapoints
+      ,zone = t.zone
+      ,wm_ra = t.wm_ra
+      ,wm_decl = t.wm_decl
+      ,avg_ra_err = t.avg_ra_err
+      ,avg_decl_err = t.avg_decl_err
+      ,wm_uncertainty_ew = t.wm_uncertainty_ew
+      ,wm_uncertainty_ns = t.wm_uncertainty_ns
+      ,avg_wra = t.avg_wra
+      ,avg_wdecl = t.avg_wdecl
+      ,avg_weight_ra = t.avg_weight_ra
+      ,avg_weight_decl = t.avg_weight_decl
+      ,x = t.x
+      ,y = t.y
+      ,z = t.z
+      ,forcedfits_count = 0
+  FROM temprunningcatalog t
+ WHERE t.runcat = runningcatalog.id
+   AND t.inactive = FALSE
+""",
+    'monetdb': """\
+MERGE INTO runningcatalog
+USING (SELECT *
+         FROM temprunningcatalog
+        WHERE inactive = FALSE
+      ) t
+   ON t.runcat = runningcatalog.id
+ WHEN MATCHED THEN
+      UPDATE SET datapoints = t.datapoints
+                ,zone = t.zone
+                ,wm_ra = t.wm_ra
+                ,wm_decl = t.wm_decl
+                ,avg_ra_err = t.avg_ra_err
+                ,avg_decl_err = t.avg_decl_err
+                ,wm_uncertainty_ew = t.wm_uncertainty_ew
+                ,wm_uncertainty_ns = t.wm_uncertainty_ns
+                ,avg_wra = t.avg_wra
+                ,avg_wdecl = t.avg_wdecl
+                ,avg_weight_ra = t.avg_weight_ra
+                ,avg_weight_decl = t.avg_weight_decl
+                ,x = t.x
+                ,y = t.y
+                ,z = t.z
+                ,forcedfits_count = 0
+""",
+    None: """\
         UPDATE runningcatalog
            SET datapoints = (SELECT datapoints
                                FROM temprunningcatalog
@@ -1485,17 +1676,61 @@ def _update_1_to_1_runcat():
                         WHERE temprunningcatalog.runcat = runningcatalog.id
                           AND temprunningcatalog.inactive = FALSE
                       )
-"""
+""",
+}
+
+
+def _update_1_to_1_runcat():
+    """Update the running catalog with the values in temprunningcatalog"""
+    query = _dialect(UPDATE_1_TO_1_RUNCAT_QUERY)
     tkp.db.execute(query, commit=True)
 
-def _update_1_to_1_runcat_flux():
-    """Updates the fluxes in runningcatalog_flux of an existing band
-    for an existing runcat source.
 
-    If the runcat, band, stokes entry does exist in runcat_flux,
-    it will be updated with the values from tempruncat.
-    """
-    query = """\
+UPDATE_1_TO_1_RUNCAT_FLUX_QUERY = {
+    'postgresql': """\
+UPDATE runningcatalog_flux
+   SET f_datapoints = t.f_datapoints
+      ,avg_f_peak = t.avg_f_peak
+      ,avg_f_peak_sq = t.avg_f_peak_sq
+      ,avg_f_peak_weight = t.avg_f_peak_weight
+      ,avg_weighted_f_peak = t.avg_weighted_f_peak
+      ,avg_weighted_f_peak_sq = t.avg_weighted_f_peak_sq
+      ,avg_f_int = t.avg_f_int
+      ,avg_f_int_sq = t.avg_f_int_sq
+      ,avg_f_int_weight = t.avg_f_int_weight
+      ,avg_weighted_f_int = t.avg_weighted_f_int
+      ,avg_weighted_f_int_sq = t.avg_weighted_f_int_sq
+  FROM temprunningcatalog t
+ WHERE t.runcat = runningcatalog_flux.runcat
+   AND t.band = runningcatalog_flux.band
+   AND t.stokes = runningcatalog_flux.stokes
+   AND t.inactive = FALSE
+   AND t.f_datapoints > 1
+""",
+    'monetdb': """\
+MERGE INTO runningcatalog_flux
+USING (SELECT *
+         FROM temprunningcatalog
+        WHERE inactive = FALSE
+          AND f_datapoints > 1
+      ) t
+   ON t.runcat = runningcatalog_flux.runcat
+  AND t.band = runningcatalog_flux.band
+  AND t.stokes = runningcatalog_flux.stokes
+ WHEN MATCHED THEN
+      UPDATE SET f_datapoints = t.f_datapoints
+                ,avg_f_peak = t.avg_f_peak
+                ,avg_f_peak_sq = t.avg_f_peak_sq
+                ,avg_f_peak_weight = t.avg_f_peak_weight
+                ,avg_weighted_f_peak = t.avg_weighted_f_peak
+                ,avg_weighted_f_peak_sq = t.avg_weighted_f_peak_sq
+                ,avg_f_int = t.avg_f_int
+                ,avg_f_int_sq = t.avg_f_int_sq
+                ,avg_f_int_weight = t.avg_f_int_weight
+                ,avg_weighted_f_int = t.avg_weighted_f_int
+                ,avg_weighted_f_int_sq = t.avg_weighted_f_int_sq
+""",
+    None: """\
 UPDATE runningcatalog_flux
    SET f_datapoints = (SELECT f_datapoints
                          FROM temprunningcatalog
@@ -1582,7 +1817,18 @@ UPDATE runningcatalog_flux
                   AND temprunningcatalog.inactive = FALSE
                   AND temprunningcatalog.f_datapoints > 1
               )
-"""
+""",
+}
+
+
+def _update_1_to_1_runcat_flux():
+    """Updates the fluxes in runningcatalog_flux of an existing band
+    for an existing runcat source.
+
+    If the runcat, band, stokes entry does exist in runcat_flux,
+    it will be updated with the values from tempruncat.
+    """
+    query = _dialect(UPDATE_1_TO_1_RUNCAT_FLUX_QUERY)
     cursor = tkp.db.execute(query, commit=True)
     return cursor.rowcount
 
@@ -1671,6 +1917,7 @@ INSERT INTO runningcatalog
   ,x
   ,y
   ,z
+  ,first_taustart_ts
   )
   SELECT new_src.xtrsrc
         ,new_src.dataset
@@ -1689,6 +1936,7 @@ INSERT INTO runningcatalog
         ,new_src.x
         ,new_src.y
         ,new_src.z
+        ,new_src.taustart_ts
     FROM (SELECT x0.id AS xtrsrc
                 ,i0.dataset
                 ,1 AS datapoints
@@ -1706,6 +1954,7 @@ INSERT INTO runningcatalog
                 ,x0.x
                 ,x0.y
                 ,x0.z
+                ,i0.taustart_ts
             FROM extractedsource x0
                 ,image i0
            WHERE x0.image = i0.id
@@ -2024,8 +2273,10 @@ INSERT INTO newsource
                           ,x1.f_peak
                       FROM extractedsource x1
                       WHERE x1.image = %(image_id)s
-                      AND x1.id NOT IN (SELECT xtrsrc FROM temprunningcatalog)
                       AND x1.extract_type = 0
+                      AND NOT EXISTS (SELECT 1
+                                        FROM temprunningcatalog tmprc
+                                       WHERE tmprc.xtrsrc = x1.id)
                     ) unassoc_xtr
                    ,runningcatalog runcat1
                    ,assocskyrgn asky1
@@ -2038,7 +2289,9 @@ INSERT INTO newsource
                 AND prev_imgs.skyrgn = asky1.skyrgn
                 AND prev_imgs.band = this_img.band
                 AND this_img.taustart_ts > prev_imgs.taustart_ts
-                AND prev_imgs.id NOT IN (select image from rejection)
+                AND NOT EXISTS (SELECT 1
+                                  FROM rejection rj
+                                 WHERE rj.image = prev_imgs.id)
          ) matched_imgs
   ) ordered_matched_imgs
   WHERE row_num = 1
@@ -2079,6 +2332,16 @@ def _delete_inactive_runcat():
     they can be deleted from the temporary table and
     the runningcatalog.
     """
+    for table in ('lightcurve_summary', 'transient_candidate'):
+        query = """\
+DELETE
+  FROM %s
+ WHERE runcat IN (SELECT id
+                    FROM runningcatalog
+                   WHERE inactive = TRUE
+                 )
+""" % table
+        tkp.db.execute(query, commit=True)
     query = """\
 DELETE
   FROM runningcatalog
@@ -2086,3 +2349,206 @@ DELETE
 """
     tkp.db.execute(query, commit=True)
 
+
+
+# The datapoints which an image adds to the lightcurves and which are not in
+# the summaries yet, with the band and time of the image.
+_IMAGE_DATAPOINTS = """\
+SELECT a.runcat
+      ,i.band
+      ,i.stokes
+      ,a.xtrsrc
+      ,i.taustart_ts
+      ,x.f_int
+      ,a.v_int
+      ,a.eta_int
+  FROM assocxtrsource a
+      ,extractedsource x
+      ,image i
+ WHERE a.xtrsrc = x.id
+   AND x.image = i.id
+   AND i.id = %(image_id)s
+   AND a.summarised = FALSE
+"""
+
+# Welford's update of the running mean and sum of squared deviations, and a
+# stochastic approximation of the median, which moves towards each new
+# datapoint by the standard deviation over the number of earlier datapoints.
+# On the right hand side, s holds the values from before the update.
+_SUMMARY_SET = """\
+   SET datapoints = s.datapoints + 1
+      ,avg_f_int = s.avg_f_int + (n.f_int - s.avg_f_int) / (s.datapoints + 1)
+      ,m2_f_int = s.m2_f_int + (n.f_int - s.avg_f_int) * (n.f_int - s.avg_f_int)
+                               * s.datapoints / (s.datapoints + 1)
+      ,median_f_int = s.median_f_int
+                      + SIGN(n.f_int - s.median_f_int)
+                        * SQRT((s.m2_f_int + (n.f_int - s.avg_f_int)
+                                             * (n.f_int - s.avg_f_int)
+                                             * s.datapoints / (s.datapoints + 1)
+                               ) / (s.datapoints + 1)
+                              ) / s.datapoints
+      ,max_f_int = CASE WHEN n.f_int > s.max_f_int
+                        THEN n.f_int
+                        ELSE s.max_f_int
+                   END
+      ,last_xtrsrc = CASE WHEN n.taustart_ts >= s.last_taustart_ts
+                          THEN n.xtrsrc
+                          ELSE s.last_xtrsrc
+                     END
+      ,last_taustart_ts = CASE WHEN n.taustart_ts >= s.last_taustart_ts
+                               THEN n.taustart_ts
+                               ELSE s.last_taustart_ts
+                          END
+      ,last_f_int = CASE WHEN n.taustart_ts >= s.last_taustart_ts
+                         THEN n.f_int
+                         ELSE s.last_f_int
+                    END
+      ,last_v_int = CASE WHEN n.taustart_ts >= s.last_taustart_ts
+                         THEN n.v_int
+                         ELSE s.last_v_int
+                    END
+      ,last_eta_int = CASE WHEN n.taustart_ts >= s.last_taustart_ts
+                           THEN n.eta_int
+                           ELSE s.last_eta_int
+                      END
+"""
+
+UPDATE_LIGHTCURVE_SUMMARY_QUERY = {
+    'monetdb': """\
+MERGE INTO lightcurve_summary s
+USING (%s) n
+   ON s.runcat = n.runcat
+  AND s.band = n.band
+  AND s.stokes = n.stokes
+ WHEN MATCHED THEN
+      UPDATE
+%s""" % (_IMAGE_DATAPOINTS, _SUMMARY_SET),
+    None: """\
+UPDATE lightcurve_summary s
+%s  FROM (%s) n
+ WHERE s.runcat = n.runcat
+   AND s.band = n.band
+   AND s.stokes = n.stokes
+""" % (_SUMMARY_SET, _IMAGE_DATAPOINTS),
+}
+
+# Lightcurves without a summary yet are summarised from their full history,
+# in every band. These are the lightcurves of new sources, which have a
+# single datapoint, and those of sources replacing another in a one-to-many
+# association, which have the history of the source they replace. The last
+# datapoint of a band is the latest one, or of those at the same time, the
+# one with the highest id.
+INSERT_LIGHTCURVE_SUMMARY_QUERY = """\
+INSERT INTO lightcurve_summary
+  (runcat
+  ,band
+  ,stokes
+  ,datapoints
+  ,last_xtrsrc
+  ,last_taustart_ts
+  ,last_f_int
+  ,last_v_int
+  ,last_eta_int
+  ,max_f_int
+  ,avg_f_int
+  ,m2_f_int
+  ,median_f_int
+  )
+  SELECT h.runcat
+        ,h.band
+        ,h.stokes
+        ,h.datapoints
+        ,l.xtrsrc
+        ,h.last_taustart_ts
+        ,x.f_int
+        ,l.v_int
+        ,l.eta_int
+        ,h.max_f_int
+        ,h.avg_f_int
+        ,h.m2_f_int
+        ,h.median_f_int
+    FROM (SELECT a.runcat
+                ,i.band
+                ,i.stokes
+                ,COUNT(*) AS datapoints
+                ,MAX(i.taustart_ts) AS last_taustart_ts
+                ,MAX(x.f_int) AS max_f_int
+                ,AVG(x.f_int) AS avg_f_int
+                ,CASE WHEN SUM(x.f_int * x.f_int) > COUNT(*) * AVG(x.f_int) * AVG(x.f_int)
+                      THEN SUM(x.f_int * x.f_int) - COUNT(*) * AVG(x.f_int) * AVG(x.f_int)
+                      ELSE 0
+                 END AS m2_f_int
+                ,{median}(x.f_int) AS median_f_int
+            FROM assocxtrsource a
+                ,extractedsource x
+                ,image i
+           WHERE a.xtrsrc = x.id
+             AND x.image = i.id
+             AND a.runcat IN (SELECT a0.runcat
+                                FROM assocxtrsource a0
+                                    ,extractedsource x0
+                               WHERE a0.xtrsrc = x0.id
+                                 AND x0.image = %(image_id)s
+                             )
+             AND NOT EXISTS (SELECT s.id
+                               FROM lightcurve_summary s
+                              WHERE s.runcat = a.runcat
+                                AND s.band = i.band
+                                AND s.stokes = i.stokes
+                            )
+          GROUP BY a.runcat
+                  ,i.band
+                  ,i.stokes
+         ) h
+        ,assocxtrsource l
+        ,extractedsource x
+   WHERE l.runcat = h.runcat
+     AND l.xtrsrc = x.id
+     AND l.xtrsrc = (SELECT MAX(a1.xtrsrc)
+                       FROM assocxtrsource a1
+                           ,extractedsource x1
+                           ,image i1
+                      WHERE a1.runcat = h.runcat
+                        AND a1.xtrsrc = x1.id
+                        AND x1.image = i1.id
+                        AND i1.band = h.band
+                        AND i1.stokes = h.stokes
+                        AND i1.taustart_ts = h.last_taustart_ts
+                    )
+"""
+
+# The datapoints of an image are marked once they are in the summaries, so
+# that they are added only once however often the summaries are updated.
+MARK_SUMMARISED_QUERY = """\
+UPDATE assocxtrsource
+   SET summarised = TRUE
+ WHERE summarised = FALSE
+   AND xtrsrc IN (SELECT id
+                    FROM extractedsource
+                   WHERE image = %(image_id)s
+                 )
+"""
+
+MEDIAN_FUNCTION = {
+    'monetdb': 'sys.median',
+    None: 'median',
+}
+
+
+def _update_lightcurve_summary(image_id):
+    """
+    Add the datapoints of an image to the lightcurve summaries of the
+    sources they are associated with.
+
+    This is safe to call more than once for an image, for example after
+    each of the blind extractions, null detections and monitoring sources
+    have been associated: datapoints are marked as summarised, and only
+    added once.
+    """
+    query = _dialect(UPDATE_LIGHTCURVE_SUMMARY_QUERY)
+    tkp.db.execute(query, {'image_id': image_id}, commit=True)
+    query = INSERT_LIGHTCURVE_SUMMARY_QUERY.format(
+        median=_dialect(MEDIAN_FUNCTION))
+    tkp.db.execute(query, {'image_id': image_id}, commit=True)
+    tkp.db.execute(MARK_SUMMARISED_QUERY, {'image_id': image_id},
+                   commit=True)
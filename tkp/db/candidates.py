@@ -0,0 +1,115 @@
+"""
+A collection of back end subroutines (mostly SQL queries).
+
+This module maintains the transient_candidate table, a materialized copy of
+the augmented_runningcatalog view. Rather than evaluate the view for a whole
+dataset whenever transients are listed, the pipeline refreshes the rows of
+the sources which were associated in each timestep, and the listing reads
+the table (see :func:`tkp.db.alchemy.transient_candidates`).
+"""
+import logging
+import tkp.db
+
+
+logger = logging.getLogger(__name__)
+
+# Columns of the view, in the order they are copied to the table.
+CANDIDATE_COLUMNS = (
+    'wm_ra', 'wm_decl', 'wm_uncertainty_ew', 'wm_uncertainty_ns', 'xtrsrc',
+    'dataset', 'datapoints', 'v_int', 'eta_int', 'band', 'newsource',
+    'sigma_rms_max', 'sigma_rms_min', 'lightcurve_max', 'lightcurve_avg',
+    'lightcurve_median')
+
+# The running catalog sources with a datapoint in any of the images.
+_ASSOCIATED_RUNCATS = """\
+SELECT a.runcat
+  FROM assocxtrsource a
+      ,extractedsource x
+ WHERE a.xtrsrc = x.id
+   AND x.image IN (%s)
+"""
+
+
+def refresh(image_ids):
+    """
+    Refresh the candidates of the sources with a datapoint in any of the
+    images, typically those of a timestep after association and forced
+    fitting.
+
+    Candidates of sources which are no longer in the running catalog are
+    removed along with the sources, see
+    :func:`tkp.db.associations._delete_inactive_runcat`.
+
+    Returns:
+        int: number of candidates inserted
+    """
+    if not image_ids:
+        return 0
+    runcats = _ASSOCIATED_RUNCATS % ", ".join(["%s"] * len(image_ids))
+    query = """\
+DELETE
+  FROM transient_candidate
+ WHERE runcat IN (%s)
+""" % runcats
+    tkp.db.execute(query, tuple(image_ids), commit=True)
+
+    columns = ", ".join(CANDIDATE_COLUMNS)
+    query = """\
+INSERT INTO transient_candidate
+  (runcat, %s)
+  SELECT id, %s
+    FROM augmented_runningcatalog
+   WHERE id IN (%s)
+""" % (columns, columns, runcats)
+    cursor = tkp.db.execute(query, tuple(image_ids), commit=True)
+    logger.debug("Refreshed %s transient candidates" % cursor.rowcount)
+    return cursor.rowcount
+
+
+def rebuild(dataset_id):
+    """
+    Replace all the candidates of a dataset by the contents of the view.
+    """
+    tkp.db.execute("DELETE FROM transient_candidate WHERE dataset = %s",
+                   (dataset_id,), commit=True)
+    columns = ", ".join(CANDIDATE_COLUMNS)
+    query = """\
+INSERT INTO transient_candidate
+  (runcat, %s)
+  SELECT id, %s
+    FROM augmented_runningcatalog
+   WHERE dataset = %%s
+""" % (columns, columns)
+    tkp.db.execute(query, (dataset_id,), commit=True)
+
+
+def check(dataset_id):
+    """
+    Check that the candidates of a dataset match the view.
+
+    Returns:
+        bool: False if any candidate is missing, stale or superfluous,
+        otherwise True.
+    """
+    columns = ", ".join(CANDIDATE_COLUMNS)
+    view = """\
+SELECT id, %s
+  FROM augmented_runningcatalog
+ WHERE dataset = %%(dataset)s
+""" % columns
+    table = """\
+SELECT runcat, %s
+  FROM transient_candidate
+ WHERE dataset = %%(dataset)s
+""" % columns
+    consistent = True
+    for first, second, problem in ((view, table, "missing or stale"),
+                                   (table, view, "superfluous or stale")):
+        query = "SELECT COUNT(*) FROM (%s EXCEPT %s) t" % (first, second)
+        cursor = tkp.db.execute(query, {'dataset': dataset_id})
+        count = cursor.fetchone()[0]
+        if count:
+            logger.error("%s %s transient candidates in dataset %s" %
+                         (count, problem, dataset_id))
+            consistent = False
+    return consistent
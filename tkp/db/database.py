@@ -1,17 +1,31 @@
 
 import logging
+import math
+import os
+from contextlib import contextmanager
+
 import numpy
 import tkp.config
 from tkp.utility import substitute_inf
+from tkp.db.model import SCHEMA_VERSION
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 
 logger = logging.getLogger(__name__)
 
-# The version of the TKP DB schema which is assumed by the current tree.
-# Increment whenever the schema changes.
-DB_VERSION = 35
+# The version of the TKP DB schema which is assumed by the current tree. This
+# is the version of the schema model, increment SCHEMA_VERSION in
+# tkp.db.model whenever the schema changes.
+DB_VERSION = SCHEMA_VERSION
+
+# Connections inherited from a parent process. These are never closed, since
+# that would close the connections of the parent too; see
+# Database.connection.
+_inherited = []
+
+# Number of rows per statement when Database.copy() falls back to inserting.
+COPY_CHUNK_SIZE = 1000
 
 
 
@@ -51,6 +65,7 @@ class Database(object):
     An object representing a database connection.
     """
     _connection = None
+    _pid = None
     _configured = False
     transaction = None
     cursor = None
@@ -102,6 +117,7 @@ class Database(object):
                                              self.database),
                                             echo=False
                                             )
+        self._pid = os.getpid()
         self.Session = sessionmaker(bind=self.alchemy_engine)
         self._connection = self.alchemy_engine.connect()
         self._connection.execution_options(autocommit=False)
@@ -133,8 +149,17 @@ class Database(object):
 
         This is a property to be backwards compatible with the rest of TKP.
 
+        Each process has a connection of its own: a process which has
+        inherited the connection from its parent (as the workers started by
+        tkp.distribute do) sets it aside and connects afresh.
+
         :return: a database connection
         """
+        if self._connection and self._pid != os.getpid():
+            logger.debug("process %s inherited a database connection, "
+                         "reconnecting" % os.getpid())
+            self.close()
+            self.transaction = None
         if not self._connection:
             self.connect()
 
@@ -144,10 +169,14 @@ class Database(object):
 
     def close(self):
         """
-        close the connection if open
+        close the connection if open. A connection inherited from the parent
+        process is set aside rather than closed.
         """
-        if self._connection:
+        if self._connection and self._pid != os.getpid():
+            _inherited.append((self._connection, self.alchemy_engine))
+        elif self._connection:
             self._connection.close()
+            self.alchemy_engine.dispose()
         self._connection = None
 
     def vacuum(self, table):
@@ -164,6 +193,9 @@ class Database(object):
 
         if self.engine != "postgresql":
             return
+        if self.connection.in_transaction():
+            logger.debug("not vacuuming %s inside a transaction" % table)
+            return
 
         from psycopg2.extensions import (ISOLATION_LEVEL_AUTOCOMMIT,
                                             ISOLATION_LEVEL_READ_COMMITTED)
@@ -175,6 +207,75 @@ class Database(object):
         # reset settings
         self.connection.connection.set_isolation_level(ISOLATION_LEVEL_READ_COMMITTED)
 
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Group statements into a single transaction.
+
+        Inside the block, execute(..., commit=True) and copy() do not commit
+        by themselves: everything is committed when the block exits, or
+        rolled back if it raises. Blocks can be nested, only the outermost
+        one commits. Tables are not vacuumed inside the block.
+
+        Usage::
+
+            with Database().unit_of_work():
+                execute(query1, commit=True)
+                execute(query2, commit=True)
+        """
+        transaction = self.connection.begin()
+        try:
+            yield self
+        except:
+            transaction.rollback()
+            raise
+        else:
+            transaction.commit()
+
+    def copy(self, table, columns, rows):
+        """
+        Bulk insert rows into a table and commit.
+
+        On PostgreSQL the rows are streamed in with COPY FROM STDIN, on
+        MonetDB with COPY INTO from STDIN. Other databases, or a PostgreSQL
+        driver without COPY support, get the rows inserted in chunks of
+        COPY_CHUNK_SIZE with executemany.
+
+        args:
+            table: name of the table
+            columns: names of the columns, in the order of the values in rows
+            rows: list of sequences of values
+
+        returns: the number of rows inserted
+        """
+        if not rows:
+            return 0
+        column_list = ", ".join(columns)
+        raw_cursor = self.connection.connection.cursor()
+        transaction = self.connection.begin()
+        try:
+            if self.engine == "postgresql" and hasattr(raw_cursor, "copy_expert"):
+                query = "COPY %s (%s) FROM STDIN" % (table, column_list)
+                raw_cursor.copy_expert(query, _CopyStream(rows))
+            elif self.engine == "monetdb":
+                query = ("COPY %d RECORDS INTO %s (%s) FROM STDIN "
+                         "USING DELIMITERS '\\t', '\\n' NULL AS '\\\\N';\n" %
+                         (len(rows), table, column_list))
+                raw_cursor.execute(query + "".join(_CopyStream(rows)))
+            else:
+                query = "INSERT INTO %s (%s) VALUES (%s)" % (
+                    table, column_list, ", ".join(["%s"] * len(columns)))
+                for start in range(0, len(rows), COPY_CHUNK_SIZE):
+                    self.connection.execute(
+                        query, [sanitize_db_inputs(row) for row in
+                                rows[start:start + COPY_CHUNK_SIZE]])
+            transaction.commit()
+        except Exception as e:
+            logger.error("Bulk insert into %s failed: %s" % (table, e))
+            transaction.rollback()
+            raise
+        return len(rows)
+
     def execute(self, query, parameters={}, commit=False):
         if commit:
            self.transaction = self.connection.begin()
@@ -193,6 +294,57 @@ class Database(object):
             self.transaction.rollback()
 
     def reconnect(self):
-        self._connection.close()
+        self.close()
         self.connect()
 
+
+def _copy_value(value):
+    """
+    Format a value for the text format of COPY, with \\N for NULL.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (float, numpy.floating)):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "Infinity" if value > 0 else "-Infinity"
+        return repr(float(value))
+    if isinstance(value, basestring):
+        return (value.replace("\\", "\\\\").replace("\t", "\\t")
+                .replace("\n", "\\n").replace("\r", "\\r"))
+    return str(value)
+
+
+class _CopyStream(object):
+    """
+    Rows in the text format of COPY, as a file-like object for
+    cursor.copy_expert() or as an iterator over lines.
+    """
+    def __init__(self, rows):
+        self._lines = ("\t".join(_copy_value(v) for v in row) + "\n"
+                       for row in rows)
+        self._buffer = ""
+
+    def __iter__(self):
+        return self._lines
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        if self._buffer:
+            data, self._buffer = self._buffer, ""
+            return data
+        return next(self._lines, "")
@@ -9,10 +9,12 @@ import math
 import logging
 import itertools
 
+import numpy
+
 import tkp.db
-from tkp.utility.coordinates import eq_to_cart
-from tkp.utility.coordinates import alpha_inflate
-from tkp.utility import substitute_inf
+from tkp.utility.coordinates import eq_to_cart_array
+from tkp.utility.coordinates import alpha_inflate_array
+from tkp.utility import substitute_nan
 
 
 logger = logging.getLogger(__name__)
@@ -179,6 +181,19 @@ def insert_image(dataset, freq_eff, freq_bw,
     image_id = cursor.fetchone()[0]
     return image_id
 
+# Columns of extractedsource, in the order insert_extracted_sources() gives
+# the values.
+EXTRACTEDSOURCE_COLUMNS = (
+    'ra', 'decl', 'ra_fit_err', 'decl_fit_err', 'f_peak', 'f_peak_err',
+    'f_int', 'f_int_err', 'det_sigma', 'semimajor', 'semiminor', 'pa',
+    'ew_sys_err', 'ns_sys_err', 'error_radius', 'fit_type', 'chisq',
+    'reduced_chisq', 'ra_err', 'decl_err', 'uncertainty_ew',
+    'uncertainty_ns', 'image', 'zone', 'x', 'y', 'z', 'racosdecl',
+    'extract_type', 'ff_runcat', 'ff_monitor')
+
+# Values of extractedsource.extract_type
+EXTRACT_TYPES = {'blind': 0, 'ff_nd': 1, 'ff_ms': 2}
+
 
 def insert_extracted_sources(image_id, results, extract_type,
                              ff_runcat_ids=None, ff_monitor_ids=None):
@@ -249,104 +264,70 @@ def insert_extracted_sources(image_id, results, extract_type,
                     " image %s" % (extract_type, image_id))
         return
 
+    try:
+        extract_type_code = EXTRACT_TYPES[extract_type]
+    except KeyError:
+        raise ValueError("Not a valid extractedsource insert type: '%s'"
+                         % extract_type)
+    if ff_runcat_ids is not None:
+        assert len(results) == len(ff_runcat_ids)
+    if ff_monitor_ids is not None:
+        assert len(results) == len(ff_monitor_ids)
+
+    # Blind extractions arrive as a structured array, see
+    # tkp.sourcefinder.extract.DetectionBatch.serialize(), which stores the
+    # missing chisq of non-Gaussian fits as NaN.
+    columnar = hasattr(results, 'dtype')
+    if columnar:
+        results = results.tolist()
+    measured = numpy.array([src[:16] for src in results], dtype=float)
+
+    # Drop any fits with infinite flux errors
+    keep = ~(numpy.isinf(measured[:, 5]) | numpy.isinf(measured[:, 7]))
+    for ra, decl in measured[~keep, :2]:
+        logger.warn("Dropped source fit with infinite flux errors "
+                    "at position %s %s" % (ra, decl))
+    measured = measured[keep]
+    ra, decl = measured[:, 0], measured[:, 1]
+    ew_sys_err, ns_sys_err = measured[:, 12], measured[:, 13]
+    # Use 360 degree rather than infinite uncertainty for
+    # unconstrained positions.
+    error_radius = numpy.where(numpy.isinf(measured[:, 14]), 360.0,
+                               measured[:, 14])
+
+    # The derived columns, see the docstring. Positional errors are in
+    # degrees, the systematic errors and error_radius in arcsec.
+    ra_err = numpy.sqrt(measured[:, 2]**2 +
+                        alpha_inflate_array(ew_sys_err/3600., decl)**2)
+    decl_err = numpy.sqrt(measured[:, 3]**2 + (ns_sys_err/3600.)**2)
+    uncertainty_ew = numpy.sqrt(ew_sys_err**2 + error_radius**2)/3600.
+    uncertainty_ns = numpy.sqrt(ns_sys_err**2 + error_radius**2)/3600.
+    zone = numpy.floor(decl).astype(int)
+    x, y, z = eq_to_cart_array(ra, decl)
+    racosdecl = ra * numpy.cos(numpy.radians(decl))
+    derived = zip(ra_err.tolist(), decl_err.tolist(),
+                  uncertainty_ew.tolist(), uncertainty_ns.tolist(),
+                  zone.tolist(), x.tolist(), y.tolist(), z.tolist(),
+                  racosdecl.tolist())
+
     xtrsrc = []
-    for i, src in enumerate(results):
-        r = list(src)
-        # Drop any fits with infinite flux errors
-        if math.isinf(r[5]) or math.isinf(r[7]):
-            logger.warn("Dropped source fit with infinite flux errors "
-                        "at position %s %s" % (r[0], r[1]))
-            continue
-        # Use 360 degree rather than infinite uncertainty for
-        # unconstrained positions.
-        r[14] = substitute_inf(r[14], 360.0)
-        r[15] = int(r[15])
-        # ra_err: sqrt of quadratic sum of fitted and systematic errors.
-        r.append(math.sqrt(r[2]**2 + alpha_inflate(r[12]/3600., r[1])**2))
-        # decl_err: sqrt of quadratic sum of fitted and systematic errors.
-        r.append(math.sqrt(r[3]**2 + (r[13]/3600.)**2))
-        # uncertainty_ew: sqrt of quadratic sum of systematic error and error_radius
-        # divided by 3600 because uncertainty in degrees and others in arcsec.
-        r.append(math.sqrt(r[12]**2 + r[14]**2)/3600.)
-        # uncertainty_ns: sqrt of quadratic sum of systematic error and error_radius
-        # divided by 3600 because uncertainty in degrees and others in arcsec.
-        r.append(math.sqrt(r[13]**2 + r[14]**2)/3600.)
-        r.append(image_id) # id of the image
-        r.append(int(math.floor(r[1]))) # zone
-        r.extend(eq_to_cart(r[0], r[1])) # Cartesian x,y,z
-        r.append(r[0] * math.cos(math.radians(r[1]))) # ra * cos(radians(decl))
-        if extract_type == 'blind':
-            r.append(0)
-        elif extract_type == 'ff_nd':
-            r.append(1)
-        elif extract_type == 'ff_ms':
-            r.append(2)
-        else:
-            raise ValueError("Not a valid extractedsource insert type: '%s'"
-                             % extract_type)
-        if ff_runcat_ids is not None:
-            assert len(results)==len(ff_runcat_ids)
-            r.append(ff_runcat_ids[i])
-        else:
-            r.append(None)
-
-        if ff_monitor_ids is not None:
-            assert len(results)==len(ff_monitor_ids)
-            r.append(ff_monitor_ids[i])
-        else:
-            r.append(None)
-
-        xtrsrc.append(r)
-
-    insertion_query = """\
-INSERT INTO extractedsource
-  (ra
-  ,decl
-  ,ra_fit_err
-  ,decl_fit_err
-  ,f_peak
-  ,f_peak_err
-  ,f_int
-  ,f_int_err
-  ,det_sigma
-  ,semimajor
-  ,semiminor
-  ,pa
-  ,ew_sys_err
-  ,ns_sys_err
-  ,error_radius
-  ,fit_type
-  ,chisq
-  ,reduced_chisq
-  ,ra_err
-  ,decl_err
-  ,uncertainty_ew
-  ,uncertainty_ns
-  ,image
-  ,zone
-  ,x
-  ,y
-  ,z
-  ,racosdecl
-  ,extract_type
-  ,ff_runcat
-  ,ff_monitor
-  )
-VALUES {placeholder}
-"""
-    if xtrsrc:
-        cols_per_row = len(xtrsrc[0])
-        placeholder_per_row = '('+ ','.join(['%s']*cols_per_row) +')'
-
-        placeholder_full = ','.join([placeholder_per_row]*len(xtrsrc))
-
-        query = insertion_query.format(placeholder= placeholder_full)
-        cursor = tkp.db.execute(query, tuple(itertools.chain.from_iterable(xtrsrc)),
-                                commit=True)
-        insert_num = cursor.rowcount
-        #if insert_num == 0:
-        #    logger.info("No forced-fit sources added to extractedsource for "
-        #                "image %s" % (image_id,))
+    kept = [i for i in range(len(results)) if keep[i]]
+    for i, radius, extra in zip(kept, error_radius.tolist(), derived):
+        r = list(results[i][:18])
+        chisq, reduced_chisq = r[16], r[17]
+        if columnar:
+            chisq = substitute_nan(chisq, None)
+            reduced_chisq = substitute_nan(reduced_chisq, None)
+        xtrsrc.append(
+            r[:14] + [radius, int(r[15]), chisq, reduced_chisq] +
+            list(extra[:4]) + [image_id] + list(extra[4:]) +
+            [extract_type_code,
+             ff_runcat_ids[i] if ff_runcat_ids is not None else None,
+             ff_monitor_ids[i] if ff_monitor_ids is not None else None])
+
+    insert_num = tkp.db.Database().copy('extractedsource',
+                                        EXTRACTEDSOURCE_COLUMNS, xtrsrc)
+    if insert_num:
         if extract_type == 'blind':
             logger.info("Inserted %d sources in extractedsource for image %s" %
                         (insert_num, image_id))
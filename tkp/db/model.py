@@ -3,6 +3,14 @@ The SQLAlchemy model definition.
 
 revision history:
 
+ 42 - add summarised column to assocxtrsource
+ 41 - add composite (image, zone, decl) index to extractedsource and a
+      partial (dataset, zone, wm_decl) index on active runningcatalog rows
+      for association
+ 40 - add first_taustart_ts column to runningcatalog, composite indexes for
+      the null detection and new source lookups
+ 39 - add transient_candidate table
+ 38 - add lightcurve_summary table
  37 - add forcedfits_count column to runningcatalog
  36 - switch to SQLAlchemy schema initialisation
 """
@@ -15,7 +23,7 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION as Double
 
 
-SCHEMA_VERSION = 37
+SCHEMA_VERSION = 42
 
 Base = declarative_base()
 metadata = Base.metadata
@@ -23,6 +31,9 @@ metadata = Base.metadata
 
 class Assocskyrgn(Base):
     __tablename__ = 'assocskyrgn'
+    __table_args__ = (
+        Index('ix_assocskyrgn_skyrgn_runcat', 'skyrgn', 'runcat'),
+    )
 
     id = Column(Integer, primary_key=True)
     runcat_id = Column('runcat', ForeignKey('runningcatalog.id'), nullable=False, index=True)
@@ -56,6 +67,7 @@ class Assocxtrsource(Base):
     v_int = Column(Double, nullable=False)
     eta_int = Column(Double, nullable=False)
     f_datapoints = Column(Integer, nullable=False)
+    summarised = Column(Boolean, nullable=False, server_default=text("false"))
 
 
 class Config(Base):
@@ -105,6 +117,9 @@ MONITORED_FIT = 2
 
 class Extractedsource(Base):
     __tablename__ = 'extractedsource'
+    __table_args__ = (
+        Index('ix_extractedsource_image_zone_decl', 'image', 'zone', 'decl'),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -169,6 +184,10 @@ seq_image = Sequence('seq_image')
 
 class Image(Base):
     __tablename__ = 'image'
+    __table_args__ = (
+        Index('ix_image_skyrgn_band_taustart_ts', 'skyrgn', 'band',
+              'taustart_ts'),
+    )
 
     id = Column(Integer, seq_image, primary_key=True,
                 server_default=seq_image.next_value())
@@ -205,6 +224,39 @@ class Image(Base):
     nodes = Column(SmallInteger, nullable=False, server_default=text("1"))
 
 
+# Summary of the lightcurve of a runcat source in a band, kept up to date at
+# association time, see tkp.db.associations._update_lightcurve_summary().
+class LightcurveSummary(Base):
+    __tablename__ = 'lightcurve_summary'
+    __table_args__ = (
+        Index('lightcurve_summary_runcat_band_stokes_key', 'runcat', 'band',
+              'stokes', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+
+    runcat_id = Column('runcat', ForeignKey('runningcatalog.id'), nullable=False)
+    runcat = relationship('Runningcatalog')
+
+    band_id = Column('band', ForeignKey('frequencyband.id'), nullable=False, index=True)
+    band = relationship('Frequencyband')
+
+    stokes = Column(SmallInteger, nullable=False, server_default=text("1"))
+    datapoints = Column(Integer, nullable=False)
+
+    last_xtrsrc_id = Column('last_xtrsrc', ForeignKey('extractedsource.id'), nullable=False)
+    last_xtrsrc = relationship('Extractedsource')
+
+    last_taustart_ts = Column(DateTime, nullable=False)
+    last_f_int = Column(Double)
+    last_v_int = Column(Double)
+    last_eta_int = Column(Double)
+    max_f_int = Column(Double)
+    avg_f_int = Column(Double)
+    m2_f_int = Column(Double)
+    median_f_int = Column(Double)
+
+
 class Monitor(Base):
     __tablename__ = 'monitor'
 
@@ -277,6 +329,14 @@ class Rejectreason(Base):
 
 class Runningcatalog(Base):
     __tablename__ = 'runningcatalog'
+    __table_args__ = (
+        # The sources which take part in association, see
+        # tkp.db.associations._insert_temprunningcatalog. Other engines
+        # ignore the condition and index all rows.
+        Index('ix_runningcatalog_active_dataset_zone_wm_decl', 'dataset',
+              'zone', 'wm_decl',
+              postgresql_where=text("inactive = FALSE AND mon_src = FALSE")),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -304,6 +364,8 @@ class Runningcatalog(Base):
     inactive = Column(Boolean, nullable=False, server_default=text("false"))
     mon_src = Column(Boolean, nullable=False, server_default=text("false"))
     forcedfits_count = Column(Integer, server_default=text("0"))
+    # taustart_ts of the image of xtrsrc, i.e. when the source was first seen
+    first_taustart_ts = Column(DateTime)
 
     extractedsources = relationship('Extractedsource',
                                     secondary='assocxtrsource',
@@ -410,6 +472,42 @@ class Temprunningcatalog(Base):
     avg_weighted_f_int_sq = Column(Double)
 
 
+# The augmented_runningcatalog view, materialized by tkp.db.candidates.
+class TransientCandidate(Base):
+    __tablename__ = 'transient_candidate'
+
+    id = Column(Integer, primary_key=True)
+
+    runcat_id = Column('runcat', ForeignKey('runningcatalog.id'), nullable=False, index=True)
+    runcat = relationship('Runningcatalog')
+
+    xtrsrc_id = Column('xtrsrc', ForeignKey('extractedsource.id'), nullable=False)
+    xtrsrc = relationship('Extractedsource')
+
+    dataset_id = Column('dataset', ForeignKey('dataset.id'), nullable=False, index=True)
+    dataset = relationship('Dataset')
+
+    band_id = Column('band', ForeignKey('frequencyband.id'), nullable=False)
+    band = relationship('Frequencyband')
+
+    # Not a foreign key: newsources are deleted along with one-to-many
+    # associations before their candidates are.
+    newsource = Column(Integer)
+
+    wm_ra = Column(Double, nullable=False, index=True)
+    wm_decl = Column(Double, nullable=False, index=True)
+    wm_uncertainty_ew = Column(Double, nullable=False)
+    wm_uncertainty_ns = Column(Double, nullable=False)
+    datapoints = Column(Integer, nullable=False)
+    v_int = Column(Double, index=True)
+    eta_int = Column(Double, index=True)
+    sigma_rms_max = Column(Double, index=True)
+    sigma_rms_min = Column(Double, index=True)
+    lightcurve_max = Column(Double)
+    lightcurve_avg = Column(Double)
+    lightcurve_median = Column(Double)
+
+
 class Version(Base):
     __tablename__ = 'version'
 
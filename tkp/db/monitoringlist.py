@@ -12,7 +12,9 @@ from tkp.db.associations import (
     _update_1_to_1_runcat,
     ONE_TO_ONE_ASSOC_QUERY,
     _insert_1_to_1_runcat_flux,
-    _update_1_to_1_runcat_flux)
+    _update_1_to_1_runcat_flux,
+    _update_lightcurve_summary,
+    _transaction)
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +41,7 @@ SELECT id
     res = cursor.fetchall()
     return res
 
-def associate_ms(image_id):
+def associate_ms(image_id, transaction=False):
     """
     Associate the monitoring sources, i.e., their forced fits,
     of the current image with the ones in the running catalog.
@@ -55,31 +57,37 @@ def associate_ms(image_id):
     (assocxtrsource), with a type = 8 (for the first occurence)
     or type = 9 (for existing runcat sources).
     After all this, the temporary table is emptied again.
+
+    With transaction=True this is all done in a single transaction, see
+    :func:`tkp.db.associations.associate_extracted_sources`.
     """
 
-    _del_tempruncat()
+    with _transaction(transaction):
+        _del_tempruncat()
+
+        _insert_tempruncat(image_id)
 
-    _insert_tempruncat(image_id)
+        _insert_1_to_1_assoc()
+        _update_1_to_1_runcat()
 
-    _insert_1_to_1_assoc()
-    _update_1_to_1_runcat()
+        n_updated = _update_1_to_1_runcat_flux()
+        if n_updated:
+            logger.debug("Updated flux for %s monitor sources" % n_updated)
+        n_inserted = _insert_1_to_1_runcat_flux()
+        if n_inserted:
+            logger.debug("Inserted new-band flux measurement for %s monitor sources"
+                        % n_inserted)
 
-    n_updated = _update_1_to_1_runcat_flux()
-    if n_updated:
-        logger.debug("Updated flux for %s monitor sources" % n_updated)
-    n_inserted = _insert_1_to_1_runcat_flux()
-    if n_inserted:
-        logger.debug("Inserted new-band flux measurement for %s monitor sources"
-                    % n_inserted)
+        _insert_new_runcat(image_id)
+        _insert_new_runcat_flux(image_id)
 
-    _insert_new_runcat(image_id)
-    _insert_new_runcat_flux(image_id)
+        _insert_new_1_to_1_assoc(image_id)
 
-    _insert_new_1_to_1_assoc(image_id)
+        _update_monitor_runcats(image_id)
+        _update_lightcurve_summary(image_id)
 
-    _update_monitor_runcats(image_id)
+        _del_tempruncat()
 
-    _del_tempruncat()
 
 def _insert_tempruncat(image_id):
     """
@@ -349,6 +357,7 @@ INSERT INTO runningcatalog
   ,y
   ,z
   ,mon_src
+  ,first_taustart_ts
   )
   SELECT x.id AS xtrsrc
         ,i.dataset
@@ -368,6 +377,7 @@ INSERT INTO runningcatalog
         ,x.y
         ,x.z
         ,TRUE
+        ,i.taustart_ts
     FROM image i
          JOIN extractedsource x
            ON i.id = x.image
@@ -8,10 +8,40 @@ from tkp.db import execute as execute
 from tkp.db.associations import _empty_temprunningcatalog as _del_tempruncat
 from tkp.db.associations import (
     ONE_TO_ONE_ASSOC_QUERY, _insert_1_to_1_runcat_flux,
-    _update_1_to_1_runcat_flux)
+    _update_1_to_1_runcat_flux, _update_lightcurve_summary, _transaction)
 
 logger = logging.getLogger(__name__)
 
+# The null detections are the runcat sources associated with the sky region
+# of the current image which were first seen at an earlier timestamp,
+# irrespective of the band. That timestamp is kept in
+# runningcatalog.first_taustart_ts, so that we need not look up the first
+# extracted source of every runcat source and its image. The NOT EXISTS then
+# drops the runcat sources that have been associated with the extracted
+# sources of the current image. It is answered from the extracted sources of
+# this image alone, so its cost does not grow with the length of the light
+# curves.
+NULLDETECTIONS_QUERY = """\
+SELECT r.id
+      ,r.wm_ra
+      ,r.wm_decl
+  FROM image i
+      ,assocskyrgn a
+      ,runningcatalog r
+ WHERE i.id = %(image_id)s
+   AND a.skyrgn = i.skyrgn
+   AND r.id = a.runcat
+   AND r.forcedfits_count < %(expiration)s
+   AND r.first_taustart_ts < i.taustart_ts
+   AND NOT EXISTS (SELECT 1
+                     FROM extractedsource x
+                         ,assocxtrsource ax
+                    WHERE x.image = i.id
+                      AND ax.xtrsrc = x.id
+                      AND ax.runcat = r.id
+                  )
+"""
+
 
 def get_nulldetections(image_id, expiration=10):
     """
@@ -38,50 +68,13 @@ def get_nulldetections(image_id, expiration=10):
     Returns: list of tuples [(runcatid, ra, decl)]
     """
 
-    # The first temptable t0 looks for runcat sources that have been seen
-    # in the same sky region as the current image,
-    # but at an earlier timestamp, irrespective of the band.
-    # The second temptable t1 returns the runcat source ids for those sources
-    # that have an association with the current extracted sources.
-    # The left outer join in combination with the t1.runcat IS NULL then
-    # returns the runcat sources that could not be associated.
-
-    query = """\
-SELECT t0.id
-      ,t0.wm_ra
-      ,t0.wm_decl
-  FROM (SELECT r0.id
-              ,r0.wm_ra
-              ,r0.wm_decl
-          FROM image i0
-              ,assocskyrgn a0
-              ,runningcatalog r0
-              ,extractedsource x0
-              ,image i1
-         WHERE i0.id = %(image_id)s
-           AND a0.skyrgn = i0.skyrgn
-           AND r0.id = a0.runcat
-           AND r0.forcedfits_count < %(expiration)s
-           AND x0.id = r0.xtrsrc
-           AND i1.id = x0.image
-           AND i0.taustart_ts > i1.taustart_ts
-       ) t0
-       LEFT OUTER JOIN (SELECT a.runcat
-                          FROM extractedsource x
-                              ,assocxtrsource a
-                         WHERE x.image = %(image_id)s
-                           AND a.xtrsrc = x.id
-                       ) t1
-       ON t0.id = t1.runcat
- WHERE t1.runcat IS NULL
-"""
     qry_params = {'image_id': image_id, 'expiration': expiration}
-    cursor = execute(query, qry_params)
+    cursor = execute(NULLDETECTIONS_QUERY, qry_params)
     res = cursor.fetchall()
     return res
 
 
-def associate_nd(image_id):
+def associate_nd(image_id, transaction=False):
     """
     Associate the null detections (ie forced fits) of the current image.
 
@@ -92,21 +85,26 @@ def associate_nd(image_id):
     already existed, otherwise it is inserted as a new datapoint.
     (We leave the runcat table unchanged.)
     After all this, the temporary table is emptied again.
+
+    With transaction=True this is all done in a single transaction, see
+    :func:`tkp.db.associations.associate_extracted_sources`.
     """
 
-    _del_tempruncat()
-    _insert_tempruncat(image_id)
-    _insert_1_to_1_assoc()
-    _increment_forcedfits_count()
+    with _transaction(transaction):
+        _del_tempruncat()
+        _insert_tempruncat(image_id)
+        _insert_1_to_1_assoc()
+        _increment_forcedfits_count()
 
-    n_updated = _update_1_to_1_runcat_flux()
-    if n_updated:
-        logger.debug("Updated flux for %s null_detections" % n_updated)
-    n_inserted = _insert_1_to_1_runcat_flux()
-    if n_inserted:
-        logger.debug("Inserted new-band flux measurement for %s null_detections"
-                    % n_inserted)
-    _del_tempruncat()
+        n_updated = _update_1_to_1_runcat_flux()
+        if n_updated:
+            logger.debug("Updated flux for %s null_detections" % n_updated)
+        n_inserted = _insert_1_to_1_runcat_flux()
+        if n_inserted:
+            logger.debug("Inserted new-band flux measurement for %s null_detections"
+                        % n_inserted)
+        _update_lightcurve_summary(image_id)
+        _del_tempruncat()
 
 
 def _increment_forcedfits_count():
@@ -11,6 +11,22 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def affinity_key(item):
+    """
+    The image a task item refers to: either an image url, or a list or tuple
+    starting with one, such as the list of a single url of the persistence
+    step or the (url, positions, ids) of forced fitting. Returns None for
+    anything else. Distribution methods use this to send the tasks for an
+    image to where it is already open.
+    """
+    if isinstance(item, basestring):
+        return item
+    if isinstance(item, (list, tuple)) and item \
+            and isinstance(item[0], basestring):
+        return item[0]
+    return None
+
+
 class Runner(object):
     def __init__(self, distributor, cores=0):
         """
@@ -41,9 +57,60 @@ class Runner(object):
         func = self.get_func(func_name)
         return self.module.map(func, iterable, args)
 
+    def map_async(self, func_name, iterable, args=[]):
+        """
+        Like map(), but returns at once, so that the caller can carry on
+        while the tasks run.
+
+        returns:
+            an object whose get() method waits for the results of all mapped
+            functions and returns them. Distribution methods without a
+            map_async function run the tasks when get() is called.
+        """
+        func = self.get_func(func_name)
+        if hasattr(self.module, 'map_async'):
+            return self.module.map_async(func, iterable, args)
+        return _Deferred(self.module.map, func, iterable, args)
+
+    def imap(self, func_name, iterable, args=[], chunksize=1):
+        """
+        Like map(), but generates the results as the tasks finish, in order.
+
+        args:
+            chunksize: number of items handed to a worker at a time
+        returns:
+            an iterator over the results of all mapped functions. Only a
+            limited number of tasks is in flight at once, so that the results
+            don't pile up if they are used as they come.
+        """
+        func = self.get_func(func_name)
+        if hasattr(self.module, 'imap'):
+            return self.module.imap(func, iterable, args, chunksize)
+        return iter(self.module.map(func, iterable, args))
+
+    def imap_unordered(self, func_name, iterable, args=[], chunksize=1):
+        """
+        Like imap(), but the results are generated in the order in which the
+        tasks finish, rather than in the order of iterable.
+        """
+        func = self.get_func(func_name)
+        if hasattr(self.module, 'imap_unordered'):
+            return self.module.imap_unordered(func, iterable, args, chunksize)
+        return self.imap(func_name, iterable, args, chunksize)
+
     def get_func(self, func_name):
         try:
             return getattr(self.tasks, func_name)
         except AttributeError:
             raise NotImplementedError('%s not implemented for %s' %
                                       (func_name, self.mod_path))
+
+
+class _Deferred(object):
+    """The results of a map which is only run when they are asked for."""
+    def __init__(self, map, func, iterable, args):
+        self._call = (map, func, iterable, args)
+
+    def get(self):
+        map, func, iterable, args = self._call
+        return map(func, iterable, args)
@@ -0,0 +1,299 @@
+"""
+A computation distribution implementation which sends the tasks to worker
+processes on any number of nodes, over sockets.
+
+The pipeline listens on the address given by the ``TKP_CLUSTER_ADDRESS``
+environment variable (``host:port``, by default all interfaces on port
+5555). Workers are started on the nodes with::
+
+  $ trap-manage.py worker <master host>:<port>
+
+Both ends need the same secret in ``TKP_CLUSTER_AUTHKEY``, since the tasks
+and results are pickled.
+
+Each worker connection runs one task at a time. A task goes preferably to a
+worker which had its image before, so that it can use the session it keeps
+(see :mod:`tkp.steps.session`), or to a worker which declared the image path
+local to its node. If no such worker is free in time, any worker takes it.
+When a worker is lost, its task is handed to another one, up to
+MAX_ATTEMPTS times.
+"""
+import atexit
+import cPickle
+import logging
+import os
+import threading
+import time
+from collections import deque, OrderedDict
+from itertools import count
+from multiprocessing.connection import Listener, AuthenticationError
+
+from tkp.distribute import affinity_key
+import tkp.steps.session
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = ':5555'
+
+# Number of workers a task may be given to before it is considered failed.
+MAX_ATTEMPTS = 3
+
+# Seconds a task waits for a worker which has its image, before any worker
+# may take it.
+LOCALITY_WAIT = 1
+
+# Seconds between warnings while there are tasks but no workers.
+WORKER_WAIT = 60
+
+scheduler = None
+
+
+def parse_address(address):
+    """Turn 'host:port' into a (host, port) tuple."""
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def get_authkey():
+    authkey = os.environ.get('TKP_CLUSTER_AUTHKEY')
+    if not authkey:
+        raise RuntimeError("set TKP_CLUSTER_AUTHKEY to a secret shared with "
+                           "the workers")
+    return authkey
+
+
+class _Task(object):
+    def __init__(self, call, index, func_name, item, pickled_args):
+        self.call = call
+        self.index = index
+        self.func_name = func_name
+        self.item = item
+        self.pickled_args = pickled_args
+        self.key = affinity_key(item)
+        self.attempts = 0
+        self.queued = time.time()
+
+
+class _Worker(object):
+    """A connected worker process, as seen from the scheduler."""
+    def __init__(self, host, local):
+        self.host = host
+        self.local = tuple(local)
+        self.seen = OrderedDict()
+
+    def prefers(self, task):
+        """Whether task concerns an image this worker has, or has at hand."""
+        if task.key is None:
+            return False
+        return task.key in self.seen or task.key.startswith(self.local)
+
+    def remember(self, task):
+        if task.key is not None:
+            self.seen.pop(task.key, None)
+            self.seen[task.key] = True
+            while len(self.seen) > tkp.steps.session.CACHE_SIZE:
+                self.seen.popitem(last=False)
+
+
+class AsyncResult(object):
+    """The results of a map which was started with map_async()."""
+    def __init__(self, scheduler, call, size):
+        self._scheduler = scheduler
+        self._call = call
+        self._size = size
+
+    def get(self):
+        """Wait for all results and return them, in order."""
+        return self._scheduler._collect(self._call, self._size)
+
+
+class Scheduler(object):
+    """
+    Hands out tasks to the workers which connect to address.
+
+    Args:
+        address (tuple): (host, port) to listen on. Use port 0 to pick a
+            free port, see the address attribute.
+        authkey (str): secret shared with the workers
+    """
+    def __init__(self, address, authkey):
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        logger.info("waiting for workers on %s:%s" % self.address)
+        self._condition = threading.Condition()
+        self._tasks = deque()
+        self._results = {}
+        self._calls = count()
+        self.workers = []
+        self._closed = False
+        accepter = threading.Thread(target=self._accept, name="accept")
+        accepter.daemon = True
+        accepter.start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except (AuthenticationError, EOFError, IOError) as e:
+                if not self._closed:
+                    logger.warn("refused a worker: %s" % e)
+                continue
+            thread = threading.Thread(target=self._serve, args=(connection,),
+                                      name="worker")
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, connection):
+        """Feed tasks to one worker, until it is lost or we close."""
+        try:
+            host, local = connection.recv()
+        except (EOFError, IOError, ValueError):
+            connection.close()
+            return
+        worker = _Worker(host, local)
+        logger.info("worker connected from %s" % host)
+        with self._condition:
+            self.workers.append(worker)
+        last_args = None
+        task = None
+        try:
+            while True:
+                task = self._next_task(worker)
+                if task is None:
+                    connection.send(None)
+                    break
+                if task.pickled_args == last_args:
+                    send_args = None
+                else:
+                    send_args = last_args = task.pickled_args
+                connection.send((task.func_name, task.item, send_args))
+                pickled = connection.recv_bytes()
+                try:
+                    result = cPickle.loads(pickled)
+                except Exception as e:
+                    result = (False, RuntimeError(
+                        "can't read result of %s: %s" % (task.func_name, e)))
+                self._finish(task, result)
+                task = None
+        except (EOFError, IOError) as e:
+            logger.warn("lost worker on %s: %s" % (host, e))
+        finally:
+            connection.close()
+            with self._condition:
+                self.workers.remove(worker)
+                if task is not None:
+                    self._retry(task)
+                self._condition.notify_all()
+
+    def _next_task(self, worker):
+        """Wait for a task for worker. Returns None when closing."""
+        with self._condition:
+            while not self._closed:
+                task = self._choose(worker)
+                if task is not None:
+                    self._tasks.remove(task)
+                    worker.remember(task)
+                    return task
+                self._condition.wait(LOCALITY_WAIT)
+            return None
+
+    def _choose(self, worker):
+        """
+        The first task this worker prefers, or else the first one which no
+        other worker prefers or which has waited long enough for it.
+        """
+        for task in self._tasks:
+            if worker.prefers(task):
+                return task
+        others = [w for w in self.workers if w is not worker]
+        deadline = time.time() - LOCALITY_WAIT
+        for task in self._tasks:
+            if task.queued < deadline or \
+                    not any(other.prefers(task) for other in others):
+                return task
+        return None
+
+    def _finish(self, task, result):
+        with self._condition:
+            if task.call in self._results:
+                self._results[task.call][task.index] = result
+            self._condition.notify_all()
+
+    def _retry(self, task):
+        task.attempts += 1
+        if task.attempts >= MAX_ATTEMPTS:
+            error = RuntimeError("%s failed on %s workers" %
+                                 (task.func_name, task.attempts))
+            self._results[task.call][task.index] = (False, error)
+        else:
+            logger.info("handing %s to another worker" % task.func_name)
+            self._tasks.appendleft(task)
+
+    def map_async(self, func, iterable, args):
+        pickled_args = cPickle.dumps(args, cPickle.HIGHEST_PROTOCOL)
+        with self._condition:
+            call = next(self._calls)
+            self._results[call] = {}
+            size = 0
+            for index, item in enumerate(iterable):
+                self._tasks.append(_Task(call, index, func.__name__, item,
+                                         pickled_args))
+                size += 1
+            self._condition.notify_all()
+        return AsyncResult(self, call, size)
+
+    def map(self, func, iterable, args):
+        return self.map_async(func, iterable, args).get()
+
+    def _collect(self, call, size):
+        warned = time.time()
+        with self._condition:
+            results = self._results[call]
+            while len(results) < size:
+                if not self.workers and time.time() - warned > WORKER_WAIT:
+                    logger.warn("no workers connected to %s:%s" %
+                                self.address)
+                    warned = time.time()
+                self._condition.wait(LOCALITY_WAIT)
+            del self._results[call]
+        values = []
+        for index in range(size):
+            succeeded, value = results[index]
+            if not succeeded:
+                raise value
+            values.append(value)
+        return values
+
+    def close(self):
+        """Stop listening, and tell the workers to stop once idle."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._listener.close()
+
+
+def _shutdown():
+    if scheduler is not None:
+        scheduler.close()
+
+atexit.register(_shutdown)
+
+
+def set_cores(cores=0):
+    """
+    Start listening for workers. The number of cores is not used, since the
+    workers decide how many processes they run.
+    """
+    global scheduler
+    if scheduler is None:
+        address = os.environ.get('TKP_CLUSTER_ADDRESS', DEFAULT_ADDRESS)
+        scheduler = Scheduler(parse_address(address), get_authkey())
+
+
+def map(func, iterable, args):
+    return scheduler.map(func, iterable, args)
+
+
+def map_async(func, iterable, args):
+    return scheduler.map_async(func, iterable, args)
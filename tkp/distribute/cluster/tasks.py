@@ -0,0 +1,8 @@
+"""
+Tasks run by the workers of the cluster distribution method. They are the
+same as those used with python multiprocessing.
+"""
+from __future__ import absolute_import
+from tkp.distribute.multiproc.tasks import (persistence_node_step,
+                                            quality_reject_check,
+                                            extract_sources, forced_fits)
@@ -0,0 +1,89 @@
+"""
+Worker processes for the cluster distribution method, see
+:mod:`tkp.distribute.cluster`. They are started on the nodes with::
+
+  $ trap-manage.py worker <master host>:<port> [-p processes] [-l path]
+"""
+import cPickle
+import logging
+import socket
+import time
+from multiprocessing import Process, cpu_count
+from multiprocessing.connection import Client
+
+from tkp.distribute.cluster import tasks
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to reach the pipeline.
+CONNECT_INTERVAL = 1
+
+
+def connect(address, authkey, wait):
+    """
+    Connect to the pipeline at address, trying for wait seconds in case it
+    hasn't started yet.
+    """
+    deadline = time.time() + wait
+    while True:
+        try:
+            return Client(address, authkey=authkey)
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(CONNECT_INTERVAL)
+
+
+def work(address, authkey, local=(), wait=60):
+    """
+    Run tasks for the pipeline at address, until it tells us to stop or
+    goes away.
+
+    Args:
+        address (tuple): (host, port) of the pipeline
+        authkey (str): secret shared with the pipeline
+    Kwargs:
+        local (list): path prefixes of the images which are local to this
+            node. Tasks for these images are sent here rather than elsewhere.
+        wait (float): seconds to keep trying to reach the pipeline
+    """
+    connection = connect(address, authkey, wait)
+    connection.send((socket.gethostname(), list(local)))
+    args = None
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, IOError):
+            break
+        if message is None:
+            break
+        func_name, item, pickled_args = message
+        if pickled_args is not None:
+            args = cPickle.loads(pickled_args)
+        try:
+            result = (True, getattr(tasks, func_name)((item, args)))
+        except Exception as e:
+            result = (False, e)
+        try:
+            pickled = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            pickled = cPickle.dumps((False, RuntimeError(
+                "can't send result of %s: %s" % (func_name, e))))
+        connection.send_bytes(pickled)
+    connection.close()
+
+
+def run_workers(address, authkey, processes=0, local=(), wait=60):
+    """
+    Run processes workers (0 = one per core) on this node, see work().
+    """
+    if not processes:
+        processes = cpu_count()
+    logger.info("starting %s workers for %s:%s" % ((processes,) + address))
+    workers = [Process(target=work, args=(address, authkey, local, wait))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
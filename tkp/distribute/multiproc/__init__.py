@@ -1,11 +1,296 @@
 """
 A computation distribution implementation using the build in multiprocessing
-module. the Pool.map function only accepts one argument, so we need to
-zip the iterable together with the arguments.
+module. The tasks only accept one argument, so we need to zip the iterable
+together with the arguments.
+
+The work is done by a pool of worker processes which stay up for the whole
+run, so that the image sessions they keep (see :mod:`tkp.steps.session`)
+survive from one step to the next. Every image is sent to the worker which
+handled it before, as long as that doesn't leave the other workers idle.
+The arguments of a map are sent to each worker once, rather than with every
+item, and not at all if the worker already has them from the previous map.
+
+imap() and imap_unordered() hand out the items in chunks, and only keep a
+limited number of them in flight, so that the results can be used while the
+rest is still being worked on without piling up in the master.
+
+The workers are not daemonic, so that the tasks can start processes of their
+own, like the pool which fits the islands of an image in parallel (see
+:func:`tkp.sourcefinder.image.fit_islands`). They are terminated when the
+master exits; the processes of a multiprocessing pool started by a task
+then exit as well.
 """
-from multiprocessing import Pool, cpu_count
+import atexit
+import cPickle
+import logging
+import Queue
+from collections import OrderedDict
+from itertools import count
+from multiprocessing import Process, Queue as ProcessQueue, cpu_count
+
+from tkp.distribute import affinity_key
+import tkp.steps.session
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a result before checking the workers are still alive.
+POLL_INTERVAL = 1
+
+# Number of chunks per worker which imap() keeps in flight.
+IMAP_CHUNKS_PER_WORKER = 2
+
+# Started by set_cores(), rather than on import.
+pool = None
+
+
+def _chunks(iterable, chunksize):
+    """Lists of at most chunksize (index, item) tuples."""
+    chunk = []
+    for pair in enumerate(iterable):
+        chunk.append(pair)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
-pool = Pool(processes=cpu_count())
+def _unpack(result):
+    succeeded, value = result
+    if not succeeded:
+        raise value
+    return value
+
+
+def _worker(inbox, outbox):
+    """
+    Main loop of a worker process. Runs batches of tasks from inbox until it
+    receives None, and puts (call, index, pickled result) on outbox for each
+    of them. The result is (True, return value) or (False, exception).
+    """
+    args = None
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        call, func, pickled_args, items = message
+        if pickled_args is not None:
+            args = cPickle.loads(pickled_args)
+        for index, item in items:
+            try:
+                result = (True, func((item, args)))
+            except Exception as e:
+                result = (False, e)
+            # The queue pickles in a background thread, where failures would
+            # go unnoticed, so do it here.
+            try:
+                pickled = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                pickled = cPickle.dumps((False, RuntimeError(
+                    "can't send result of %s: %s" % (func.__name__, e))))
+            outbox.put((call, index, pickled))
+
+
+class AsyncResult(object):
+    """The results of a map which was started with map_async()."""
+    def __init__(self, pool, call, size):
+        self._pool = pool
+        self._call = call
+        self._size = size
+
+    def get(self):
+        """Wait for all results and return them, in order."""
+        return self._pool._collect(self._call, self._size)
+
+
+class WorkerPool(object):
+    """
+    A pool of persistent worker processes, which each have their own queue of
+    tasks so that images can be routed to the worker which has them open.
+
+    Args:
+        processes (int): number of worker processes
+    """
+    def __init__(self, processes):
+        logger.debug("starting %s worker processes" % processes)
+        self._processes = processes
+        self._outbox = ProcessQueue()
+        self._inboxes = []
+        self._workers = []
+        for _ in range(processes):
+            inbox = ProcessQueue()
+            worker = Process(target=_worker, args=(inbox, self._outbox))
+            worker.start()
+            self._inboxes.append(inbox)
+            self._workers.append(worker)
+        self._last_args = [None] * processes
+        self._affinity = OrderedDict()
+        self._calls = count()
+        self._results = {}
+
+    def _assign(self, items):
+        """
+        Divide the items over the workers.
+
+        Returns:
+            list: for every worker, a list of (index, item) tuples
+        """
+        batches = [[] for _ in range(self._processes)]
+        fair_share = -(-len(items) // self._processes)
+        unassigned = []
+        for index, item in enumerate(items):
+            key = affinity_key(item)
+            worker = self._affinity.get(key)
+            if worker is not None and len(batches[worker]) < fair_share:
+                batches[worker].append((index, item))
+                self._remember(key, worker)
+            else:
+                unassigned.append((index, item, key))
+        for index, item, key in unassigned:
+            worker = min(range(self._processes),
+                         key=lambda w: len(batches[w]))
+            batches[worker].append((index, item))
+            if key is not None:
+                self._remember(key, worker)
+        return batches
+
+    def _remember(self, key, worker):
+        self._affinity.pop(key, None)
+        self._affinity[key] = worker
+        # Workers don't keep more images open than fit in their cache.
+        size = tkp.steps.session.CACHE_SIZE * self._processes
+        while len(self._affinity) > size:
+            self._affinity.popitem(last=False)
+
+    def _pick(self, chunk, load, chunksize):
+        """
+        The worker for a chunk of imap(): the one which had its first image
+        before, unless it is a chunk or more behind the least busy worker.
+        """
+        worker = self._affinity.get(affinity_key(chunk[0][1]))
+        if worker is None or load[worker] - min(load) >= chunksize:
+            worker = load.index(min(load))
+        for index, item in chunk:
+            key = affinity_key(item)
+            if key is not None:
+                self._remember(key, worker)
+        return worker
+
+    def _send(self, worker, call, func, pickled_args, batch):
+        if pickled_args == self._last_args[worker]:
+            send_args = None
+        else:
+            send_args = self._last_args[worker] = pickled_args
+        self._inboxes[worker].put((call, func, send_args, batch))
+
+    def _receive(self):
+        """
+        Wait for the next result, and file it with the results of its call.
+
+        Returns:
+            tuple: (call, index) of the result
+        """
+        while True:
+            try:
+                call, index, pickled = self._outbox.get(timeout=POLL_INTERVAL)
+            except Queue.Empty:
+                if not all(worker.is_alive() for worker in self._workers):
+                    self.terminate()
+                    raise RuntimeError("a worker process died unexpectedly")
+                continue
+            # Results of an imap() which was given up on are dropped.
+            if call in self._results:
+                self._results[call][index] = cPickle.loads(pickled)
+            return call, index
+
+    def map_async(self, func, iterable, args):
+        items = list(iterable)
+        call = next(self._calls)
+        self._results[call] = {}
+        pickled_args = cPickle.dumps(args, cPickle.HIGHEST_PROTOCOL)
+        for worker, batch in enumerate(self._assign(items)):
+            if batch:
+                self._send(worker, call, func, pickled_args, batch)
+        return AsyncResult(self, call, len(items))
+
+    def map(self, func, iterable, args):
+        return self.map_async(func, iterable, args).get()
+
+    def _collect(self, call, size):
+        results = self._results[call]
+        while len(results) < size:
+            self._receive()
+        del self._results[call]
+        return [_unpack(results[index]) for index in range(size)]
+
+    def imap(self, func, iterable, args, chunksize=1, ordered=True):
+        """
+        Generate the results of func for the items of iterable, which is
+        consumed as the results are used. If ordered is False, the results
+        are generated as they come in, rather than in the order of the items.
+        """
+        call = next(self._calls)
+        results = self._results[call] = {}
+        pickled_args = cPickle.dumps(args, cPickle.HIGHEST_PROTOCOL)
+        chunks = _chunks(iterable, chunksize)
+        window = IMAP_CHUNKS_PER_WORKER * self._processes * chunksize
+        in_flight = {}
+        load = [0] * self._processes
+        next_index = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) + len(results) < window:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    worker = self._pick(chunk, load, chunksize)
+                    self._send(worker, call, func, pickled_args, chunk)
+                    for index, item in chunk:
+                        in_flight[index] = worker
+                    load[worker] += len(chunk)
+
+                if ordered:
+                    while next_index in results:
+                        yield _unpack(results.pop(next_index))
+                        next_index += 1
+                else:
+                    for index in results.keys():
+                        yield _unpack(results.pop(index))
+
+                if not in_flight:
+                    if exhausted:
+                        break
+                    continue
+                received, index = self._receive()
+                if received == call:
+                    load[in_flight.pop(index)] -= 1
+        finally:
+            del self._results[call]
+
+    def close(self):
+        """Let the workers finish their tasks, then stop them."""
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def terminate(self):
+        """Stop the workers straight away."""
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+
+
+# Registered after multiprocessing's own exit handler, so it runs first and
+# the workers don't keep the master waiting for them.
+def _shutdown():
+    if pool is not None:
+        pool.terminate()
+
+atexit.register(_shutdown)
 
 
 def set_cores(cores=0):
@@ -15,10 +300,24 @@ def set_cores(cores=0):
     global pool
     if not cores:
         cores = cpu_count()
-    pool = Pool(cores)
+    if pool is not None:
+        if pool._processes == cores:
+            return
+        pool.close()
+    pool = WorkerPool(cores)
 
 
 def map(func, iterable, args):
-    zipped = ((i, args) for i in iterable)
-    return pool.map(func, zipped)
+    return pool.map(func, iterable, args)
+
+
+def map_async(func, iterable, args):
+    return pool.map_async(func, iterable, args)
+
+
+def imap(func, iterable, args, chunksize=1):
+    return pool.imap(func, iterable, args, chunksize)
+
 
+def imap_unordered(func, iterable, args, chunksize=1):
+    return pool.imap(func, iterable, args, chunksize, ordered=False)
@@ -12,9 +12,9 @@ logger = logging.getLogger(__name__)
 def persistence_node_step(zipped):
     logger.info("running persistence task")
     images, args = zipped
-    image_cache_config, sigma, f = args
+    image_cache_config, sigma, f, job_config = args
     return tkp.steps.persistence.node_steps(images, image_cache_config,
-                                            sigma, f)
+                                            sigma, f, job_config)
 
 
 def quality_reject_check(zipped):
@@ -28,4 +28,16 @@ def extract_sources(zipped):
     logger.info("running extracted sources task")
     url, args = zipped
     extraction_params = args[0]
-    return tkp.steps.source_extraction.extract_sources(url, extraction_params)
+    # The forced fits of the image are sent to this worker too, and reuse
+    # the session; see forced_fits().
+    return tkp.steps.source_extraction.extract_sources(url, extraction_params,
+                                                       keep_session=True)
+
+
+def forced_fits(zipped):
+    logger.info("running forced fits task")
+    (url, fit_posns, fit_ids), args = zipped
+    extraction_params = args[0]
+    return tkp.steps.forced_fitting.perform_forced_fits(fit_posns, fit_ids,
+                                                        url,
+                                                        extraction_params)
@@ -4,6 +4,13 @@ def map(func, iterable, arguments=[]):
     return x
 
 
+def imap(func, iterable, arguments=[], chunksize=1):
+    return (func(i, *arguments) for i in iterable)
+
+
+imap_unordered = imap
+
+
 def set_cores(cores=0):
     """
     doesn't do anything for serial
@@ -6,10 +6,11 @@ import tkp.steps
 logger = logging.getLogger(__name__)
 
 
-def persistence_node_step(images, image_cache_config, sigma, f):
+def persistence_node_step(images, image_cache_config, sigma, f,
+                          job_config=None):
     logger.info("running persistence task")
     return tkp.steps.persistence.node_steps(images, image_cache_config,
-                                            sigma, f)
+                                            sigma, f, job_config)
 
 
 def quality_reject_check(url, job_config):
@@ -19,4 +20,14 @@ def quality_reject_check(url, job_config):
 
 def extract_sources(url, extraction_params):
     logger.info("running extracted sources task")
-    return tkp.steps.source_extraction.extract_sources(url, extraction_params)
+    # Forced fitting runs in this same process, and reuses the session.
+    return tkp.steps.source_extraction.extract_sources(url, extraction_params,
+                                                       keep_session=True)
+
+
+def forced_fits(item, extraction_params):
+    logger.info("running forced fits task")
+    url, fit_posns, fit_ids = item
+    return tkp.steps.forced_fitting.perform_forced_fits(fit_posns, fit_ids,
+                                                        url,
+                                                        extraction_params)
@@ -10,6 +10,7 @@ from tkp.db import consistency as dbconsistency
 from tkp.db import Image
 from tkp.db import general as dbgen
 from tkp.db import associations as dbass
+from tkp.db import candidates as dbcand
 from tkp.distribute import Runner
 from tkp.steps.misc import (load_job_config, dump_configs_to_logdir,
                                    check_job_configs_match,
@@ -18,6 +19,7 @@ from tkp.steps.misc import (load_job_config, dump_configs_to_logdir,
                             )
 from tkp.db.configstore import store_config, fetch_config
 from tkp.steps.persistence import create_dataset, store_images
+from tkp.steps.session import set_memmap_fits, set_cache_size
 import tkp.steps.forced_fitting as steps_ff
 
 
@@ -31,10 +33,14 @@ def run(job_name, supplied_mon_coords=[]):
 
     # get parallelise props. Defaults to multiproc with autodetect num cores
     parallelise = pipe_config.get('parallelise', {})
+    set_memmap_fits(parallelise.get('memmap_fits', False))
+    set_cache_size(parallelise.get('session_cache', 2))
     distributor = os.environ.get('TKP_PARALLELISE', parallelise.get('method',
                                                                     'multiproc'))
     runner = Runner(distributor=distributor,
                     cores=parallelise.get('cores', 0))
+    pipeline = parallelise.get('pipeline', False)
+    chunksize = parallelise.get('chunksize', 1)
 
     debug = pipe_config.logging.debug
     #Setup logfile before we do anything else
@@ -55,6 +61,9 @@ def run(job_name, supplied_mon_coords=[]):
     se_parset = job_config.source_extraction
     deruiter_radius = job_config.association.deruiter_radius
     beamwidths_limit = job_config.association.beamwidths_limit
+    association_engine = job_config.association.get('engine', 'sql')
+    association_batch = job_config.association.get('batch', False)
+    association_transaction = job_config.association.get('transaction', False)
     new_src_sigma = job_config.transient_search.new_source_sigma_margin
 
     all_images = imp.load_source('images_to_process',
@@ -97,9 +106,18 @@ def run(job_name, supplied_mon_coords=[]):
 
     rms_est_sigma = job_config.persistence.rms_est_sigma
     rms_est_fraction = job_config.persistence.rms_est_fraction
-    metadatas = runner.map("persistence_node_step", imgs,
-                           [image_cache_params, rms_est_sigma, rms_est_fraction])
+    # The images are quality checked as part of the persistence step, while
+    # they are open anyway. The images are sorted by time before they are
+    # stored, so we need all the metadata, but nothing else has to be kept.
+    # The results are kept in the order of the images, so that the images of
+    # a timestep are stored in the same order on every run.
+    metadatas = runner.imap(
+        "persistence_node_step", imgs,
+        [image_cache_params, rms_est_sigma, rms_est_fraction, job_config],
+        chunksize)
     metadatas = [m[0] for m in metadatas if m]
+    rejections = dict((metadata['url'], metadata.pop('rejected'))
+                      for metadata in metadatas)
 
     logger.info("Storing images")
     image_ids = store_images(metadatas,
@@ -108,13 +126,10 @@ def run(job_name, supplied_mon_coords=[]):
 
     db_images = [Image(id=image_id) for image_id in image_ids]
 
-    logger.info("performing quality check")
-    urls = [img.url for img in db_images]
-    arguments = [job_config]
-    rejecteds = runner.map("quality_reject_check", urls, arguments)
-
+    logger.info("storing quality check results")
     good_images = []
-    for image, rejected in zip(db_images, rejecteds):
+    for image in db_images:
+        rejected = rejections[image.url]
         if rejected:
             reason, comment = rejected
             steps.quality.reject_image(image.id, reason, comment)
@@ -127,15 +142,26 @@ def run(job_name, supplied_mon_coords=[]):
 
     grouped_images = group_per_timestep(good_images)
     timestep_num = len(grouped_images)
+    arguments = [se_parset]
+
+    def start_extraction(images):
+        urls = [img.url for img in images]
+        return runner.map_async("extract_sources", urls, arguments)
+
+    # When pipelining, the sources of the next timestep are extracted while
+    # this one is being associated. Association itself stays in order.
+    extraction = None
     for n, (timestep, images) in enumerate(grouped_images):
         msg = "processing %s images in timestep %s (%s/%s)"
         logger.info(msg % (len(images), timestep, n+1, timestep_num))
 
         logger.info("performing source extraction")
-        urls = [img.url for img in images]
-        arguments = [se_parset]
-
-        extraction_results = runner.map("extract_sources", urls, arguments)
+        if extraction is None:
+            extraction = start_extraction(images)
+        extraction_results = extraction.get()
+        extraction = None
+        if pipeline and n + 1 < timestep_num:
+            extraction = start_extraction(grouped_images[n + 1][1])
 
         logger.info("storing extracted sources to database")
         # we also set the image max,min RMS values which calculated during
@@ -148,23 +174,41 @@ def run(job_name, supplied_mon_coords=[]):
 
         logger.info("performing database operations")
 
+        if association_batch:
+            logger.info("performing source association for timestep")
+            dbass.associate_timestep([image.id for image in images],
+                                     deRuiter_r=deruiter_radius,
+                                     new_source_sigma_margin=new_src_sigma,
+                                     engine=association_engine,
+                                     transaction=association_transaction)
+
         for image in images:
             logger.info("performing DB operations for image %s" % image.id)
 
-            logger.info("performing source association")
-            dbass.associate_extracted_sources(image.id,
-                                              deRuiter_r=deruiter_radius,
-                                              new_source_sigma_margin=new_src_sigma)
+            if not association_batch:
+                logger.info("performing source association")
+                dbass.associate_extracted_sources(image.id,
+                                                  deRuiter_r=deruiter_radius,
+                                                  new_source_sigma_margin=new_src_sigma,
+                                                  engine=association_engine,
+                                                  transaction=association_transaction)
 
             expiration = job_config.source_extraction.expiration
             all_fit_posns, all_fit_ids = steps_ff.get_forced_fit_requests(image,
                                                                           expiration)
+            # The fits run where the sources were extracted, which still has
+            # the image open. The task is sent even without positions, so
+            # that the image is closed there.
+            fit_request = (image.url, all_fit_posns, all_fit_ids)
+            successful_fits, successful_ids = runner.map(
+                "forced_fits", [fit_request], arguments)[0]
             if all_fit_posns:
-                successful_fits, successful_ids = steps_ff.perform_forced_fits(
-                    all_fit_posns, all_fit_ids, image.url, se_parset)
-
                 steps_ff.insert_and_associate_forced_fits(image.id,successful_fits,
-                                                          successful_ids)
+                                                          successful_ids,
+                                                          association_transaction)
+
+        logger.info("refreshing transient candidates")
+        dbcand.refresh([image.id for image in images])
 
 
         dbgen.update_dataset_process_end_ts(dataset_id)
@@ -238,6 +238,13 @@ def init_db(options):
     populate(dbconfig)
 
 
+def run_worker(args):
+    from tkp.distribute.cluster import parse_address, get_authkey
+    from tkp.distribute.cluster.worker import run_workers
+    run_workers(parse_address(args.address), get_authkey(),
+                processes=args.processes, local=args.local, wait=args.wait)
+
+
 def get_parser():
     trap_manage_note= """
         A tool for managing TKP projects.
@@ -315,6 +322,25 @@ def get_parser():
                                     "(only works with Postgres backend)",
                                action="store_true")
     initdb_parser.set_defaults(func=init_db)
+
+    # worker
+    worker_parser = parser_subparsers.add_parser(
+        'worker',
+        help="""
+        Run worker processes for a job which is run with the cluster
+        distribution method. Set TKP_CLUSTER_AUTHKEY to the same secret as
+        for the job.
+        """)
+    worker_parser.add_argument('address',
+                               help='host:port where the job listens')
+    worker_parser.add_argument('-p', '--processes', type=int, default=0,
+                               help='number of workers, 0 for one per core')
+    worker_parser.add_argument('-l', '--local', action='append', default=[],
+                               help='path prefix of images local to this '
+                                    'node (may be repeated)')
+    worker_parser.add_argument('-w', '--wait', type=float, default=60,
+                               help='seconds to wait for the job to start')
+    worker_parser.set_defaults(func=run_worker)
     return parser
 
 
@@ -82,7 +82,7 @@ class Island(object):
         # The idea here is to retain the flux of the original, unblended
         # island. That flux is used as a criterion for deblending.
         if not isinstance(flux_orig, float):
-            self.flux_orig = self.data.sum()
+            self.flux_orig = self.data.sum(dtype=numpy.float64)
         else:
             self.flux_orig = flux_orig
         if isinstance(subthrrange, numpy.ndarray):
@@ -206,7 +206,7 @@ class Island(object):
 
     def sig(self):
         """Deviation"""
-        return (self.data/ self.rms_orig).max()
+        return float((self.data/ self.rms_orig).max())
 
     def fit(self, fixed=None):
         """Fit the position"""
@@ -647,31 +647,38 @@ def source_profile_and_errors(data, threshold, noise,
         fixed = {}
     param = ParamSet()
 
+    # Single precision image data is only promoted here, where it's fitted.
+    if data.dtype != numpy.float64:
+        data = data.astype(numpy.float64)
+
     if threshold is None:
         moments_threshold=0
     else:
         moments_threshold = threshold
 
-    try:
-        param.update(fitting.moments(data, beam, moments_threshold))
-        param.moments = True
-    except ValueError:
-        # If this happens, we have two choices:
-        # 1) Bomb out and tell the user to fit something sensible instead;
-        # 2) Make up our own estimate (all 1s or something) to give the
-        # gaussian fitter a starting point.
-        param.update({
-            "peak": 1,
-            "flux": 1,
-            "xbar": data.shape[0]/2.0,
-            "ybar": data.shape[1]/2.0,
-            "semimajor": 1,
-            "semiminor": 1,
-            "theta": 0
-            })
-        logger.debug("Unable to estimate gaussian parameters."
-                      " Proceeding with defaults %s""",
-                     str(param))
+    # Moments provide the starting point for Gaussian fitting. There's no
+    # need for them if only the peak is left to fit: that's solved directly.
+    if not set(fitting.FIT_PARAMS) <= set(fixed) | set(['peak']):
+        try:
+            param.update(fitting.moments(data, beam, moments_threshold))
+            param.moments = True
+        except ValueError:
+            # If this happens, we have two choices:
+            # 1) Bomb out and tell the user to fit something sensible instead;
+            # 2) Make up our own estimate (all 1s or something) to give the
+            # gaussian fitter a starting point.
+            param.update({
+                "peak": 1,
+                "flux": 1,
+                "xbar": data.shape[0]/2.0,
+                "ybar": data.shape[1]/2.0,
+                "semimajor": 1,
+                "semiminor": 1,
+                "theta": 0
+                })
+            logger.debug("Unable to estimate gaussian parameters."
+                          " Proceeding with defaults %s""",
+                         str(param))
 
     ranges = data.nonzero()
     xmin = min(ranges[0])
@@ -815,9 +822,43 @@ class Detection(object):
         """Convert the pixel parameters for this object into something
         physical."""
 
+        # The ends of the axes.
+        # Note that the signs of numpy.sin and numpy.cos in the
+        # four expressions below are arbitrary.
+        self.end_smaj_x = (self.x.value - numpy.sin(self.theta.value) *
+                      self.smaj.value)
+        self.start_smaj_x = (self.x.value + numpy.sin(self.theta.value) *
+                      self.smaj.value)
+        self.end_smaj_y = (self.y.value + numpy.cos(self.theta.value) *
+                      self.smaj.value)
+        self.start_smaj_y = (self.y.value - numpy.cos(self.theta.value) *
+                      self.smaj.value)
+        self.end_smin_x = (self.x.value + numpy.cos(self.theta.value) *
+                      self.smin.value)
+        self.start_smin_x = (self.x.value - numpy.cos(self.theta.value) *
+                      self.smin.value)
+        self.end_smin_y = (self.y.value + numpy.sin(self.theta.value) *
+                      self.smin.value)
+        self.start_smin_y = (self.y.value - numpy.sin(self.theta.value) *
+                      self.smin.value)
+
+        # Convert all the positions we need which don't depend on the
+        # orientation in one go: the centre, one pixel up along the y-axis,
+        # and the ends of the axes.
+        sky, invalid = self.imagedata.wcs.p2s_array([
+            [self.x.value, self.y.value],
+            [self.x.value, self.y.value+1.],
+            [self.end_smaj_x, self.end_smaj_y],
+            [self.end_smin_x, self.end_smin_y],
+        ])
+        if invalid[:2].any():
+            raise RuntimeError("Spatial position is not a number")
+        if invalid[2:].any():
+            logger.debug("pixel_to_spatial failed for the axes at %f, %f" % (
+                self.x.value, self.y.value))
+
         # First, the RA & dec.
-        self.ra, self.dec = [Uncertain(x) for x in self.imagedata.wcs.p2s(
-            [self.x.value, self.y.value])]
+        self.ra, self.dec = [Uncertain(x) for x in sky[0]]
         if numpy.isnan(self.dec.value) or abs(self.dec) > 90.0:
             raise ValueError("object falls outside the sky")
 
@@ -844,8 +885,7 @@ class Detection(object):
         # to celestial coordinates. That small increment is conveniently
         # chosen to be an increment of 1 pixel.
 
-        endy_ra, endy_dec = self.imagedata.wcs.p2s(
-            [self.x.value, self.y.value+1.])
+        endy_ra, endy_dec = sky[1]
         help5 = numpy.cos(numpy.radians(endy_ra))
         help6 = numpy.sin(numpy.radians(endy_ra))
         help7 = numpy.cos(numpy.radians(endy_dec))
@@ -896,11 +936,18 @@ class Detection(object):
 
         # Now we have to sort out which combination of errorx_proj and
         # errory_proj gives the largest errors in RA and Dec.
-        try:
-            end_ra1, end_dec1 = self.imagedata.wcs.p2s(
-                                       [self.x.value+errorx_proj, self.y.value])
-            end_ra2, end_dec2 = self.imagedata.wcs.p2s(
-                [self.x.value, self.y.value+errory_proj])
+        ends, invalid = self.imagedata.wcs.p2s_array([
+            [self.x.value+errorx_proj, self.y.value],
+            [self.x.value, self.y.value+errory_proj],
+        ])
+        if invalid.any():
+            # The conversion fails if the errors place the limits outside of
+            # the image, in which case we set the RA / DEC uncertainties to
+            # infinity.
+            self.ra.error = float('inf')
+            self.dec.error = float('inf')
+        else:
+            (end_ra1, end_dec1), (end_ra2, end_dec2) = ends
             # Here we include the position calibration errors
             self.ra.error = self.eps_ra + max(
                 numpy.fabs(self.ra.value - end_ra1),
@@ -908,12 +955,6 @@ class Detection(object):
             self.dec.error = self.eps_dec + max(
                 numpy.fabs(self.dec.value - end_dec1),
                 numpy.fabs(self.dec.value - end_dec2))
-        except RuntimeError:
-            #We get a runtime error from wcs.p2s if the errors place the
-            #limits outside of the image.
-            #In which case we set the RA / DEC uncertainties to infinity
-            self.ra.error = float('inf')
-            self.dec.error = float('inf')
 
         # Estimate an absolute angular error on our central position.
         self.error_radius = utils.get_error_radius(
@@ -939,34 +980,8 @@ class Detection(object):
             numpy.degrees(self.theta_dc.error))
 
         # Next, the axes.
-        # Note that the signs of numpy.sin and numpy.cos in the
-        # four expressions below are arbitrary.
-        self.end_smaj_x = (self.x.value - numpy.sin(self.theta.value) *
-                      self.smaj.value)
-        self.start_smaj_x = (self.x.value + numpy.sin(self.theta.value) *
-                      self.smaj.value)
-        self.end_smaj_y = (self.y.value + numpy.cos(self.theta.value) *
-                      self.smaj.value)
-        self.start_smaj_y = (self.y.value - numpy.cos(self.theta.value) *
-                      self.smaj.value)
-        self.end_smin_x = (self.x.value + numpy.cos(self.theta.value) *
-                      self.smin.value)
-        self.start_smin_x = (self.x.value - numpy.cos(self.theta.value) *
-                      self.smin.value)
-        self.end_smin_y = (self.y.value + numpy.sin(self.theta.value) *
-                      self.smin.value)
-        self.start_smin_y = (self.y.value - numpy.sin(self.theta.value) *
-                      self.smin.value)
-
-
-        def pixel_to_spatial(x, y):
-            try:
-                return self.imagedata.wcs.p2s([x, y])
-            except RuntimeError:
-                logger.debug("pixel_to_spatial failed at %f, %f" % (x, y))
-                return numpy.nan, numpy.nan
-        end_smaj_ra, end_smaj_dec = pixel_to_spatial(self.end_smaj_x, self.end_smaj_y)
-        end_smin_ra, end_smin_dec = pixel_to_spatial(self.end_smin_x, self.end_smin_y)
+        end_smaj_ra, end_smaj_dec = sky[2]
+        end_smin_ra, end_smin_dec = sky[3]
 
         smaj_asec = coordinates.angsep(self.ra.value, self.dec.value,
                                        end_smaj_ra, end_smaj_dec)
@@ -1012,3 +1027,316 @@ class Detection(object):
             self.chisq,
             self.reduced_chisq
         ]
+
+
+# Measurements held by DetectionBatch, as (field name, ParamSet key) for
+# those which come with an error: the error is stored in <field name>_err.
+_MEASURED_FIELDS = (
+    ('peak', 'peak'),
+    ('flux', 'flux'),
+    ('x', 'xbar'),
+    ('y', 'ybar'),
+    ('smaj', 'semimajor'),
+    ('smin', 'semiminor'),
+    ('theta', 'theta'),
+    ('smaj_dc', 'semimaj_deconv'),
+    ('smin_dc', 'semimin_deconv'),
+    ('theta_dc', 'theta_deconv'),
+)
+
+# Physical quantities, calculated from the measurements. All but the error
+# radius come with an error.
+_PHYSICAL_FIELDS = ('ra', 'dec', 'smaj_asec', 'smin_asec', 'theta_celes',
+                    'theta_dc_celes')
+
+
+def _with_errors(names):
+    return [(field, numpy.float64) for name in names
+            for field in (name, name + '_err')]
+
+
+DETECTION_DTYPE = numpy.dtype(
+    _with_errors([field for field, key in _MEASURED_FIELDS]) +
+    _with_errors(_PHYSICAL_FIELDS) + [
+        ('error_radius', numpy.float64),
+        ('sig', numpy.float64),
+        ('chisq', numpy.float64),
+        ('reduced_chisq', numpy.float64),
+        ('gaussian', numpy.bool_),
+        ('dc_imposs', numpy.int32),
+    ])
+
+# The columns returned by DetectionBatch.serialize(), in the order of
+# Detection.serialize().
+SERIALIZED_DTYPE = numpy.dtype([
+    ('ra', numpy.float64),
+    ('dec', numpy.float64),
+    ('ra_err', numpy.float64),
+    ('dec_err', numpy.float64),
+    ('peak', numpy.float64),
+    ('peak_err', numpy.float64),
+    ('flux', numpy.float64),
+    ('flux_err', numpy.float64),
+    ('sig', numpy.float64),
+    ('smaj_asec', numpy.float64),
+    ('smin_asec', numpy.float64),
+    ('theta_celes', numpy.float64),
+    ('ew_sys_err', numpy.float64),
+    ('ns_sys_err', numpy.float64),
+    ('error_radius', numpy.float64),
+    ('gaussian', numpy.bool_),
+    ('chisq', numpy.float64),
+    ('reduced_chisq', numpy.float64),
+])
+
+
+def _angsep(ra1, dec1, ra2, dec2):
+    """Array version of :func:`tkp.utility.coordinates.angsep`."""
+    b = (numpy.pi / 2) - numpy.radians(dec1)
+    c = (numpy.pi / 2) - numpy.radians(dec2)
+    temp = (numpy.cos(b) * numpy.cos(c) +
+            numpy.sin(b) * numpy.sin(c) * numpy.cos(numpy.radians(ra1 - ra2)))
+    return 3600 * numpy.degrees(numpy.arccos(numpy.clip(temp, -1.0, 1.0)))
+
+
+def _unit_vectors(ra, dec):
+    """Cartesian unit vectors, as an N x 3 array, of positions in degrees."""
+    ra, dec = numpy.radians(ra), numpy.radians(dec)
+    return numpy.column_stack((numpy.cos(dec) * numpy.cos(ra),
+                               numpy.cos(dec) * numpy.sin(ra),
+                               numpy.sin(dec)))
+
+
+class DetectionBatch(object):
+    """
+    The results of many measurements in a given image.
+
+    This holds the same information as a list of :class:`Detection` s, but
+    column by column: each source is a record in a NumPy structured array
+    (see DETECTION_DTYPE), rather than an object full of
+    :class:`tkp.utility.uncertain.Uncertain` s. Physical coordinates are
+    calculated for all the sources at once.
+
+    Columns are available by name, eg ``batch['ra']``; indexing with a slice,
+    a boolean mask or an index array returns a new batch.
+
+    Args:
+        records (numpy.ndarray): structured array of DETECTION_DTYPE
+        imagedata (:class:`tkp.sourcefinder.image.ImageData`): image the
+            measurements were made in. Not pickled along with the batch.
+    """
+    def __init__(self, records=None, imagedata=None):
+        if records is None:
+            records = numpy.zeros(0, dtype=DETECTION_DTYPE)
+        self.records = records
+        self.imagedata = imagedata
+
+    @classmethod
+    def from_measurements(cls, paramsets, imagedata, eps_ra=0, eps_dec=0):
+        """
+        Collect measurements and calculate their physical coordinates.
+
+        Args:
+            paramsets (list): :class:`ParamSet` s, as returned by
+                :func:`source_profile_and_errors`
+            imagedata (:class:`tkp.sourcefinder.image.ImageData`): image the
+                measurements were made in
+
+        Kwargs:
+            eps_ra, eps_dec (float): position calibration errors, as for
+                :class:`Detection`
+
+        Returns:
+            (:class:`DetectionBatch`)
+        """
+        records = numpy.zeros(len(paramsets), dtype=DETECTION_DTYPE)
+        for field, key in _MEASURED_FIELDS:
+            records[field] = [param[key].value for param in paramsets]
+            records[field + '_err'] = [param[key].error for param in paramsets]
+        records['sig'] = [param.sig for param in paramsets]
+        records['gaussian'] = [param.gaussian for param in paramsets]
+        records['dc_imposs'] = [param.deconv_imposs for param in paramsets]
+        for field in ('chisq', 'reduced_chisq'):
+            records[field] = [
+                numpy.nan if getattr(param, field) is None
+                else getattr(param, field) for param in paramsets]
+        batch = cls(records, imagedata)
+        batch._physical_coordinates(eps_ra, eps_dec)
+        return batch
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, item):
+        if isinstance(item, basestring):
+            return self.records[item]
+        if numpy.isscalar(item):
+            item = [item]
+        return DetectionBatch(self.records[item], self.imagedata)
+
+    def __getstate__(self):
+        return {'records': self.records}
+
+    def __setstate__(self, attrdict):
+        self.records = attrdict['records']
+        self.imagedata = None
+
+    def __str__(self):
+        return 'DetectionBatch: ' + str(len(self)) + ' detection(s).'
+
+    def axis_ends(self):
+        """
+        Pixel positions of the ends of the major and minor axes, as for
+        :class:`Detection`.
+
+        Returns:
+            dict: (x, y) arrays for each of end_smaj, start_smaj, end_smin
+                and start_smin
+        """
+        r = self.records
+        sin_theta, cos_theta = numpy.sin(r['theta']), numpy.cos(r['theta'])
+        # Note that the signs of numpy.sin and numpy.cos are arbitrary.
+        return {
+            'end_smaj': (r['x'] - sin_theta * r['smaj'],
+                         r['y'] + cos_theta * r['smaj']),
+            'start_smaj': (r['x'] + sin_theta * r['smaj'],
+                           r['y'] - cos_theta * r['smaj']),
+            'end_smin': (r['x'] + cos_theta * r['smin'],
+                         r['y'] + sin_theta * r['smin']),
+            'start_smin': (r['x'] - cos_theta * r['smin'],
+                           r['y'] - sin_theta * r['smin']),
+        }
+
+    def _physical_coordinates(self, eps_ra=0, eps_dec=0):
+        """
+        Convert the pixel parameters into something physical, for all
+        sources at once. See :meth:`Detection._physical_coordinates` for the
+        details of the calculation, which is the same.
+        """
+        r = self.records
+        n = len(r)
+        if not n:
+            return
+        wcs = self.imagedata.wcs
+        x, y = r['x'], r['y']
+        ends = self.axis_ends()
+
+        sky, invalid = wcs.p2s_array(numpy.concatenate([
+            numpy.column_stack((x, y)),
+            numpy.column_stack((x, y + 1.)),
+            numpy.column_stack(ends['end_smaj']),
+            numpy.column_stack(ends['end_smin']),
+        ]))
+        sky, invalid = sky.reshape(4, n, 2), invalid.reshape(4, n)
+        if invalid[:2].any():
+            bad = invalid[:2].any(axis=0)
+            logger.warn("Physical coordinates failed at %s" % (
+                zip(x[bad], y[bad]),))
+            raise RuntimeError("Spatial position is not a number")
+        r['ra'], r['dec'] = sky[0].T
+        if (numpy.abs(r['dec']) > 90.0).any():
+            raise ValueError("object falls outside the sky")
+
+        # Orientation of the y-axis wrt local north.
+        center_position = _unit_vectors(r['ra'], r['dec'])
+        local_north_position = numpy.zeros((n, 3))
+        with numpy.errstate(divide='ignore'):
+            local_north_position[:, 2] = numpy.where(
+                center_position[:, 2] != 0, 1. / center_position[:, 2], 99e99)
+        endy_position = _unit_vectors(*sky[1].T)
+        endy_position /= (center_position * endy_position).sum(axis=1)[:, None]
+        diff1 = endy_position - center_position
+        diff2 = local_north_position - center_position
+        cross_prod = numpy.cross(diff2, diff1)
+        length_cross_sq = (cross_prod * cross_prod).sum(axis=1)
+        normalization = (diff1 * diff1).sum(axis=1) * (diff2 * diff2).sum(axis=1)
+        yoffs_rad = numpy.arccos((diff1 * diff2).sum(axis=1) /
+                                 numpy.sqrt(normalization))
+        sign_cor = ((cross_prod * center_position).sum(axis=1) /
+                    numpy.sqrt(length_cross_sq))
+        yoffs_rad *= -sign_cor
+        yoffset_angle = numpy.degrees(yoffs_rad)
+
+        # Position errors, projected on local north and local east.
+        errorx_proj = numpy.sqrt((r['x_err'] * numpy.cos(yoffs_rad))**2 +
+                                 (r['y_err'] * numpy.sin(yoffs_rad))**2)
+        errory_proj = numpy.sqrt((r['x_err'] * numpy.sin(yoffs_rad))**2 +
+                                 (r['y_err'] * numpy.cos(yoffs_rad))**2)
+        error_ends, error_invalid = wcs.p2s_array(numpy.concatenate([
+            numpy.column_stack((x + errorx_proj, y)),
+            numpy.column_stack((x, y + errory_proj)),
+        ]))
+        error_ends = error_ends.reshape(2, n, 2)
+        error_invalid = error_invalid.reshape(2, n).any(axis=0)
+        r['ra_err'] = eps_ra + numpy.abs(
+            r['ra'] - error_ends[:, :, 0]).max(axis=0)
+        r['dec_err'] = eps_dec + numpy.abs(
+            r['dec'] - error_ends[:, :, 1]).max(axis=0)
+        # If the errors place the limits outside of the image, the
+        # uncertainties are infinite.
+        r['ra_err'][error_invalid] = float('inf')
+        r['dec_err'][error_invalid] = float('inf')
+
+        # Absolute angular error, as utils.get_error_radius().
+        corners, corners_invalid = wcs.p2s_array(numpy.concatenate([
+            numpy.column_stack((x + r['x_err'], y + r['y_err'])),
+            numpy.column_stack((x - r['x_err'], y + r['y_err'])),
+            numpy.column_stack((x + r['x_err'], y - r['y_err'])),
+            numpy.column_stack((x - r['x_err'], y - r['y_err'])),
+        ]))
+        corners = corners.reshape(4, n, 2)
+        r['error_radius'] = _angsep(
+            r['ra'], r['dec'], corners[:, :, 0], corners[:, :, 1]).max(axis=0)
+        r['error_radius'][corners_invalid.reshape(4, n).any(axis=0)] = (
+            float('inf'))
+
+        r['theta_celes'] = (numpy.degrees(r['theta']) + yoffset_angle) % 180
+        r['theta_celes_err'] = numpy.degrees(r['theta_err'])
+        r['theta_dc_celes'] = (r['theta_dc'] + yoffset_angle) % 180
+        r['theta_dc_celes_err'] = numpy.degrees(r['theta_dc_err'])
+
+        for index, axis in ((2, 'smaj'), (3, 'smin')):
+            asec = _angsep(r['ra'], r['dec'], sky[index, :, 0],
+                           sky[index, :, 1])
+            r[axis + '_asec'] = asec
+            r[axis + '_asec_err'] = asec / r[axis] * r[axis + '_err']
+
+    def usable(self):
+        """
+        Check that both ends of each axis fall within an unmasked part of
+        the image, as :meth:`tkp.sourcefinder.image.ImageData._pyse` does for
+        single detections.
+
+        Returns:
+            numpy.ndarray: boolean array, True for usable sources
+        """
+        mask = numpy.ma.getmaskarray(self.imagedata.data)
+        usable = numpy.ones(len(self), dtype=bool)
+        for x, y in self.axis_ends().values():
+            # The axis will not likely end exactly on a pixel, so check all
+            # the surroundings.
+            for xs in (numpy.floor(x), numpy.ceil(x)):
+                for ys in (numpy.floor(y), numpy.ceil(y)):
+                    inside = ((xs >= 0) & (xs < mask.shape[0]) &
+                              (ys >= 0) & (ys < mask.shape[1]))
+                    usable &= inside
+                    usable[inside] &= ~mask[xs[inside].astype(int),
+                                            ys[inside].astype(int)]
+        return usable
+
+    def serialize(self, ew_sys_err, ns_sys_err):
+        """
+        Return source properties suitable for database storage, as
+        :meth:`Detection.serialize` does for a single detection.
+
+        Returns:
+            numpy.ndarray: structured array of SERIALIZED_DTYPE, one record
+                per source
+        """
+        serialized = numpy.zeros(len(self), dtype=SERIALIZED_DTYPE)
+        for field in SERIALIZED_DTYPE.names:
+            if field in self.records.dtype.names:
+                serialized[field] = self.records[field]
+        serialized['ew_sys_err'] = ew_sys_err
+        serialized['ns_sys_err'] = ns_sys_err
+        return serialized
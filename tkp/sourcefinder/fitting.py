@@ -136,58 +136,65 @@ def fitgaussian(pixels, params, fixed=None, maxfev=0):
 
     If a dict called fixed is passed in, then parameters specified within the
     dict with the same names as fit_params (below) will be "locked" in the
-    fitting process.
+    fitting process. If all parameters but the peak are fixed, the model is
+    linear and the peak is solved for directly; if all of them are fixed,
+    there is nothing left to fit and they are returned as they are.
     """
     fixed = fixed or {}
+    free_params = [param for param in FIT_PARAMS if param not in fixed]
+    if free_params in ([], ['peak']):
+        results = fixed.copy()
+        if free_params:
+            results['peak'] = fit_peaks(pixels, fixed)
+            if not numpy.isfinite(results['peak']):
+                raise ValueError("no pixels to fit the peak to")
+        return _normalize_axes(results)
 
     # Collect necessary values from parameter dict; only those which aren't
     # fixed.
     initial = []
-    for param in FIT_PARAMS:
-        if param not in fixed:
-            if hasattr(params[param], "value"):
-                initial.append(params[param].value)
-            else:
-                initial.append(params[param])
+    for param in free_params:
+        if hasattr(params[param], "value"):
+            initial.append(params[param].value)
+        else:
+            initial.append(params[param])
+
+    # Only the unmasked pixels (ie, those above threshold, not at the edges
+    # and corners of the (rectangular) array) take part in the fit. Their
+    # coordinates are the same for every evaluation of the model, so we
+    # collect them once. Coordinates and values are both in C order, ie the
+    # order of pixels.compressed().
+    unmasked = ~numpy.ma.getmaskarray(pixels)
+    x, y = numpy.nonzero(unmasked)
+    values = numpy.ma.getdata(pixels)[unmasked]
+    free = numpy.array([param not in fixed for param in FIT_PARAMS])
+    model = _GaussianModel(x, y, fixed)
 
     def residuals(paramlist):
         """Error function to be used in chi-squared fitting
 
         :argument paramlist: fitting parameters
         :type paramlist: numpy.ndarray
-        :argument fixed: parameters to be held frozen
-        :type fixed: dict
 
-        :returns: 2d-array of difference between estimated Gaussian function
-            and the actual pixels
+        :returns: 1d-array of difference between estimated Gaussian function
+            and the actual (unmasked) pixels
         """
-        paramlist = list(paramlist)
-        gaussian_args = []
-        for param in FIT_PARAMS:
-            if param in fixed:
-                gaussian_args.append(fixed[param])
-            else:
-                gaussian_args.append(paramlist.pop(0))
-
-        # gaussian() returns a function which takes arguments x, y and returns
-        # a Gaussian with parameters gaussian_args evaluated at that point.
-        g = gaussian(*gaussian_args)
-
-        # The .compressed() below is essential so the Gaussian fit will not
-        # take account of the masked values (=below threshold) at the edges
-        # and corners of pixels (=(masked) array, so rectangular in shape).
-        pixel_resids = numpy.ma.MaskedArray(
-            data = numpy.fromfunction(g, pixels.shape) - pixels,
-            mask = pixels.mask)
-        return pixel_resids.compressed()
-
-    # maxfev=0, the default, corresponds to 200*(N+1) (NB, not 100*(N+1) as
-    # the scipy docs state!) function evaluations, where N is the number of
-    # parameters in the solution.
+        return model.evaluate(paramlist) - values
+
+    def jacobian(paramlist):
+        """Derivatives of residuals() with respect to each fitting parameter,
+        one row per parameter.
+        """
+        return model.derivatives(paramlist)[free]
+
+    # maxfev=0, the default, corresponds to 100*(N+1) function evaluations
+    # when the Jacobian is supplied, where N is the number of parameters in
+    # the solution.
     # Convergence tolerances xtol and ftol established by experiment on images
     # from Paul Hancock's simulations.
     soln, success = scipy.optimize.leastsq(
-        residuals, initial, maxfev=maxfev, xtol=1e-4, ftol=1e-4
+        residuals, initial, Dfun=jacobian, col_deriv=True,
+        maxfev=maxfev, xtol=1e-4, ftol=1e-4
     )
 
     if success > 4:
@@ -207,7 +214,41 @@ def fitgaussian(pixels, params, fixed=None, maxfev=0):
     for param in FIT_PARAMS:
         if param not in results:
             results[param] = soln.pop(0)
+    return _normalize_axes(results)
+
+
+def fit_peaks(pixels, params):
+    """Fit the peaks of Gaussians of known position and shape
+
+    With everything but the peak fixed, the Gaussian is linear in the peak,
+    so the least squares solution is found directly rather than iteratively.
+
+    Args:
+        pixels (numpy.ma.MaskedArray): Pixel values (with bad pixels
+            masked). Either a single two dimensional array, or a stack of
+            such arrays along the first axis, which are all fitted with the
+            same Gaussian (in pixel coordinates of the array).
+
+        params (dict): xbar, ybar, semimajor, semiminor and theta of the
+            Gaussian
 
+    Returns:
+        float or numpy.ndarray: the peak value, for each array in the stack.
+            This is NaN if there are no unmasked pixels to fit to.
+    """
+    shape = pixels.shape[-2:]
+    template = gaussian(1.0, params['xbar'], params['ybar'],
+                        params['semimajor'], params['semiminor'],
+                        params['theta'])(*numpy.indices(shape))
+    weights = ~numpy.ma.getmaskarray(pixels) * template
+    values = numpy.ma.filled(pixels, 0.)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return ((weights * values).sum(axis=(-2, -1)) /
+                (weights * template).sum(axis=(-2, -1)))
+
+
+def _normalize_axes(results):
+    """Order and sign of the axes of a fitted Gaussian, see fitgaussian()."""
     if results['semiminor'] > results['semimajor']:
         # Swapped axis order is a perfectly valid fit, but inconvenient for
         # the rest of our codebase.
@@ -221,6 +262,70 @@ def fitgaussian(pixels, params, fixed=None, maxfev=0):
 
     return results
 
+
+class _GaussianModel(object):
+    """
+    An elliptical Gaussian (see :func:`tkp.sourcefinder.gaussian.gaussian`)
+    evaluated at a fixed set of pixel coordinates, together with its
+    analytic derivatives with respect to FIT_PARAMS. The fixed parameters
+    are merged into the free ones given to evaluate() and derivatives().
+    """
+    def __init__(self, x, y, fixed):
+        self.x = x
+        self.y = y
+        self.fixed = fixed
+        self._paramlist = None
+
+    def _update(self, paramlist):
+        # leastsq asks for the derivatives at the same point as it has just
+        # evaluated the model; the shared terms are only calculated once.
+        paramlist = numpy.array(paramlist, dtype=numpy.float64, ndmin=1)
+        if (self._paramlist is not None and
+                numpy.array_equal(paramlist, self._paramlist)):
+            return
+        self._paramlist = paramlist
+        paramlist = list(paramlist)
+        args = []
+        for param in FIT_PARAMS:
+            if param in self.fixed:
+                args.append(self.fixed[param])
+            else:
+                args.append(paramlist.pop(0))
+        peak, xbar, ybar, semimajor, semiminor, theta = args
+        cos_theta, sin_theta = numpy.cos(theta), numpy.sin(theta)
+        dx = self.x - xbar
+        dy = self.y - ybar
+        self.params = args
+        self.cos_theta, self.sin_theta = cos_theta, sin_theta
+        # Offsets along the minor (u) and major (v) axes.
+        self.u = cos_theta * dx + sin_theta * dy
+        self.v = cos_theta * dy - sin_theta * dx
+        self.exp = numpy.exp(-math.log(2.0) * (
+            (self.u / semiminor)**2 + (self.v / semimajor)**2))
+        self.model = peak * self.exp
+
+    def evaluate(self, paramlist):
+        self._update(paramlist)
+        return self.model
+
+    def derivatives(self, paramlist):
+        """Returns an array of derivatives, one row per FIT_PARAMS."""
+        self._update(paramlist)
+        peak, xbar, ybar, semimajor, semiminor, theta = self.params
+        u, v, c, s = self.u, self.v, self.cos_theta, self.sin_theta
+        u_term = u / semiminor**2
+        v_term = v / semimajor**2
+        scale = 2 * math.log(2.0) * self.model
+        return numpy.array([
+            self.exp,
+            scale * (c * u_term - s * v_term),
+            scale * (s * u_term + c * v_term),
+            scale * v * v_term / semimajor,
+            scale * u * u_term / semiminor,
+            -scale * u * v * (1.0 / semiminor**2 - 1.0 / semimajor**2),
+        ])
+
+
 def goodness_of_fit(masked_residuals, noise, beam):
     """
     Calculates the goodness-of-fit values, `chisq` and `reduced_chisq`.
@@ -0,0 +1,130 @@
+"""
+On-disk cache of background and RMS grids.
+
+Calculating the background and RMS grids is the most expensive part of
+preparing an image for source extraction, and the pipeline handles each
+image several times over (blind extraction, forced fitting, ...). The grids
+are stored as NumPy ``.npz`` files in a cache directory, named after a hash
+of the pixel data and of all the parameters which determine the grids, so
+that any later pass over the same image can reuse them.
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import tempfile
+import numpy
+
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever the way the grids are calculated changes, so that grids
+# stored by earlier versions are no longer picked up.
+CACHE_VERSION = 1
+
+
+class GridCache(object):
+    """A directory of cached background and RMS grids."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def key(data, mask, beam, margin, radius, back_size_x, back_size_y,
+            **clip_params):
+        """
+        Return a key identifying the grids of an image.
+
+        Args:
+            data (numpy.ndarray): raw pixel data
+            mask (numpy.ndarray): mask applied to the pixel data before
+                calculating the grids
+            beam (tuple): beam shape, which determines the clipping limits
+            margin, radius, back_size_x, back_size_y: as passed to
+                :class:`tkp.sourcefinder.image.ImageData`
+
+        Kwargs:
+            clip_params: any other parameters used for clipping
+
+        Returns:
+            str: hexadecimal hash of all of the above
+        """
+        data = numpy.ascontiguousarray(data)
+        mask = numpy.ascontiguousarray(mask, dtype=numpy.uint8)
+        digest = hashlib.sha1()
+        digest.update(repr((
+            CACHE_VERSION, data.shape, data.dtype.str,
+            tuple(float(b) for b in beam), margin, radius,
+            back_size_x, back_size_y, sorted(clip_params.items())
+        )))
+        digest.update(data.view(numpy.uint8))
+        digest.update(mask)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, "grids-%s.npz" % key)
+
+    def load(self, key):
+        """
+        Return the grids stored under key, or None if there are none.
+
+        Returns:
+            dict: 'rms' and 'bg' grids, as numpy.ma.MaskedArray
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            stored = numpy.load(path)
+            grids = dict(
+                (name, numpy.ma.array(stored[name],
+                                      mask=stored[name + '_mask']))
+                for name in ('rms', 'bg')
+            )
+            stored.close()
+        except (IOError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable grid cache file %s: %s",
+                           path, e)
+            return None
+        logger.debug("Loaded background and RMS grids from %s", path)
+        return grids
+
+    def store(self, key, grids):
+        """
+        Store the grids under key.
+
+        The file is written under a temporary name and then moved into
+        place, so that concurrent readers never see a partial file. Failure
+        to write is logged, but otherwise ignored: the cache is only an
+        optimisation.
+        """
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                logger.warning("Unable to create grid cache directory %s: %s",
+                               self.directory, e)
+                return
+        arrays = {}
+        for name in ('rms', 'bg'):
+            arrays[name] = numpy.ma.getdata(grids[name])
+            arrays[name + '_mask'] = numpy.ma.getmaskarray(grids[name])
+        try:
+            handle, temp_path = tempfile.mkstemp(
+                suffix='.npz', dir=self.directory)
+        except OSError as e:
+            logger.warning("Unable to store grids in %s: %s",
+                           self.directory, e)
+            return
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                numpy.savez(temp_file, **arrays)
+            os.rename(temp_path, self.path(key))
+        except (IOError, OSError) as e:
+            logger.warning("Unable to store grids in %s: %s",
+                           self.directory, e)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        logger.debug("Stored background and RMS grids in %s", self.path(key))
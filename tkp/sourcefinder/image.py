@@ -5,12 +5,15 @@ calculating (specific) variances
 
 import logging
 import itertools
+import multiprocessing
 import numpy
 from tkp.utility import containers
 from tkp.utility.memoize import Memoize
 from tkp.sourcefinder import utils
 from tkp.sourcefinder import stats
 from tkp.sourcefinder import extract
+from tkp.sourcefinder import fitting
+from tkp.sourcefinder.gridcache import GridCache
 try:
     import ndimage
 except ImportError:
@@ -30,7 +33,77 @@ MF_THRESHOLD = 0        # If MEDIAN_FILTER is non-zero, only use the filtered
                         # grid when the (absolute) difference between the raw
                         # and filtered grids is larger than MF_THRESHOLD.
 DEBLEND_MINCONT = 0.005 # Min. fraction of island flux in deblended subisland
+CLIP_MAX_ITER = 100     # Max. number of kappa, sigma clipping iterations
+                        # when calculating the background and RMS grids.
 STRUCTURING_ELEMENT = [[0,1,0], [1,1,1], [0,1,0]] # Island connectiivty
+FIT_BATCHES_PER_WORKER = 4 # Islands are fitted in parallel in (about) this
+                           # many batches per worker, to balance the load.
+
+
+# Process pool used by fit_islands(), kept for the next call.
+_fit_pool = None
+_fit_pool_size = 0
+_warned_daemonic = False
+
+
+def _get_fit_pool(workers):
+    """Return a pool of workers processes, reusing the last one if possible."""
+    global _fit_pool, _fit_pool_size
+    if _fit_pool is None or _fit_pool_size != workers:
+        if _fit_pool is not None:
+            _fit_pool.terminate()
+        _fit_pool = multiprocessing.Pool(workers)
+        _fit_pool_size = workers
+    return _fit_pool
+
+
+def _fit_island_batch(args):
+    """Fit a batch of islands; see fit_islands()."""
+    islands, fixed = args
+    return [island.fit(fixed=fixed) for island in islands]
+
+
+def fit_islands(islands, fixed=None, workers=1):
+    """
+    Fit a list of islands, possibly in parallel.
+
+    Args:
+
+        islands (list): :class:`tkp.sourcefinder.extract.Island` instances
+
+    Kwargs:
+
+        fixed (dict): parameters to hold fixed, see
+            :meth:`tkp.sourcefinder.extract.Island.fit`
+
+        workers (int): number of worker processes. With more than one, the
+            islands are split into batches which are fitted by a pool of
+            workers, which is kept for the next call. Inside a daemonic
+            process, which cannot start processes of its own, the islands
+            are fitted one after another. (Threads would not help: the fits
+            spend most of their time in Python, holding the GIL.)
+
+    Returns:
+
+        list: the results of Island.fit() for each island, in the same order
+        as the islands.
+    """
+    global _warned_daemonic
+    if workers > 1 and multiprocessing.current_process().daemon:
+        if not _warned_daemonic:
+            logger.warn("can't fit islands with %s workers inside a daemonic "
+                        "process, fitting them one by one" % workers)
+            _warned_daemonic = True
+        workers = 1
+    if workers <= 1 or len(islands) < 2:
+        return _fit_island_batch((islands, fixed))
+
+    batch_size = -(-len(islands) // (workers * FIT_BATCHES_PER_WORKER))
+    batches = [(islands[start:start + batch_size], fixed)
+               for start in range(0, len(islands), batch_size)]
+    results = _get_fit_pool(workers).map(_fit_island_batch, batches)
+    return list(itertools.chain.from_iterable(results))
+
 
 class ImageData(object):
     """Encapsulates an image in terms of a numpy array + meta/headerdata.
@@ -40,7 +113,7 @@ class ImageData(object):
     """
 
     def __init__(self, data, beam, wcs, margin=0, radius=0, back_size_x=32,
-                 back_size_y=32, residuals=True
+                 back_size_y=32, residuals=True, grid_cache=None
     ):
         """Sets up an ImageData object.
 
@@ -51,6 +124,12 @@ class ImageData(object):
           - beam (3-tuple): beam shape specification as
             (semimajor, semiminor, theta)
 
+        *Kwargs:*
+          - grid_cache (str): directory in which to cache the background and
+            RMS grids, so that they can be reused by later passes over the
+            same image (see :mod:`tkp.sourcefinder.gridcache`). None
+            disables caching.
+
         """
 
         # Do data, wcs and beam need deepcopy?
@@ -70,6 +149,7 @@ class ImageData(object):
         self.margin = margin
         self.radius = radius
         self.residuals = residuals
+        self.grid_cache = grid_cache
 
 
     ###########################################################################
@@ -89,7 +169,18 @@ class ImageData(object):
     @Memoize
     def _grids(self):
         """Gridded RMS and background data for interpolating"""
-        return self.__grids()
+        if not self.grid_cache:
+            return self.__grids()
+        cache = GridCache(self.grid_cache)
+        key = cache.key(self.rawdata, numpy.ma.getmaskarray(self.data),
+                        self.beam, self.margin, self.radius,
+                        self.back_size_x, self.back_size_y,
+                        max_iter=CLIP_MAX_ITER)
+        grids = cache.load(key)
+        if grids is None:
+            grids = self.__grids()
+            cache.store(key, grids)
+        return grids
     grids = property(fget=_grids, fdel=_grids.delete)
 
     @Memoize
@@ -131,15 +222,15 @@ class ImageData(object):
         # * A margin from the edge of the image;
         # * Any data outside a given radius from the centre of the image;
         # * Data which is "obviously" bad (equal to 0 or NaN).
-        mask = numpy.zeros((self.xdim, self.ydim))
+        mask = numpy.zeros((self.xdim, self.ydim), dtype=bool)
         if self.margin:
-            margin_mask = numpy.ones((self.xdim, self.ydim))
+            margin_mask = numpy.ones((self.xdim, self.ydim), dtype=bool)
             margin_mask[self.margin:-self.margin, self.margin:-self.margin] = 0
             mask = numpy.logical_or(mask, margin_mask)
         if self.radius:
             radius_mask = utils.circular_mask(self.xdim, self.ydim, self.radius)
             mask = numpy.logical_or(mask, radius_mask)
-        mask = numpy.logical_or(mask, numpy.where(self.rawdata == 0, 1, 0))
+        mask = numpy.logical_or(mask, self.rawdata == 0)
         mask = numpy.logical_or(mask, numpy.isnan(self.rawdata))
         return numpy.ma.array(self.rawdata, mask=mask)
     data = property(fget=_get_data, fdel=_get_data.delete)
@@ -151,6 +242,19 @@ class ImageData(object):
     data_bgsubbed = property(fget=_get_data_bgsubbed,
         fdel=_get_data_bgsubbed.delete)
 
+    @property
+    def dtype(self):
+        """Floating point type of the background and RMS maps
+
+        Single precision data (eg, a memory-mapped FITS file) gets single
+        precision maps, so that the source finder doesn't make double
+        precision copies of the whole image. Anything else is handled in
+        double precision.
+        """
+        if self.rawdata.dtype.kind == 'f' and self.rawdata.dtype.itemsize == 4:
+            return numpy.dtype(numpy.float32)
+        return numpy.dtype(numpy.float64)
+
     @property
     def xdim(self):
         """X pixel dimension of (unmasked) data"""
@@ -219,49 +323,53 @@ class ImageData(object):
         useful_data = self.data[useful_chunk[0]]
         my_xdim, my_ydim = useful_data.shape
 
-        rmsgrid, bggrid = [], []
-        for startx in xrange(0, my_xdim, self.back_size_x):
-            rmsrow, bgrow = [], []
-            for starty in xrange(0, my_ydim, self.back_size_y):
-                chunk = useful_data[
-                    startx:startx + self.back_size_x,
-                    starty:starty + self.back_size_y
-                ].ravel()
-                if not chunk.any():
-                    rmsrow.append(False)
-                    bgrow.append(False)
-                    continue
-                chunk, sigma, median, num_clip_its = stats.sigma_clip(
-                    chunk, self.beam)
-                if len(chunk) == 0 or not chunk.any():
-                    rmsrow.append(False)
-                    bgrow.append(False)
-                else:
-                    mean = numpy.mean(chunk)
-                    rmsrow.append(sigma)
-                    # In the case of a crowded field, the distribution will be
-                    # skewed and we take the median as the background level.
-                    # Otherwise, we take 2.5 * median - 1.5 * mean. This is the
-                    # same as SExtractor: see discussion at
-                    # <http://terapix.iap.fr/forum/showthread.php?tid=267>.
-                    # (mean - median) / sigma is a quick n' dirty skewness
-                    # estimator devised by Karl Pearson.
-                    if numpy.fabs(mean - median) / sigma >= 0.3:
-                        logger.debug(
-                            'bg skewed, %f clipping iterations', num_clip_its)
-                        bgrow.append(median)
-                    else:
-                        logger.debug(
-                            'bg not skewed, %f clipping iterations', num_clip_its)
-                        bgrow.append(2.5 * median - 1.5 * mean)
-
-            rmsgrid.append(rmsrow)
-            bggrid.append(bgrow)
-
-        rmsgrid = numpy.ma.array(
-            rmsgrid, mask=numpy.where(numpy.array(rmsgrid) == False, 1, 0))
-        bggrid = numpy.ma.array(
-            bggrid, mask=numpy.where(numpy.array(bggrid) == False, 1, 0))
+        # Rather than clipping the grid cells one at a time, we rearrange the
+        # useful data into a stack of cells, one row per cell, and clip them
+        # all at once. The image is padded with masked pixels to a whole
+        # number of cells, so that the partial cells at the far edges contain
+        # only the pixels they would cover in the image.
+        nx = -(-my_xdim // self.back_size_x)
+        ny = -(-my_ydim // self.back_size_y)
+        padded_data = numpy.zeros(
+            (nx * self.back_size_x, ny * self.back_size_y), dtype=self.dtype)
+        padded_mask = numpy.ones(padded_data.shape, dtype=bool)
+        padded_data[:my_xdim, :my_ydim] = useful_data.filled(fill_value=0)
+        padded_mask[:my_xdim, :my_ydim] = numpy.ma.getmaskarray(useful_data)
+
+        def cell_stack(array):
+            return array.reshape(
+                nx, self.back_size_x, ny, self.back_size_y
+            ).swapaxes(1, 2).reshape(
+                nx * ny, self.back_size_x * self.back_size_y)
+
+        cells = numpy.ma.array(
+            cell_stack(padded_data), mask=cell_stack(padded_mask))
+        chunks, sigma, median, num_clip_its = stats.sigma_clip_stack(
+            cells, self.beam, max_iter=CLIP_MAX_ITER)
+        logger.debug('%d background cells, up to %d clipping iterations',
+                     nx * ny, num_clip_its.max() if nx * ny else 0)
+
+        # Cells with no useful (non-zero) data left after clipping are
+        # masked in the grids.
+        useful = chunks.any(axis=1).filled(fill_value=False)
+        mean = chunks.mean(axis=1, dtype=numpy.float64).filled(fill_value=0)
+
+        # In the case of a crowded field, the distribution will be skewed and
+        # we take the median as the background level. Otherwise, we take
+        # 2.5 * median - 1.5 * mean. This is the same as SExtractor: see
+        # discussion at <http://terapix.iap.fr/forum/showthread.php?tid=267>.
+        # (mean - median) / sigma is a quick n' dirty skewness estimator
+        # devised by Karl Pearson.
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            skewed = numpy.fabs(mean - median) / sigma >= 0.3
+        bg = numpy.where(skewed, median, 2.5 * median - 1.5 * mean)
+
+        rmsgrid = numpy.where(useful, sigma, 0).reshape(nx, ny)
+        bggrid = numpy.where(useful, bg, 0).reshape(nx, ny)
+
+        # Grid values which are exactly zero are treated as missing.
+        rmsgrid = numpy.ma.array(rmsgrid, mask=(rmsgrid == 0))
+        bggrid = numpy.ma.array(bggrid, mask=(bggrid == 0))
 
         return {'rms': rmsgrid, 'bg': bggrid}
 
@@ -310,7 +418,8 @@ class ImageData(object):
         # utterly baffling API...)
         slicex = slice(-0.5, -0.5+xratio, 1j*my_xdim)
         slicey = slice(-0.5, -0.5+yratio, 1j*my_ydim)
-        my_map = numpy.ma.MaskedArray(numpy.zeros(self.data.shape),
+        my_map = numpy.ma.MaskedArray(numpy.zeros(self.data.shape,
+                                                  dtype=self.dtype),
                                       mask = self.data.mask)
         my_map[useful_chunk[0]] = ndimage.map_coordinates(
             grid, numpy.mgrid[slicex, slicey],
@@ -329,7 +438,8 @@ class ImageData(object):
             # fully masked, though.
             my_map = numpy.ma.MaskedArray(
                     data = numpy.where(
-                        my_map >= numpy.min(grid), my_map, numpy.min(grid)),
+                        my_map >= numpy.min(grid), my_map, numpy.min(grid)
+                    ).astype(self.dtype, copy=False),
                     mask = my_map.mask
             )
         return my_map
@@ -344,7 +454,8 @@ class ImageData(object):
     ###########################################################################
 
     def extract(self, det, anl, noisemap=None, bgmap=None, labelled_data=None,
-                labels=None, deblend_nthresh=0, force_beam=False):
+                labels=None, deblend_nthresh=0, force_beam=False,
+                fit_workers=1, batch=False):
 
         """
         Kick off conventional (ie, RMS island finding) source extraction.
@@ -369,8 +480,16 @@ class ImageData(object):
             force_beam (bool): force all extractions to have major/minor axes
                 equal to the restoring beam
 
+            fit_workers (int): number of workers fitting islands in parallel.
+                1 fits them in sequence.
+
+            batch (bool): return the results as a
+                :class:`tkp.sourcefinder.extract.DetectionBatch` rather than
+                as individual detections.
+
         Returns:
-             :class:`tkp.utility.containers.ExtractionResults`
+             :class:`tkp.utility.containers.ExtractionResults`, or
+             :class:`tkp.sourcefinder.extract.DetectionBatch` if batch is set
         """
 
         if anl > det:
@@ -398,7 +517,8 @@ class ImageData(object):
 
         return self._pyse(
             det * self.rmsmap, anl * self.rmsmap, deblend_nthresh, force_beam,
-            labelled_data=labelled_data, labels=labels
+            labelled_data=labelled_data, labels=labels, fit_workers=fit_workers,
+            batch=batch
         )
 
     def reverse_se(self, det):
@@ -422,7 +542,8 @@ class ImageData(object):
         return results
 
     def fd_extract(self, alpha, anl=None, noisemap=None,
-                   bgmap=None, deblend_nthresh=0, force_beam=False
+                   bgmap=None, deblend_nthresh=0, force_beam=False,
+                   fit_workers=1
     ):
         """False Detection Rate based source extraction.
         The FDR procedure guarantees that <FDR> < alpha.
@@ -483,7 +604,7 @@ class ImageData(object):
         if not anl:
             anl = fdr_threshold
         return self._pyse(fdr_threshold * self.rmsmap, anl * self.rmsmap,
-                          deblend_nthresh, force_beam)
+                          deblend_nthresh, force_beam, fit_workers=fit_workers)
 
     def flux_at_pixel(self, x, y, numpix=1):
         """Return the background-subtracted flux at a certain position
@@ -514,6 +635,22 @@ class ImageData(object):
 
         Returns an instance of :class:`tkp.sourcefinder.extract.Detection`.
         """
+        region = self._fit_region(x, y, boxsize, threshold, fixed)
+        if region is None:
+            return None
+        chunk, fitme, fixed = region
+        return self._measure_region(x, y, boxsize, threshold, chunk, fitme,
+                                    fixed)
+
+    def _fit_region(self, x, y, boxsize, threshold, fixed):
+        """
+        Select the pixels to fit around a point, see :meth:`fit_to_point`.
+
+        Returns:
+            tuple: the slices of the image which are fitted, the (masked)
+                pixels to fit and the dict of parameters to hold fixed; or
+                None if there is nothing to fit.
+        """
         if ((
                 # Recent NumPy
                 hasattr(numpy.ma.core, "MaskedConstant") and
@@ -570,6 +707,15 @@ class ImageData(object):
         else:
             raise TypeError("Unkown fixed parameter")
 
+        return chunk, fitme, fixed
+
+    def _measure_region(self, x, y, boxsize, threshold, chunk, fitme, fixed):
+        """
+        Fit and measure the pixels selected by :meth:`_fit_region`.
+
+        Returns an instance of :class:`tkp.sourcefinder.extract.Detection`,
+        or None if the fit fails.
+        """
         if threshold is not None:
             threshold_at_pixel = threshold * self.rmsmap[x, y]
         else:
@@ -597,17 +743,45 @@ class ImageData(object):
 
         measurement['xbar'] += x-boxsize/2.0
         measurement['ybar'] += y-boxsize/2.0
-        measurement.sig = (fitme / self.rmsmap[chunk]).max()
+        measurement.sig = float((fitme / self.rmsmap[chunk]).max())
 
         return extract.Detection(measurement, self)
 
+    @staticmethod
+    def _fit_peaks(regions):
+        """
+        Solve for the peaks of regions selected by :meth:`_fit_region` with
+        only the peak left free, all at once.
+
+        With position and shape fixed (in box coordinates), all boxes of the
+        same size share the same Gaussian, so they are stacked and fitted
+        together by :func:`tkp.sourcefinder.fitting.fit_peaks`. The peaks
+        found are added to the fixed parameters of each region.
+
+        Args:
+            regions (list): (chunk, fitme, fixed) tuples
+        """
+        by_shape = {}
+        for chunk, fitme, fixed in regions:
+            by_shape.setdefault(fitme.shape, []).append((fitme, fixed))
+        for group in by_shape.values():
+            stack = numpy.ma.array(
+                [numpy.ma.getdata(fitme) for fitme, fixed in group],
+                mask=[numpy.ma.getmaskarray(fitme) for fitme, fixed in group])
+            peaks = fitting.fit_peaks(stack, group[0][1])
+            for (fitme, fixed), peak in zip(group, peaks):
+                if numpy.isfinite(peak):
+                    fixed['peak'] = float(peak)
+
     def fit_fixed_positions(self, positions, boxsize, threshold=None,
                             fixed='position+shape',
                             ids=None):
         """
         Convenience function to fit a list of sources at the given positions
 
-        This function wraps around fit_to_point().
+        This function wraps around fit_to_point(). If only the peak is fitted
+        (fixed='position+shape', the default), the peaks at all positions are
+        solved for in one go.
 
         Args:
             positions (list): list of (RA, Dec) tuples. Positions to be fit,
@@ -635,39 +809,53 @@ class ImageData(object):
         if ids is not None:
             assert len(ids)==len(positions)
 
+        # Select the pixels to fit at every position before fitting any of
+        # them, so that the peaks can be fitted together.
+        requested_fits = []
+        pixel_positions, invalid = self.wcs.s2p_array(
+            [(posn[0], posn[1]) for posn in positions])
+        for idx, posn in enumerate(positions):
+            if invalid[idx]:
+                logger.warning("Input coordinates (%.2f, %.2f) invalid: ",
+                                posn[0], posn[1])
+                continue
+            x, y = pixel_positions[idx]
+            try:
+                region = self._fit_region(x, y, boxsize, threshold, fixed)
+            except IndexError as e:
+                logger.warning("Input pixel coordinates (%.2f, %.2f) "
+                                "could not be fit because: " + e.message,
+                                posn[0], posn[1])
+                continue
+            if region is not None:
+                requested_fits.append((idx, posn, x, y, region))
+
+        if fixed == 'position+shape':
+            self._fit_peaks([region for idx, posn, x, y, region
+                             in requested_fits])
+
         successful_fits = []
         successful_ids = []
-        for idx, posn in enumerate(positions):
+        for idx, posn, x, y, region in requested_fits:
             try:
-                x, y, = self.wcs.s2p((posn[0], posn[1]))
-            except RuntimeError, e:
-                if (str(e).startswith("wcsp2s error: 8:") or
-                    str(e).startswith("wcsp2s error: 9:")):
-                    logger.warning("Input coordinates (%.2f, %.2f) invalid: ",
-                                    posn[0], posn[1])
-                else:
-                    raise
+                fit_results = self._measure_region(x, y, boxsize, threshold,
+                                                   *region)
+            except IndexError as e:
+                logger.warning("Input pixel coordinates (%.2f, %.2f) "
+                                "could not be fit because: " + e.message,
+                                posn[0], posn[1])
+                continue
+            if not fit_results:
+                # We were unable to get a good fit
+                continue
+            if ( fit_results.ra.error == float('inf') or
+                  fit_results.dec.error == float('inf')):
+                logging.warning("position errors extend outside image")
             else:
-                try:
-                    fit_results = self.fit_to_point(x, y,
-                                                boxsize=boxsize,
-                                                threshold=threshold,
-                                                fixed=fixed)
-                    if not fit_results:
-                        # We were unable to get a good fit
-                        continue
-                    if ( fit_results.ra.error == float('inf') or
-                          fit_results.dec.error == float('inf')):
-                        logging.warning("position errors extend outside image")
-                    else:
-                        successful_fits.append(fit_results)
-                        if ids:
-                            successful_ids.append(ids[idx])
-
-                except IndexError as e:
-                    logger.warning("Input pixel coordinates (%.2f, %.2f) "
-                                    "could not be fit because: " + e.message,
-                                    posn[0], posn[1])
+                successful_fits.append(fit_results)
+                if ids:
+                    successful_ids.append(ids[idx])
+
         if ids:
             return successful_fits, successful_ids
         return successful_fits
@@ -756,7 +944,8 @@ class ImageData(object):
 
     def _pyse(
         self, detectionthresholdmap, analysisthresholdmap,
-        deblend_nthresh, force_beam, labelled_data=None, labels=[]
+        deblend_nthresh, force_beam, labelled_data=None, labels=[],
+        fit_workers=1, batch=False
     ):
         """
         Run Python-based source extraction on this image.
@@ -780,6 +969,11 @@ class ImageData(object):
             labels (list): list of labels in the island map to use for
             fitting.
 
+            fit_workers (int): number of workers fitting the islands in
+            parallel, see :func:`fit_islands`.
+
+            batch (bool): return a :class:`..extract.DetectionBatch`.
+
         Returns:
 
             (..utility.containers.ExtractionResults):
@@ -843,17 +1037,19 @@ class ImageData(object):
             #deblended_list = [x.deblend() for x in island_list]
             island_list = list(utils.flatten(deblended_list))
 
-        # Iterate over the list of islands and measure the source in each,
-        # appending it to the results list.
+        # Measure the source in each of the islands, then iterate over the
+        # list of islands, appending each measurement to the results list.
+        if force_beam:
+            fixed = {'semimajor': self.beam[0],
+                     'semiminor': self.beam[1],
+                     'theta': self.beam[2]}
+        else:
+            fixed = None
+        all_fit_results = fit_islands(island_list, fixed, fit_workers)
+        if batch:
+            return self._batch_results(island_list, all_fit_results)
         results = containers.ExtractionResults()
-        for island in island_list:
-            if force_beam:
-                fixed = {'semimajor': self.beam[0],
-                         'semiminor': self.beam[1],
-                         'theta': self.beam[2]}
-            else:
-                fixed = None
-            fit_results = island.fit(fixed=fixed)
+        for island, fit_results in zip(island_list, all_fit_results):
             if fit_results:
                 measurement, residual = fit_results
             else:
@@ -907,3 +1103,31 @@ class ImageData(object):
             return True
         # Filter will return a list; ensure we return an ExtractionResults.
         return containers.ExtractionResults(filter(is_usable, results))
+
+    def _batch_results(self, island_list, all_fit_results):
+        """
+        Collect the measurements of the islands in a
+        :class:`..extract.DetectionBatch`, dropping those which are unusable
+        as :meth:`_pyse` does.
+        """
+        fitted = [(island, fit_results) for island, fit_results
+                  in zip(island_list, all_fit_results) if fit_results]
+        results = extract.DetectionBatch.from_measurements(
+            [measurement for island, (measurement, residual) in fitted], self)
+        if self.residuals:
+            for island, (measurement, residual) in fitted:
+                self.residuals_from_deblending[island.chunk] -= (
+                    island.data.filled(fill_value=0.))
+                self.residuals_from_gauss_fitting[island.chunk] += residual
+
+        bad_fits = (numpy.isinf(results['ra_err']) |
+                    numpy.isinf(results['dec_err']))
+        for x, y in zip(results['x'][bad_fits], results['y'][bad_fits]):
+            logger.warn('Bad fit from blind extraction at pixel coords:'
+                          '%f %f - measurement discarded'
+                          '(increase fitting margin?)', x, y)
+        results = results[~bad_fits]
+        usable = results.usable()
+        for x, y in zip(results['x'][~usable], results['y'][~usable]):
+            logger.debug("Unphysical source at pixel %f, %f" % (x, y))
+        return results[usable]
@@ -55,6 +55,170 @@ def unbiased_sigma(N_indep):
     return 1.4142135623730951 * erfcinv(0.5 / N_indep)
 
 
+def _unbiased_std(variance, N, N_indep, corr_clip):
+    """Standard deviation corrected for correlated noise and clipping.
+
+    Works equally on scalars and on arrays of per-cell values.
+    """
+    # distf=numpy.var is a sample variance with the factor N/(N-1)
+    # already built in, N being the number of pixels. So, we are
+    # going to remove that and replace it by N_indep/(N_indep-1)
+    clipped_var = variance * (N - 1.) * N_indep / (N * (N_indep - 1.))
+    unbiased_var = corr_clip * clipped_var
+
+    # There is an extra factor c4 needed to get a unbiased standard
+    # deviation, unbiased if we disregard clipping bias, see
+    # http://en.wikipedia.org/wiki/Unbiased_estimation_of_standard_deviation\
+    #         #Results_for_the_normal_distribution
+    c4 = 1. - 0.25 / N_indep - 0.21875 / N_indep**2
+    return numpy.sqrt(unbiased_var) / c4
+
+
+def _bisect(values, rows, lo, hi, condition, bound, side):
+    """First column in [lo, hi) of each row where condition holds.
+
+    condition must be monotonic along the (sorted) rows of values: once it
+    holds for a given column, it holds for all the following ones. Returns
+    hi for rows where it never holds. bound and side describe the equivalent
+    numpy.searchsorted() query, which is used when there is only one row.
+    """
+    if len(rows) == 1:
+        row = values[rows[0], lo[0]:hi[0]]
+        first = numpy.searchsorted(row, bound[0], side)
+        # Comparing with the bound may differ from the condition itself by
+        # rounding; step across any values where the two disagree.
+        while first > 0 and condition(row[first - 1])[0]:
+            first -= 1
+        while first < len(row) and not condition(row[first])[0]:
+            first += 1
+        return lo + first
+    lo, hi = lo.copy(), hi.copy()
+    last = values.shape[1] - 1
+    for step in xrange(int(numpy.log2(values.shape[1] + 1)) + 1):
+        searching = lo < hi
+        mid = (lo + hi) // 2
+        found = condition(values[rows, numpy.minimum(mid, last)])
+        hi = numpy.where(searching & found, mid, hi)
+        lo = numpy.where(searching & ~found, mid + 1, lo)
+    return lo
+
+
+def _outward_sums(values, origin):
+    """Partial sums along each row, accumulated outwards from origin.
+
+    Returns an array with one column more than values, where column j holds
+    the sum of values[origin:j] for j >= origin, and minus the sum of
+    values[j:origin] for j < origin. The sum of values[lo:hi] is then the
+    difference between columns hi and lo.
+    """
+    ncells, npix = values.shape
+    right = numpy.arange(npix) >= origin[:, numpy.newaxis]
+    sums = numpy.zeros((ncells, npix + 1))
+    numpy.cumsum(numpy.where(right, values, 0), axis=1, out=sums[:, 1:])
+    left = numpy.where(right, 0, values)[:, ::-1].cumsum(axis=1)[:, ::-1]
+    sums[:, :npix] -= left
+    return sums
+
+
+def _clip_sorted(values, count, beam, sigma, max_iter, my_iterations,
+                 corr_clip):
+    """Iterative clipping about the median of pre-sorted cells.
+
+    Each row of values is a cell, sorted in ascending order, of which the
+    first count values are valid data. Since clipping symmetrically about
+    the median only ever removes the tails of the distribution, the pixels
+    which survive are always a contiguous range [lo, hi) of the sorted
+    values. The median is a lookup in that range, the clipping limits are
+    found by bisection, and the variance is updated from running sums, so
+    that nothing is copied and each iteration only costs O(log N) per cell.
+
+    Returns:
+        tuple: lo, hi, unbiased standard deviation, median and number of
+            clipping iterations of each cell.
+    """
+    ncells, npix = values.shape
+    rows = numpy.arange(ncells)
+    lo = numpy.zeros(ncells, dtype=numpy.intp)
+    hi = numpy.asarray(count, dtype=numpy.intp).copy()
+    unbiased_std = numpy.zeros(ncells)
+    centre = numpy.zeros(ncells)
+    iterations = numpy.zeros(ncells, dtype=int) + my_iterations
+    corr_clip = numpy.zeros(ncells) + corr_clip
+    active = hi > 0
+    if not npix:
+        return lo, hi, unbiased_std, centre, iterations
+
+    # Running sums of the values and their squares, relative to the initial
+    # median of each cell. They are accumulated outwards from the median, so
+    # that the sum over the current range is a difference of two partial
+    # sums which do not include any of the clipped tails; otherwise, bright
+    # outliers would swamp the precision of the variance.
+    first = numpy.where(active, (hi - 1) // 2, 0)
+    shift = 0.5 * (values[rows, first] + values[rows, hi // 2])
+    shift = numpy.where(active, shift, 0)
+    valid = numpy.arange(npix) < hi[:, numpy.newaxis]
+    relative = numpy.where(valid, values - shift[:, numpy.newaxis], 0)
+    del valid
+    sum1 = _outward_sums(relative, first)
+    relative *= relative
+    sum2 = _outward_sums(relative, first)
+    del relative
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        while True:
+            active &= iterations < max_iter
+            if not active.any():
+                break
+            idx = rows[active]
+            cell_lo, cell_hi = lo[idx], hi[idx]
+            N = cell_hi - cell_lo
+            N_indep = indep_pixels(N, beam)
+
+            my_centre = 0.5 * (values[idx, cell_lo + (N - 1) // 2] +
+                               values[idx, cell_lo + N // 2])
+            mean = (sum1[idx, cell_hi] - sum1[idx, cell_lo]) / N
+            variance = numpy.maximum(
+                (sum2[idx, cell_hi] - sum2[idx, cell_lo]) / N - mean**2, 0)
+
+            # If sigma is callable, use it to dynamically calculate the
+            # clipping limits.
+            if callable(sigma):
+                my_sigma = sigma(N_indep) * numpy.ones(len(idx))
+            else:
+                my_sigma = sigma * numpy.ones(len(idx))
+
+            my_std = _unbiased_std(variance, N, N_indep, corr_clip[idx])
+            limit = my_sigma * my_std
+
+            # Keep abs(value - centre) <= limit, evaluated exactly as such.
+            new_lo = _bisect(values, idx, cell_lo, cell_hi,
+                lambda v: v - my_centre >= -limit,
+                my_centre - limit, 'left')
+            new_hi = _bisect(values, idx, new_lo, cell_hi,
+                lambda v: v - my_centre > limit,
+                my_centre + limit, 'right')
+            new_N = new_hi - new_lo
+
+            # Cells too small for processing are emptied and retired.
+            too_small = N_indep < 1
+            new_lo[too_small] = cell_lo[too_small]
+            new_hi[too_small] = cell_lo[too_small]
+            my_std[too_small] = 0
+            my_centre[too_small] = 0
+
+            lo[idx], hi[idx] = new_lo, new_hi
+            unbiased_std[idx] = my_std
+            centre[idx] = my_centre
+            iterations[idx[too_small]] = 0
+
+            clipped = (new_N != N) & (new_N > 0) & ~too_small
+            corr_clip[idx[clipped]] = var_helper(my_sigma[clipped])
+            iterations[idx[clipped]] += 1
+            active[idx[~clipped]] = False
+
+    return lo, hi, unbiased_std, centre, iterations
+
+
 def sigma_clip(data, beam, sigma=unbiased_sigma, max_iter=100,
                centref=numpy.median, distf=numpy.var, my_iterations=0,
                corr_clip=1.):
@@ -66,62 +230,129 @@ def sigma_clip(data, beam, sigma=unbiased_sigma, max_iter=100,
 
     max_iter sets the maximum number of iterations used.
 
-    my_iterations is a counter for recursive operation of the code; leave it
-    alone unless you really want to pretend to jump into the middle of a loop.
+    my_iterations and corr_clip set the initial state of the iteration; leave
+    them alone unless you really want to pretend to jump into the middle of
+    a loop.
 
-    sigma is subtle: if a callable is given, it is passed a copy of the data
-    array and can calculate a clipping limit. See, for e.g., unbiased_sigma()
-    defined above. However, if it isn't callable, sigma is assumed to just set
-    a hard limit.
+    sigma is subtle: if a callable is given, it is passed the number of
+    independent pixels and can calculate a clipping limit. See, for e.g.,
+    unbiased_sigma() defined above. However, if it isn't callable, sigma is
+    assumed to just set a hard limit.
 
-    To do: Improve documentation
-            -Returns???
-            -How does it make use of the beam? (It estimates the noise correlation)
+    The beam is used to estimate the number of independent pixels, ie the
+    noise correlation.
+
+    With the default centref and distf, the data is sorted once and clipping
+    proceeds without further copies (see _clip_sorted()). A two dimensional
+    array is treated as a stack of independent cells: see sigma_clip_stack().
+
+    Returns:
+        tuple: clipped data, unbiased standard deviation, centre and number
+            of clipping iterations. If the data is too small for processing,
+            the clipped data is empty and the other values are zero.
     """
-    if my_iterations >= max_iter:
-        # Exceeded maximum number of iterations; return
-        return data, my_iterations
+    if centref is numpy.median and distf is numpy.var:
+        if numpy.ndim(data) == 2:
+            return sigma_clip_stack(data, beam, sigma, max_iter,
+                                    my_iterations, corr_clip)
+        # Numpy 1.1 breaks std() for MaskedArray: see
+        # <http://www.scipy.org/scipy/numpy/wiki/MaskedArray>.
+        # MaskedArray.compressed() returns a 1-D array of non-masked data.
+        if isinstance(data, MaskedArray):
+            data = data.compressed()
+        values = numpy.sort(numpy.ravel(data))[numpy.newaxis, :]
+        lo, hi, unbiased_std, centre, iterations = _clip_sorted(
+            values, [values.size], beam, sigma, max_iter, my_iterations,
+            corr_clip)
+        return (values[0, lo[0]:hi[0]], unbiased_std[0], centre[0],
+                iterations[0])
 
-    # Numpy 1.1 breaks std() for MaskedArray: see
-    # <http://www.scipy.org/scipy/numpy/wiki/MaskedArray>.
-    # MaskedArray.compressed() returns a 1-D array of non-masked data.
+    # Arbitrary centre and distribution functions need the remaining data
+    # as an array of its own; we keep a mask over the original data and only
+    # extract the remaining values on each iteration.
     if isinstance(data, MaskedArray):
         data = data.compressed()
-    centre = centref(data)
-    N = numpy.size(data)
-    N_indep = indep_pixels(N, beam)
-    if N_indep < 1:
-        # This chunk is too small for processing; return an empty array.
-        return numpy.array([]), 0, 0, 0
-
-    # If sigma is callable, use it to dynamically calculate the clipping
-    # limits.
-    if callable(sigma):
-        my_sigma = sigma(N_indep)
-    else:
-        my_sigma = sigma
-
-    # distf=numpy.var is a sample variance with the factor N/(N-1)
-    # already built in, N being the number of pixels. So, we are
-    # going to remove that and replace it by N_indep/(N_indep-1)
-    clipped_var = distf(data) * (N - 1.) * N_indep / (N * (N_indep - 1.))
-    unbiased_var = corr_clip * clipped_var
-
-    # There is an extra factor c4 needed to get a unbiased standard
-    # deviation, unbiased if we disregard clipping bias, see
-    # http://en.wikipedia.org/wiki/Unbiased_estimation_of_standard_deviation\
-    #         #Results_for_the_normal_distribution
-    c4 = 1. - 0.25 / N_indep - 0.21875 / N_indep**2
-    unbiased_std = numpy.sqrt(unbiased_var) / c4
+    data = numpy.ravel(data)
+    keep = numpy.ones(data.shape, dtype=bool)
+    clipped, unbiased_std, centre = data, 0, 0
+    while my_iterations < max_iter:
+        centre = centref(clipped)
+        N = numpy.size(clipped)
+        N_indep = indep_pixels(N, beam)
+        if N_indep < 1:
+            # This chunk is too small for processing; return an empty array.
+            return numpy.array([]), 0, 0, 0
 
-    limit = my_sigma * unbiased_std
+        # If sigma is callable, use it to dynamically calculate the clipping
+        # limits.
+        if callable(sigma):
+            my_sigma = sigma(N_indep)
+        else:
+            my_sigma = sigma
 
-    newdata = data.compress(abs(data - centre) <= limit)
+        unbiased_std = _unbiased_std(distf(clipped), N, N_indep, corr_clip)
+        limit = my_sigma * unbiased_std
 
-    if len(newdata) != len(data) and len(newdata) > 0:
+        keep &= abs(data - centre) <= limit
+        new_N = numpy.count_nonzero(keep)
+        if new_N == N or new_N == 0:
+            return data[keep], unbiased_std, centre, my_iterations
+        clipped = data[keep]
         corr_clip = var_helper(my_sigma)
         my_iterations += 1
-        return sigma_clip(newdata, beam, sigma, max_iter, centref, distf,
-                          my_iterations, corr_clip)
-    else:
-        return newdata, unbiased_std, centre, my_iterations
+    # Exceeded maximum number of iterations
+    return clipped, unbiased_std, centre, my_iterations
+
+
+def sigma_clip_stack(data, beam, sigma=unbiased_sigma, max_iter=100,
+                     my_iterations=0, corr_clip=1.):
+    """Iterative clipping of a stack of independent cells in one pass.
+
+    This performs the same clipping as sigma_clip() with its default
+    centref and distf (the median and the variance), but does so
+    simultaneously for every row of a two dimensional array. It is used to
+    calculate the background and RMS grids of an image without looping over
+    the grid cells in Python.
+
+    Args:
+
+        data (numpy.ma.MaskedArray): two dimensional array of shape
+            (number of cells, pixels per cell). Masked pixels do not take
+            part in the clipping; cells may therefore contain different
+            numbers of pixels.
+
+        beam (3-tuple): beam shape, used to estimate the number of
+            independent pixels in each cell.
+
+    Kwargs:
+
+        sigma: clipping limit; see sigma_clip().
+
+        max_iter (int): maximum number of iterations per cell.
+
+        my_iterations, corr_clip: initial state; see sigma_clip().
+
+    Returns:
+
+        tuple: clipped data (numpy.ma.MaskedArray of the same shape as data,
+            with each row sorted and the clipped pixels masked), the unbiased
+            standard deviation, the median and the number of clipping
+            iterations of each cell. Cells which are too small to be
+            processed are returned fully masked, with zero deviation and
+            median.
+    """
+    data = numpy.ma.asarray(data)
+    mask = numpy.ma.getmaskarray(data)
+
+    # Sort each cell once, with the masked pixels at the end.
+    values = numpy.sort(numpy.where(mask, numpy.inf, data.data), axis=1)
+    lo, hi, unbiased_std, centre, iterations = _clip_sorted(
+        values, (~mask).sum(axis=1), beam, sigma, max_iter, my_iterations,
+        corr_clip)
+
+    columns = numpy.arange(values.shape[1])
+    retained = ((columns >= lo[:, numpy.newaxis]) &
+                (columns < hi[:, numpy.newaxis]))
+    clipped_data = numpy.ma.array(
+        numpy.where(retained, values, 0), mask=~retained)
+    return clipped_data, unbiased_std, centre, iterations
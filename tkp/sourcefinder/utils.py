@@ -39,27 +39,25 @@ def get_error_radius(wcs, x_value, x_error, y_value, y_error):
     to the major/minor axes of the elliptical fit, but this should do for
     now.
     """
+    # We check all possible combinations in case we have a nonlinear WCS.
+    positions, invalid = wcs.p2s_array([
+        (x_value, y_value),
+        (x_value + x_error, y_value + y_error),
+        (x_value - x_error, y_value + y_error),
+        (x_value + x_error, y_value - y_error),
+        (x_value - x_error, y_value - y_error)
+    ])
+    if invalid.any():
+        # The conversion fails if the errors place the limits outside of the
+        # image, in which case we set the angular uncertainty to infinity.
+        return float('inf')
+    centre_ra, centre_dec = positions[0]
     error_radius = 0
-    try:
-        centre_ra, centre_dec = wcs.p2s([x_value, y_value])
-        # We check all possible combinations in case we have a nonlinear
-        # WCS.
-        for pixpos in [
-            (x_value + x_error, y_value + y_error),
-            (x_value - x_error, y_value + y_error),
-            (x_value + x_error, y_value - y_error),
-            (x_value - x_error, y_value - y_error)
-        ]:
-            error_ra, error_dec = wcs.p2s(pixpos)
-            error_radius = max(
-                error_radius,
-                coordinates.angsep(centre_ra, centre_dec, error_ra, error_dec)
-            )
-    except RuntimeError:
-        # We get a runtime error from wcs.p2s if the errors place the
-        # limits outside of the image, in which case we set the angular
-        # uncertainty to infinity.
-        error_radius = float('inf')
+    for error_ra, error_dec in positions[1:]:
+        error_radius = max(
+            error_radius,
+            coordinates.angsep(centre_ra, centre_dec, error_ra, error_dec)
+        )
     return error_radius
 
 
@@ -1,7 +1,5 @@
 import logging
-import tkp.accessors
-from tkp.accessors import sourcefinder_image_from_accessor
-import tkp.accessors
+from tkp.steps.session import get_session, close_session
 from tkp.db import general as dbgen
 from tkp.db import monitoringlist as dbmon
 from tkp.db import nulldetections as dbnd
@@ -26,7 +24,14 @@ def get_forced_fit_requests(image, expiration):
     return all_fit_positions, all_fit_ids
 
 
-def insert_and_associate_forced_fits(image_id,successful_fits,successful_ids):
+def insert_and_associate_forced_fits(image_id,successful_fits,successful_ids,
+                                     transaction=False):
+    """
+    Insert the forced fits of an image and associate them, see
+    :func:`tkp.db.nulldetections.associate_nd` and
+    :func:`tkp.db.monitoringlist.associate_ms`. With transaction=True each
+    association runs in a single transaction.
+    """
     assert len(successful_ids) == len(successful_fits)
 
     nd_extractions=[]
@@ -50,7 +55,7 @@ def insert_and_associate_forced_fits(image_id,successful_fits,successful_ids):
         dbgen.insert_extracted_sources(image_id, nd_extractions,
                                        extract_type='ff_nd',
                                        ff_runcat_ids=nd_runcats)
-        dbnd.associate_nd(image_id)
+        dbnd.associate_nd(image_id, transaction=transaction)
     else:
         logger.info("No successful nulldetection fits")
 
@@ -59,23 +64,27 @@ def insert_and_associate_forced_fits(image_id,successful_fits,successful_ids):
                                        extract_type='ff_ms',
                                        ff_monitor_ids=ms_ids)
         logger.info("adding monitoring sources")
-        dbmon.associate_ms(image_id)
+        dbmon.associate_ms(image_id, transaction=transaction)
     else:
         logger.info("No successful monitor fits")
 
 
 
 def perform_forced_fits(fit_posns, fit_ids,
-                        image_path, extraction_params):
+                        image_path, extraction_params, keep_session=False):
     """
     Perform forced source measurements on an image based on a list of
     positions.
 
+    This is the last step which uses the image, so its session is closed
+    afterwards, also if there is nothing to fit.
+
     Args:
         fit_posns (list): List of (RA, Dec) tuples: Positions to be fit.
         fit_ids: List of identifiers for each requested fit position.
         image_path (str): path to image for measurements.
         extraction_params (dict): source extraction parameters, as a dictionary.
+        keep_session (bool): keep the image session open afterwards.
 
     Returns:
         tuple: A matched pair of lists (serialized_fits, ids), corresponding to
@@ -83,20 +92,20 @@ def perform_forced_fits(fit_posns, fit_ids,
         NB returned lists may be shorter than input lists
         if some fits are unsuccessful.
     """
-    logger.info("Forced fitting in image: %s" % (image_path))
-    fitsimage = tkp.accessors.open(image_path)
-
-    data_image = sourcefinder_image_from_accessor(fitsimage,
-                    margin=extraction_params['margin'],
-                    radius=extraction_params['extraction_radius_pix'],
-                    back_size_x=extraction_params['back_size_x'],
-                    back_size_y=extraction_params['back_size_y'])
+    if not fit_posns:
+        if not keep_session:
+            close_session(image_path)
+        return [], []
 
+    logger.info("Forced fitting in image: %s" % (image_path))
+    data_image = get_session(image_path).sourcefinder_image(extraction_params)
 
     boxsize = extraction_params['box_in_beampix'] * max(data_image.beam[0],
                                              data_image.beam[1])
     successful_fits, successful_ids = data_image.fit_fixed_positions(
                                                 fit_posns, boxsize, ids=fit_ids)
+    if not keep_session:
+        close_session(image_path)
     if successful_fits:
         serialized =[
             f.serialize(
@@ -5,20 +5,49 @@ to the database and image cache (mongodb).
 import os
 import logging
 import warnings
+from multiprocessing.pool import ThreadPool
 from tempfile import NamedTemporaryFile
 
 from casacore.images import image as casacore_image
 
-import tkp.accessors
 from tkp.db.database import Database
 from tkp.db.orm import DataSet, Image
-from tkp.quality.statistics import rms_with_clipped_subregion
+from tkp.steps.quality import reject_check
+from tkp.steps.session import get_session
 
 
 logger = logging.getLogger(__name__)
 
-def image_to_mongodb(filename, hostname, port, db):
-    """Copy a file into mongodb"""
+# Maximum number of images copied to MongoDB at the same time by a node.
+COPY_THREADS = 4
+
+
+def image_to_fits(filename):
+    """
+    Convert an image, in FITS or CASA format, to a temporary FITS file. The
+    file is removed when it is closed.
+
+    This uses casacore, which is not known to be thread-safe, so it should
+    only be called from the thread which opens the images.
+    """
+    temp_fits_file = NamedTemporaryFile()
+    try:
+        i = casacore_image(filename)
+        i.tofits(temp_fits_file.name)
+    except:
+        temp_fits_file.close()
+        raise
+    return temp_fits_file
+
+
+def image_to_mongodb(filename, hostname, port, db, fits_file=None):
+    """
+    Copy a file into mongodb
+
+    Args:
+        fits_file: the image converted to FITS by image_to_fits(). If not
+            given, the image is converted here.
+    """
 
     try:
         import pymongo
@@ -36,14 +65,10 @@ def image_to_mongodb(filename, hostname, port, db):
             logger.debug("File already in database")
 
         else:
-            # This conversion should work whether the input file
-            # is in FITS or CASA format.
-            # temp_fits_file is removed automatically when closed.
-            temp_fits_file = NamedTemporaryFile()
-            i = casacore_image(filename)
-            i.tofits(temp_fits_file.name)
+            if fits_file is None:
+                temp_fits_file = fits_file = image_to_fits(filename)
             new_file = gfs.new_file(filename=filename)
-            with open(temp_fits_file.name, "r") as f:
+            with open(fits_file.name, "r") as f:
                 new_file.write(f)
             new_file.close()
             logger.info("Saved local copy of %s on %s"\
@@ -82,7 +107,8 @@ def create_dataset(dataset_id, description):
     return dataset.id
 
 
-def extract_metadatas(images, rms_est_sigma, rms_est_fraction):
+def extract_metadatas(images, rms_est_sigma, rms_est_fraction,
+                      job_config=None):
     """
     Extracts metadata and rms_qc values from the list of images.
 
@@ -90,6 +116,9 @@ def extract_metadatas(images, rms_est_sigma, rms_est_fraction):
         images: list of image urls
         rms_est_sigma: used for RMS calculation, see `tkp.quality.statistics`
         rms_est_fraction: used for RMS calculation, see `tkp.quality.statistics`
+        job_config: if given, the images are also quality checked while they
+            are open, see :func:`tkp.steps.quality.reject_check`. The result
+            is stored in the metadata under 'rejected'.
 
     Returns:
         a list of metadata's. The metadata will be False if extraction failed.
@@ -98,14 +127,15 @@ def extract_metadatas(images, rms_est_sigma, rms_est_fraction):
     for image in images:
         logger.info("Extracting metadata from %s" % image)
         try:
-            accessor = tkp.accessors.open(image)
+            session = get_session(image)
         except TypeError as e:
             logging.error("Can't open image %s: %s" % (image, e))
             results.append(False)
         else:
-            metadata = accessor.extract_metadata()
-            metadata['rms_qc'] = rms_with_clipped_subregion(accessor.data,
-                                                rms_est_sigma,rms_est_fraction)
+            metadata = session.accessor.extract_metadata()
+            metadata['rms_qc'] = session.rms_qc(rms_est_sigma, rms_est_fraction)
+            if job_config is not None:
+                metadata['rejected'] = reject_check(image, job_config)
             results.append(metadata)
     return results
 
@@ -143,21 +173,53 @@ def store_images(images_metadata, extraction_radius_pix, dataset_id):
     return image_ids
 
 
-def node_steps(images, image_cache_config, rms_est_sigma, rms_est_fraction):
+def node_steps(images, image_cache_config, rms_est_sigma, rms_est_fraction,
+               job_config=None):
     """
     this function executes all persistence steps that should be executed on a node.
+    Given the job_config, the images are quality checked too, see
+    extract_metadatas().
     Note: Should only be used in a node recipe
     """
     mongohost = image_cache_config['mongo_host']
     mongoport = image_cache_config['mongo_port']
     mongodb = image_cache_config['mongo_db']
-    copy_images = image_cache_config['copy_images']
+    copy_images = image_cache_config['copy_images'] and images
 
+    def upload(image, fits_file):
+        try:
+            return image_to_mongodb(image, mongohost, mongoport, mongodb,
+                                    fits_file)
+        finally:
+            fits_file.close()
+
+    # Each image is converted to FITS here, in the same thread which
+    # extracts the metadata, since casacore may not be used from several
+    # threads at once. The uploads only wait for the network, so they are
+    # done in threads meanwhile.
     if copy_images:
-        for image in images:
-            image_to_mongodb(image, mongohost, mongoport, mongodb)
+        pool = ThreadPool(min(COPY_THREADS, len(images)))
+        copies = []
     else:
         logger.info("Not copying images to mongodb")
 
-    metadatas = extract_metadatas(images, rms_est_sigma, rms_est_fraction)
+    metadatas = []
+    for image in images:
+        if copy_images:
+            try:
+                fits_file = image_to_fits(image)
+            except Exception, e:
+                msg = "Failed to save image to MongoDB: %s" % (str(e),)
+                logger.error(msg)
+                warnings.warn(msg)
+            else:
+                copies.append(pool.apply_async(upload, (image, fits_file)))
+        metadatas.extend(extract_metadatas([image], rms_est_sigma,
+                                           rms_est_fraction, job_config))
+
+    if copy_images:
+        pool.close()
+        for copy in copies:
+            copy.get()
+        pool.join()
     return metadatas
@@ -6,7 +6,7 @@ import logging
 from tkp.telescope.lofar.quality import reject_check_lofar
 from tkp.telescope.generic.quality import reject_check_generic
 from tkp.accessors.lofaraccessor import LofarAccessor
-import tkp.accessors
+from tkp.steps.session import get_session
 import tkp.db.quality
 import tkp.quality.brightsource
 import tkp.quality
@@ -30,7 +30,8 @@ def reject_check(image_path, job_config):
         (rejection ID, description) if rejected, else None
     """
 
-    accessor = tkp.accessors.open(image_path)
+    session = get_session(image_path)
+    accessor = session.accessor
 
     rejected = reject_check_generic(accessor)
     if rejected:
@@ -38,7 +39,9 @@ def reject_check(image_path, job_config):
 
     # Only run LOFAR-specific QC checks on LOFAR images.
     if isinstance(accessor, LofarAccessor):
-        rejected = reject_check_lofar(accessor, job_config)
+        rms_qc = session.rms_qc(job_config.persistence.rms_est_sigma,
+                                job_config.persistence.rms_est_fraction)
+        rejected = reject_check_lofar(accessor, job_config, rms_qc=rms_qc)
         if rejected:
             return rejected
     else:
@@ -0,0 +1,148 @@
+"""
+Image sessions, shared between the per-image pipeline steps.
+
+Each image passes through persistence, quality checking, source extraction
+and forced fitting. Rather than have every step re-open the image (and hence
+re-read all the pixels from disk), the steps ask for an
+:class:`ImageSession`, which holds on to the accessor and everything derived
+from it: the RMS used for quality control and the source finder image, with
+its background and RMS maps.
+
+Sessions are kept in a per-process cache, so that consecutive steps running
+in the same process (or worker) share them. The cache is bounded, since a
+session holds all the pixel data of an image. In a pipeline run, every image
+is read twice: the persistence task also does the quality checks, and the
+forced fits are sent to the worker which extracted the sources, see
+:mod:`tkp.main`. Between these, all images are stored in the database, so
+the sessions of the persistence step are normally gone by the time the
+sources are extracted.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import tkp.accessors
+from tkp.accessors import sourcefinder_image_from_accessor
+from tkp.accessors.detection import isfits
+from tkp.quality.statistics import rms_with_clipped_subregion
+
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of sessions kept open in each process, see set_cache_size().
+CACHE_SIZE = 2
+
+# Memory-map FITS images rather than reading them, see
+# :class:`tkp.accessors.fitsimage.FitsImage`.
+MEMMAP_FITS = False
+
+_sessions = OrderedDict()
+_lock = threading.RLock()
+
+
+class ImageSession(object):
+    """
+    An image which has been opened for processing.
+
+    Args:
+        url (str): location of the image
+    Kwargs:
+        accessor (DataAccessor): an accessor which has already been opened
+            for url. If not given, the image is opened here.
+    """
+    def __init__(self, url, accessor=None):
+        self.url = url
+        if accessor is None:
+            if MEMMAP_FITS and isfits(url):
+                accessor = tkp.accessors.open(url, memmap=True)
+            else:
+                accessor = tkp.accessors.open(url)
+        self.accessor = accessor
+        self._rms_qc = {}
+        self._sourcefinder_images = {}
+
+    def rms_qc(self, rms_est_sigma, rms_est_fraction):
+        """
+        RMS for quality control, see
+        :func:`tkp.quality.statistics.rms_with_clipped_subregion`.
+        """
+        key = (rms_est_sigma, rms_est_fraction)
+        if key not in self._rms_qc:
+            self._rms_qc[key] = rms_with_clipped_subregion(
+                self.accessor.data, rms_est_sigma, rms_est_fraction)
+        return self._rms_qc[key]
+
+    def sourcefinder_image(self, extraction_params):
+        """
+        Source finder image, set up according to the [source_extraction]
+        parameters. Blind extraction and forced fitting with the same
+        parameters share the image, and so its background and RMS maps.
+
+        Returns:
+            (:class:`tkp.sourcefinder.image.ImageData`)
+        """
+        args = dict(
+            margin=extraction_params['margin'],
+            radius=extraction_params['extraction_radius_pix'],
+            back_size_x=extraction_params['back_size_x'],
+            back_size_y=extraction_params['back_size_y'],
+            grid_cache=extraction_params.get('grid_cache_dir') or None,
+        )
+        key = tuple(sorted(args.items()))
+        if key not in self._sourcefinder_images:
+            self._sourcefinder_images[key] = sourcefinder_image_from_accessor(
+                self.accessor, **args)
+        return self._sourcefinder_images[key]
+
+
+def set_memmap_fits(memmap_fits):
+    """
+    Set whether FITS images are memory-mapped. This should be called before
+    any worker processes are started, so that they pick it up.
+    """
+    global MEMMAP_FITS
+    MEMMAP_FITS = bool(memmap_fits)
+
+
+def set_cache_size(cache_size):
+    """
+    Set the number of sessions kept open in each process. Like
+    set_memmap_fits(), this should be called before any worker processes are
+    started.
+    """
+    global CACHE_SIZE
+    CACHE_SIZE = max(1, int(cache_size))
+    with _lock:
+        while len(_sessions) > CACHE_SIZE:
+            _sessions.popitem(last=False)
+
+
+def get_session(url):
+    """
+    Return the session for the image at url, opening the image if there is
+    no session for it in this process yet.
+    """
+    with _lock:
+        if url in _sessions:
+            session = _sessions.pop(url)
+        else:
+            logger.debug("opening image session for %s" % url)
+            session = ImageSession(url)
+            while _sessions and len(_sessions) >= CACHE_SIZE:
+                _sessions.popitem(last=False)
+        _sessions[url] = session
+        return session
+
+
+def close_session(url):
+    """Forget the session for the image at url, if there is one."""
+    with _lock:
+        _sessions.pop(url, None)
+
+
+def clear_sessions():
+    """Forget all sessions in this process."""
+    with _lock:
+        _sessions.clear()
+
@@ -1,7 +1,5 @@
 import logging
-import tkp.accessors
-from tkp.accessors import sourcefinder_image_from_accessor
-import tkp.accessors
+from tkp.steps.session import get_session, close_session
 from collections import namedtuple
 
 logger = logging.getLogger(__name__)
@@ -13,7 +11,7 @@ ExtractionResults = namedtuple('ExtractionResults',
                                     'rms_max'])
 
 
-def extract_sources(image_path, extraction_params):
+def extract_sources(image_path, extraction_params, keep_session=False):
     """
     Extract sources from an image.
 
@@ -22,19 +20,18 @@ def extract_sources(image_path, extraction_params):
         extraction_params: dictionary containing at least the detection and
             analysis threshold and the association radius, the last one a
             multiplication factor of the de Ruiter radius.
+        keep_session: keep the image session open afterwards. Only useful
+            if forced fitting is done in the same process.
     returns:
-        list of ExtractionResults named tuples containing source measurements,
+        list of ExtractionResults named tuples containing source measurements
+        (see :meth:`tkp.sourcefinder.extract.DetectionBatch.serialize`),
         min RMS value and max RMS value
     """
     logger.info("Extracting image: %s" % image_path)
-    accessor = tkp.accessors.open(image_path)
+    session = get_session(image_path)
     logger.debug("Detecting sources in image %s at detection threshold %s",
                  image_path, extraction_params['detection_threshold'])
-    data_image = sourcefinder_image_from_accessor(accessor,
-                    margin=extraction_params['margin'],
-                    radius=extraction_params['extraction_radius_pix'],
-                    back_size_x=extraction_params['back_size_x'],
-                    back_size_y=extraction_params['back_size_y'])
+    data_image = session.sourcefinder_image(extraction_params)
 
     logger.debug("Employing margin: %s extraction radius: %s deblend_nthresh: %s",
                  extraction_params['margin'],
@@ -47,17 +44,23 @@ def extract_sources(image_path, extraction_params):
         det=extraction_params['detection_threshold'],
         anl=extraction_params['analysis_threshold'],
         deblend_nthresh=extraction_params['deblend_nthresh'],
-        force_beam=extraction_params['force_beam']
+        force_beam=extraction_params['force_beam'],
+        fit_workers=extraction_params.get('fit_workers', 1),
+        batch=True
     )
     logger.info("Detected %d sources in image %s" % (len(results), image_path))
 
-    ew_sys_err = extraction_params['ew_sys_err']
-    ns_sys_err = extraction_params['ns_sys_err']
-    serialized = [r.serialize(ew_sys_err, ns_sys_err) for r in results]
-    return ExtractionResults(sources=serialized,
-                             rms_min=float(data_image.rmsmap.min()),
-                             rms_max=float(data_image.rmsmap.max())
-                             )
+    # The serialized sources are a single structured array, which is cheap
+    # to pass back to the master process.
+    serialized = results.serialize(extraction_params['ew_sys_err'],
+                                   extraction_params['ns_sys_err'])
+    extraction_results = ExtractionResults(
+        sources=serialized,
+        rms_min=float(data_image.rmsmap.min()),
+        rms_max=float(data_image.rmsmap.max()))
+    if not keep_session:
+        close_session(image_path)
+    return extraction_results
 
 
 
@@ -10,7 +10,19 @@ from tkp.utility import nice_format
 logger = logging.getLogger(__name__)
 
 
-def reject_check_lofar(accessor, job_config):
+def reject_check_lofar(accessor, job_config, rms_qc=None):
+    """
+    LOFAR specific quality checks.
+
+    Args:
+        accessor: the image, as a LofarAccessor
+        job_config: the job configuration
+    Kwargs:
+        rms_qc: RMS for quality control, if already calculated. Otherwise it
+            is calculated here from the image data.
+    Returns:
+        (rejection ID, description) if rejected, else None
+    """
 
     lofar_quality_params = job_config['quality_lofar']
 
@@ -24,11 +36,12 @@ def reject_check_lofar(accessor, job_config):
         logger.info("image %s REJECTED: tau_time is 0, should be > 0" % accessor.url)
         return tkp.db.quality.reason['tau_time'], "tau_time is 0"
 
-    rms_est_sigma = job_config.persistence.rms_est_sigma
-    rms_est_fraction = job_config.persistence.rms_est_fraction
-    rms_qc = rms_with_clipped_subregion(accessor.data,
-                                        rms_est_sigma=rms_est_sigma,
-                                        rms_est_fraction=rms_est_fraction)
+    if rms_qc is None:
+        rms_est_sigma = job_config.persistence.rms_est_sigma
+        rms_est_fraction = job_config.persistence.rms_est_fraction
+        rms_qc = rms_with_clipped_subregion(accessor.data,
+                                            rms_est_sigma=rms_est_sigma,
+                                            rms_est_fraction=rms_est_fraction)
 
     noise = noise_level(accessor.freq_eff, accessor.freq_bw, accessor.tau_time,
         accessor.antenna_set, accessor.ncore, accessor.nremote, accessor.nintl
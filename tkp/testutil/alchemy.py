@@ -42,7 +42,8 @@ def gen_runningcatalog(xtrsrc, dataset):
                                        zone=1, wm_ra=1., wm_decl=1, wm_uncertainty_ew=1,
                                        wm_uncertainty_ns=1, avg_ra_err=1, avg_decl_err=1,
                                        avg_wra=1, avg_wdecl=1, avg_weight_ra=1, avg_weight_decl=1,
-                                       x=1, y=1, z=1)
+                                       x=1, y=1, z=1,
+                                       first_taustart_ts=xtrsrc.image.taustart_ts)
 
 
 def gen_assocskyrgn(runcat, skyrgn):
@@ -56,6 +57,17 @@ def gen_assocxtrsource(runningcatalog, xtrsrc):
                                        eta_int=0, f_datapoints=0)
 
 
+def gen_lightcurve_summary(runningcatalog, band, xtrsrc, datapoints):
+    return tkp.db.model.LightcurveSummary(runcat=runningcatalog, band=band,
+                                          datapoints=datapoints,
+                                          last_xtrsrc=xtrsrc,
+                                          last_taustart_ts=xtrsrc.image.taustart_ts,
+                                          last_f_int=xtrsrc.f_int, last_v_int=0,
+                                          last_eta_int=0, max_f_int=xtrsrc.f_int,
+                                          avg_f_int=xtrsrc.f_int, m2_f_int=0,
+                                          median_f_int=xtrsrc.f_int)
+
+
 def gen_newsource(runcat, xtrsrc, image):
     return tkp.db.model.Newsource(runcat=runcat, trigger_xtrsrc=xtrsrc,
                                   newsource_type=1, previous_limits_image=image)
@@ -89,7 +101,9 @@ def gen_lightcurve(band, dataset, skyregion, datapoints=10):
         assocs.append(gen_assocxtrsource(runningcatalog, xtrsrc))
 
     newsource = gen_newsource(runningcatalog, xtrsrcs[5], images[4])
+    summary = gen_lightcurve_summary(runningcatalog, band, xtrsrcs[-1],
+                                     datapoints)
 
     # just return all db objects we created
-    return [dataset, band, skyregion, runningcatalog, assocskyrgn, newsource] + \
-           images + xtrsrcs + assocs
\ No newline at end of file
+    return [dataset, band, skyregion, runningcatalog, assocskyrgn, newsource,
+            summary] + images + xtrsrcs + assocs
\ No newline at end of file
@@ -40,6 +40,10 @@ def delete_test_database(database):
         #cursor = database.connection.cursor()
         query = "DELETE from runningcatalog_flux"
         tkp.db.execute(query, commit=True)
+        query = "DELETE from lightcurve_summary"
+        tkp.db.execute(query, commit=True)
+        query = "DELETE from transient_candidate"
+        tkp.db.execute(query, commit=True)
         query = "DELETE from assocxtrsource"
         tkp.db.execute(query, commit=True)
         query = "DELETE from assocskyrgn"
@@ -65,6 +69,31 @@ def delete_test_database(database):
         raise
 
 
+def delete_dataset(dataset_id, *band_ids):
+    """
+    Delete a dataset, the given bands and everything in the dataset, for
+    tests which commit their data.
+    """
+    runcats = "(SELECT id FROM runningcatalog WHERE dataset = %(dataset)s)"
+    queries = [
+        "DELETE FROM lightcurve_summary WHERE runcat IN " + runcats,
+        "DELETE FROM assocxtrsource WHERE runcat IN " + runcats,
+        "DELETE FROM assocskyrgn WHERE runcat IN " + runcats,
+        "DELETE FROM runningcatalog_flux WHERE runcat IN " + runcats,
+        "DELETE FROM runningcatalog WHERE dataset = %(dataset)s",
+        "DELETE FROM extractedsource WHERE image IN "
+        "(SELECT id FROM image WHERE dataset = %(dataset)s)",
+        "DELETE FROM image WHERE dataset = %(dataset)s",
+        "DELETE FROM skyregion WHERE dataset = %(dataset)s",
+        "DELETE FROM dataset WHERE id = %(dataset)s",
+    ]
+    for query in queries:
+        tkp.db.execute(query, {'dataset': dataset_id}, commit=True)
+    for band_id in band_ids:
+        tkp.db.execute("DELETE FROM frequencyband WHERE id = %(band)s",
+                       {'band': band_id}, commit=True)
+
+
 def example_dbimage_data_dict(**kwargs):
     """
     Defines the canonical default image-data for unit-testing the database.
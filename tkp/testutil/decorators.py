@@ -54,6 +54,16 @@ def requires_test_db_managed():
     return unittest.skip("DB management tests disabled, TKP_TESTDBMANAGEMENT"
                          " not set")
 
+def requires_benchmarks():
+    """
+    Used to disable the long running benchmarks. You can enable these by
+    setting the TKP_BENCHMARK environment variable.
+    """
+    if os.environ.get("TKP_BENCHMARK", False):
+        return lambda func: func
+    return unittest.skip("Long benchmarks disabled, TKP_BENCHMARK not set")
+
+
 def high_ram_requirements():
     """
     Used to disable tests that break Travis due to out-of-memory issues.
@@ -6,6 +6,7 @@ General purpose astronomical coordinate handling routines.
 
 import sys
 import math
+import numpy
 import pywcs
 import logging
 import datetime
@@ -409,6 +410,24 @@ def alpha_inflate(theta, decl):
     else:
         return math.degrees(abs(math.atan(math.sin(math.radians(theta)) / math.sqrt(abs(math.cos(math.radians(decl - theta)) * math.cos(math.radians(decl + theta)))))))
 
+
+def alpha_inflate_array(theta, decl):
+    """Array version of :func:`alpha_inflate`.
+
+    Keyword arguments:
+    theta, decl are arrays (or scalars) in decimal degrees.
+
+    Return value:
+    alpha -- array of RA inflations in decimal degrees
+    """
+    theta, decl = numpy.asarray(theta, dtype=float), numpy.asarray(decl, dtype=float)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        alpha = numpy.degrees(numpy.abs(numpy.arctan(
+            numpy.sin(numpy.radians(theta)) /
+            numpy.sqrt(numpy.abs(numpy.cos(numpy.radians(decl - theta)) *
+                                 numpy.cos(numpy.radians(decl + theta)))))))
+    return numpy.where(numpy.abs(decl) + theta > 89.9, 180.0, alpha)
+
 # Find the RA of a point in a radio image, given l,m and field centre
 def delta(l, m, delta0):
     """Convert a coordinate in l, m into an coordinate in Dec
@@ -561,6 +580,16 @@ def eq_to_cart(ra, dec):
             math.cos(math.radians(dec)) * math.sin(math.radians(ra)), # Cartesian y
             math.sin(math.radians(dec))) # Cartesian z
 
+def eq_to_cart_array(ra, dec):
+    """Array version of :func:`eq_to_cart`.
+
+        ra, dec should be arrays in degrees; returns arrays x, y, z.
+    """
+    ra, dec = numpy.radians(ra), numpy.radians(dec)
+    return (numpy.cos(dec) * numpy.cos(ra),
+            numpy.cos(dec) * numpy.sin(ra),
+            numpy.sin(dec))
+
 class CoordSystem(object):
     """A container for constant strings representing different coordinate
     systems."""
@@ -621,6 +650,9 @@ class WCS(object):
 
       * A fix for the reference pixel lying at the zenith;
       * Raises ValueError if coordinates are invalid.
+
+    Positions are converted one at a time by p2s() and s2p(), or in bulk by
+    p2s_array() and s2p_array().
     """
     # ORIGIN is the upper-left corner of the image. pywcs supports both 0
     # (NumPy, C-style) or 1 (FITS, Fortran-style). The TraP uses 1.
@@ -683,3 +715,51 @@ class WCS(object):
         if math.isnan(x) or math.isnan(y):
             raise RuntimeError("Pixel position is not a number")
         return x, y
+
+    def p2s_array(self, pixpos):
+        """
+        Pixel to Spatial coordinate conversion of many positions at once.
+
+        Args:
+            pixpos (numpy.ndarray): N x 2 array of [x, y] pixel positions
+
+        Returns:
+            tuple: N x 2 array of [ra, dec] positions, and a boolean array
+                of length N which is True where the conversion is invalid.
+                Invalid positions are NaN.
+        """
+        return self._convert_array(self.wcs.wcs_pix2sky, pixpos)
+
+    def s2p_array(self, spatialpos):
+        """
+        Spatial to Pixel coordinate conversion of many positions at once.
+
+        Args:
+            spatialpos (numpy.ndarray): N x 2 array of [ra, dec] positions
+
+        Returns:
+            tuple: N x 2 array of [x, y] pixel positions, and a boolean array
+                of length N which is True where the conversion is invalid.
+                Invalid positions are NaN.
+        """
+        return self._convert_array(self.wcs.wcs_sky2pix, spatialpos)
+
+    def _convert_array(self, convert, positions):
+        positions = numpy.asarray(positions, dtype=float).reshape(-1, 2)
+        result = numpy.empty(positions.shape)
+        if len(positions):
+            try:
+                result[:, 0], result[:, 1] = convert(
+                    positions[:, 0], positions[:, 1], self.ORIGIN)
+            except RuntimeError:
+                # wcslib may reject the whole lot because of a single invalid
+                # position: fall back to converting them one by one.
+                for i, position in enumerate(positions):
+                    try:
+                        [result[i, 0]], [result[i, 1]] = convert(
+                            position[:1], position[1:], self.ORIGIN)
+                    except RuntimeError:
+                        result[i] = numpy.nan
+        invalid = numpy.isnan(result).any(axis=1)
+        result[invalid] = numpy.nan
+        return result, invalid